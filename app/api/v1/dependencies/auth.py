@@ -1,12 +1,16 @@
 # app/api/v1/dependencies/auth.py
+import hashlib
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError 
 from uuid import UUID
 from pydantic import BaseModel
-from typing import Optional, List # Asegúrate de que List esté importado
+from typing import Any, Dict, Optional, List, Tuple
 
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.jwks import SUPPORTED_ASYMMETRIC_ALGORITHMS, jwks_key_cache
 from app.db.supabase_client import get_supabase_client, SupabaseClient 
 from postgrest.exceptions import APIError
 
@@ -17,6 +21,133 @@ class TokenData(BaseModel):
     organization_id: Optional[UUID] = None
     role: Optional[str] = None
 
+# --- Caché de membresías ---
+# Evita consultar organization_members en cada request autenticado. Los errores de DB no se cachean;
+# "sin membresía" sí (como (None, None)). Esta API no modifica organization_members (se gestiona fuera,
+# desde Supabase), así que no hay invalidación: un cambio de membresía o de rol tarda como máximo
+# MEMBERSHIP_CACHE_TTL_SECONDS en verse, por worker.
+_membership_cache = TTLCache(
+    max_size=settings.MEMBERSHIP_CACHE_MAX_SIZE,
+    ttl_seconds=settings.MEMBERSHIP_CACHE_TTL_SECONDS,
+)
+
+async def _fetch_membership(
+    supabase: SupabaseClient,
+    user_uuid: UUID
+) -> Tuple[Optional[UUID], Optional[str]]:
+    """Obtiene (organization_id, role) de la primera membresía del usuario, o (None, None) si no tiene."""
+    membership_response = await (
+        supabase.table("organization_members")
+        .select("organization_id, role")
+        .eq("user_id", str(user_uuid))
+        .order("joined_at", desc=False) 
+        .limit(1) # Asegura que solo procesamos una si múltiples existen
+        .execute()
+    )
+
+    # .execute() para un select devuelve .data como una lista.
+    # Si no hay coincidencias, .data será una lista vacía []. El status code debería ser 200 OK.
+    if hasattr(membership_response, 'data') and isinstance(membership_response.data, list) and len(membership_response.data) > 0:
+        first_membership = membership_response.data[0]
+        organization_id = UUID(first_membership["organization_id"])
+        role = first_membership["role"]
+        print(f"AUTH_LOGIC_INFO: Membresía encontrada para {user_uuid}: org_id={organization_id}, role={role}")
+        return organization_id, role
+
+    status_code = getattr(membership_response, 'status_code', "N/A") # Para loguear si es inesperado
+    print(f"AUTH_LOGIC_INFO: No se encontró membresía en organization_members para {user_uuid} (data vacía/None tras .execute()). Status: {status_code}")
+    return None, None
+
+# --- Caché de tokens ya verificados ---
+# El frontend reenvía el mismo access token muchas veces por minuto. Guardamos el resultado de la
+# verificación indexado por el SHA-256 del token; cada entrada vive como máximo hasta el 'exp' del token.
+_verified_token_cache = TTLCache(
+    max_size=settings.JWT_CACHE_MAX_SIZE,
+    ttl_seconds=settings.JWT_CACHE_MAX_TTL_SECONDS,
+)
+_token_decode_stats = {"count": 0, "seconds": 0.0} # Coste real de las verificaciones completas (misses)
+
+def _token_cache_key(jwt_token: str) -> bytes:
+    return hashlib.sha256(jwt_token.encode("utf-8")).digest()
+
+def _org_claims_from_payload(payload: Dict[str, Any]) -> Tuple[Optional[UUID], Optional[str]]:
+    """
+    Lee organization_id/rol de los custom claims que añade el access-token hook de Supabase.
+    El claim del rol NO es 'role': Supabase ya usa 'role' para el rol de Postgres ('authenticated').
+    Si el claim de organización falta o es inválido devolvemos (None, None) y se consultará la DB.
+    """
+    org_id_claim = payload.get(settings.JWT_ORGANIZATION_ID_CLAIM)
+    if not org_id_claim:
+        return None, None
+    try:
+        organization_id = UUID(str(org_id_claim))
+    except ValueError:
+        print(f"AUTH_LOGIC_ERROR: Claim '{settings.JWT_ORGANIZATION_ID_CLAIM}' inválido en el token: {org_id_claim!r}. Se usará organization_members.")
+        return None, None
+    role_claim = payload.get(settings.JWT_ORGANIZATION_ROLE_CLAIM)
+    return organization_id, (str(role_claim) if role_claim is not None else None)
+
+def _resolve_verification_key(jwt_token: str) -> Tuple[Any, str]:
+    """
+    Elige la clave según el 'alg' de la cabecera: HS256 -> SUPABASE_JWT_SECRET;
+    RS256/ES256 -> JWK del 'kid' en la caché JWKS (sin red; un kid desconocido dispara un refresco en segundo plano).
+    """
+    header = jwt.get_unverified_header(jwt_token)
+    algorithm = header.get("alg")
+    if algorithm == "HS256":
+        return settings.SUPABASE_JWT_SECRET, algorithm
+    if algorithm in SUPPORTED_ASYMMETRIC_ALGORITHMS:
+        jwk = jwks_key_cache.get_key(header.get("kid"))
+        if jwk is None:
+            raise JWTError(f"kid '{header.get('kid')}' desconocido en el JWKS (se refrescará en segundo plano).")
+        if jwk.get("alg") and jwk["alg"] != algorithm:
+            raise JWTError(f"El 'alg' del token ({algorithm}) no coincide con el de la clave ({jwk['alg']}).")
+        return jwk, algorithm
+    raise JWTError(f"Algoritmo de firma no soportado: {algorithm}")
+
+def _verify_token(jwt_token: str, token_cache_key: bytes) -> TokenData:
+    """
+    Verifica firma, audiencia y 'sub' del token y cachea el resultado (incluidos los claims de organización).
+    Lanza JWTError/ValueError si no es válido.
+    """
+    decode_start = time.perf_counter()
+    verification_key, algorithm = _resolve_verification_key(jwt_token)
+    payload = jwt.decode(
+        jwt_token, 
+        verification_key,
+        algorithms=[algorithm], 
+        audience="authenticated"
+    )
+    user_id_str: Optional[str] = payload.get("sub")
+    if user_id_str is None:
+        raise JWTError("'sub' (user_id) no encontrado en el payload del token.")
+    user_uuid = UUID(user_id_str)
+    claim_organization_id, claim_role = _org_claims_from_payload(payload)
+    token_data = TokenData(user_id=user_uuid, organization_id=claim_organization_id, role=claim_role)
+    _token_decode_stats["count"] += 1
+    _token_decode_stats["seconds"] += time.perf_counter() - decode_start
+
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)): # Sin 'exp' no cacheamos: no sabríamos cuándo deja de ser válido
+        ttl_seconds = min(settings.JWT_CACHE_MAX_TTL_SECONDS, exp - time.time())
+        _verified_token_cache.set(token_cache_key, token_data, ttl_seconds=ttl_seconds)
+    return token_data
+
+def get_auth_cache_stats() -> Dict[str, Any]:
+    """
+    Contadores de las cachés del path de autenticación.
+    `estimated_cpu_saved_ms` = hits de la caché de tokens * coste medio de una verificación completa.
+    """
+    token_stats = _verified_token_cache.stats()
+    decode_count = _token_decode_stats["count"]
+    avg_decode_ms = (_token_decode_stats["seconds"] / decode_count * 1000) if decode_count else 0.0
+    token_stats["avg_decode_ms"] = avg_decode_ms
+    token_stats["estimated_cpu_saved_ms"] = token_stats["hits"] * avg_decode_ms
+    return {
+        "verified_tokens": token_stats,
+        "memberships": _membership_cache.stats(),
+    }
+
 async def get_current_user(
     token: HTTPAuthorizationCredentials = Depends(oauth2_scheme),
     supabase: SupabaseClient = Depends(get_supabase_client)
@@ -33,67 +164,43 @@ async def get_current_user(
         raise credentials_exception
     
     jwt_token = token.credentials
-    user_uuid: Optional[UUID] = None
+    token_cache_key = _token_cache_key(jwt_token)
+    # Un token ya verificado (firma, audiencia, 'sub') y aún no expirado se sirve desde la caché.
+    token_data: Optional[TokenData] = _verified_token_cache.get(token_cache_key, None)
 
-    try:
-        secret_to_use = settings.SUPABASE_JWT_SECRET
-        payload = jwt.decode(
-            jwt_token, 
-            secret_to_use,
-            algorithms=["HS256"], 
-            audience="authenticated"
-        )
-        user_id_str: Optional[str] = payload.get("sub")
-        if user_id_str is None:
-            print("AUTH_ERROR: 'sub' (user_id) no encontrado en el payload del token.")
+    if token_data is None:
+        try:
+            token_data = _verify_token(jwt_token, token_cache_key)
+        except jwt.ExpiredSignatureError as exp_e:
+            print(f"AUTH_ERROR: ¡EL TOKEN HA CADUCADO! Error: {type(exp_e).__name__} - {exp_e}")
+            raise credentials_exception
+        except JWTError as e:
+            print(f"AUTH_ERROR: JWTError (no expiración) durante decodificación: {type(e).__name__} - {e}")
+            raise credentials_exception
+        except ValueError as ve:
+            print(f"AUTH_ERROR: ValueError (conversión de user_id a UUID inválido): {ve}")
+            raise credentials_exception
+        except Exception as e:
+            print(f"AUTH_ERROR: Excepción inesperada durante decodificación de token: {type(e).__name__} - {e}")
             raise credentials_exception
-        user_uuid = UUID(user_id_str)
-    except jwt.ExpiredSignatureError as exp_e:
-        print(f"AUTH_ERROR: ¡EL TOKEN HA CADUCADO! Error: {type(exp_e).__name__} - {exp_e}")
-        raise credentials_exception
-    except JWTError as e:
-        print(f"AUTH_ERROR: JWTError (no expiración) durante decodificación: {type(e).__name__} - {e}")
-        raise credentials_exception
-    except ValueError as ve:
-        print(f"AUTH_ERROR: ValueError (conversión de user_id a UUID inválido): {ve}")
-        raise credentials_exception
-    except Exception as e:
-        print(f"AUTH_ERROR: Excepción inesperada durante decodificación de token: {type(e).__name__} - {e}")
-        raise credentials_exception
 
-    if user_uuid is None:
-        print("AUTH_CRITICAL_ERROR: user_uuid es None después de decodificación.")
+    if token_data is None:
+        print("AUTH_CRITICAL_ERROR: token_data es None después de decodificación.")
         raise credentials_exception
 
+    # Si el access-token hook ya firmó organization_id (y rol) en el token, no hace falta ir a la DB.
+    if token_data.organization_id is not None:
+        return token_data.model_copy()
+
+    user_uuid = token_data.user_id
+
     user_organization_id: Optional[UUID] = None
     user_role: Optional[str] = None
 
-    # print(f"AUTH_LOGIC: Iniciando consulta de membresía para user_uuid='{str(user_uuid)}' (sin .maybe_single)") # Log de inicio de esta sección
     try:
-        membership_response = (
-            supabase.table("organization_members")
-            .select("organization_id, role")
-            .eq("user_id", str(user_uuid))
-            .order("joined_at", desc=False) 
-            .limit(1) # Asegura que solo procesamos una si múltiples existen
-            .execute() # Usar execute() directamente
+        user_organization_id, user_role = await _membership_cache.get_or_load(
+            user_uuid, lambda: _fetch_membership(supabase, user_uuid)
         )
-        
-        # status_code = getattr(membership_response, 'status_code', "N/A")
-        # print(f"AUTH_LOGIC: Respuesta de consulta de membresía - Status: {status_code}, Data: {getattr(membership_response, 'data', 'N/A')}")
-
-        # .execute() para un select devuelve .data como una lista.
-        # Si no hay coincidencias, .data será una lista vacía []. El status code debería ser 200 OK.
-        if hasattr(membership_response, 'data') and isinstance(membership_response.data, list) and len(membership_response.data) > 0:
-            first_membership = membership_response.data[0]
-            user_organization_id = UUID(first_membership["organization_id"])
-            user_role = first_membership["role"]
-            print(f"AUTH_LOGIC_INFO: Membresía encontrada para {user_uuid}: org_id={user_organization_id}, role={user_role}")
-        else:
-            status_code = getattr(membership_response, 'status_code', "N/A") # Para loguear si es inesperado
-            print(f"AUTH_LOGIC_INFO: No se encontró membresía en organization_members para {user_uuid} (data vacía/None tras .execute()). Status: {status_code}")
-            # user_organization_id y user_role permanecerán None, que es correcto.
-
     except APIError as api_exc: # Para errores de PostgREST (ej. tabla no existe, error de sintaxis, permisos si no fuera service_role)
         error_code = getattr(api_exc, 'code', '')
         error_message = getattr(api_exc, 'message', str(api_exc))
@@ -1,5 +1,5 @@
 # app/api/v1/routers/ai_router.py
-from fastapi import APIRouter, Depends, HTTPException, status, Body, Path 
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Body, Path 
 from pydantic import BaseModel # No parece usarse directamente aquí, pero es común en modelos
 from typing import List, Dict, Any, Optional
 from uuid import UUID
@@ -7,6 +7,7 @@ import logging # Usas logger, así que lo mantengo
 
 from app.db.supabase_client import get_supabase_client, SupabaseClient
 from app.api.v1.dependencies.auth import get_current_user, TokenData
+from app.core import idempotency
 # from app.core.config import settings # No se usa directamente si la inicialización de IA es en startup
 
 # Modelos de IA y Posts
@@ -37,12 +38,15 @@ from app.services.ai_image_generator import (
     generate_image_from_prompt, # Genera, sube y devuelve URL
     generate_image_base64_only  # Solo devuelve base64
 )
+from app.services import image_variants, media_blobs, post_list_cache, storage_outbox
 
 from postgrest.exceptions import APIError
 
 router = APIRouter()
 logger = logging.getLogger(__name__) # Correcto
 
+IDEMPOTENCY_KEY_HEADER = Header(None, description="Clave única por intento lógico: los reintentos con la misma clave devuelven la respuesta original sin volver a llamar a la IA.")
+
 
 # --- FUNCIÓN HELPER ---
 async def get_organization_settings(
@@ -53,7 +57,7 @@ async def get_organization_settings(
         logger.warning("get_organization_settings fue llamado sin organization_id.")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ID de organización no proporcionado para obtener la configuración.")
     try:
-        response = supabase.table("organization_settings").select("*").eq("organization_id", str(organization_id)).maybe_single().execute()
+        response = await supabase.table("organization_settings").select("*").eq("organization_id", str(organization_id)).maybe_single().execute()
         if not response.data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -77,6 +81,17 @@ async def get_organization_settings(
     tags=["AI Content Generation - Ideas"]
 )
 async def generate_content_ideas_endpoint(
+    response: Response,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    return await idempotency.run_idempotent(
+        idempotency_key, scope="ai.content_ideas", principal=current_user.user_id, payload=None, response=response,
+        handler=lambda: _generate_content_ideas_endpoint(current_user, supabase)
+    )
+
+async def _generate_content_ideas_endpoint(
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
@@ -133,6 +148,18 @@ async def generate_content_ideas_endpoint(
     tags=["AI Content Generation - Titles"] # Nueva tag para agrupar
 )
 async def generate_titles_from_idea_endpoint(
+    request_data: GenerateTitlesFromFullIdeaRequest,
+    response: Response,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    return await idempotency.run_idempotent(
+        idempotency_key, scope="ai.titles_from_idea", principal=current_user.user_id, payload=request_data, response=response,
+        handler=lambda: _generate_titles_from_idea_endpoint(request_data, current_user, supabase)
+    )
+
+async def _generate_titles_from_idea_endpoint(
     request_data: GenerateTitlesFromFullIdeaRequest, # Modelo de petición que definimos
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
@@ -195,6 +222,18 @@ async def generate_titles_from_idea_endpoint(
     tags=["AI Content Generation - Text", "Posts"]
 )
 async def generate_caption_and_save_post_endpoint(
+    request_data: GenerateSingleImageCaptionRequest,
+    response: Response,
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client),
+):
+    return await idempotency.run_idempotent(
+        idempotency_key, scope="ai.single_image_caption", principal=current_user.user_id, payload=request_data, response=response,
+        handler=lambda: _generate_caption_and_save_post_endpoint(request_data, current_user, supabase)
+    )
+
+async def _generate_caption_and_save_post_endpoint(
     request_data: GenerateSingleImageCaptionRequest,
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client),
@@ -273,6 +312,18 @@ class GenerateImageForPostRequestBody(BaseModel):
     tags=["AI Image Generation", "Posts"]
 )
 async def generate_auto_image_for_post_endpoint(
+    response: Response,
+    post_id: UUID = Path(..., description="El ID del post existente"),
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    return await idempotency.run_idempotent(
+        idempotency_key, scope="ai.post_generate_image", principal=current_user.user_id, payload={"post_id": post_id}, response=response,
+        handler=lambda: _generate_auto_image_for_post_endpoint(post_id, current_user, supabase)
+    )
+
+async def _generate_auto_image_for_post_endpoint(
     post_id: UUID = Path(..., description="El ID del post existente"),
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
@@ -283,7 +334,7 @@ async def generate_auto_image_for_post_endpoint(
 
     # 1. Obtener los datos del post
     try:
-        post_res = supabase.table("posts").select("title, content_text, social_network, organization_id, content_type").eq("id", str(post_id)).single().execute()
+        post_res = await supabase.table("posts").select("title, content_text, social_network, organization_id, content_type, media_storage_path, media_variants").eq("id", str(post_id)).single().execute()
         if str(post_res.data['organization_id']) != str(current_user.organization_id):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="El post no pertenece a su organización.")
         post_data = post_res.data
@@ -329,30 +380,46 @@ async def generate_auto_image_for_post_endpoint(
         logger.error(f"No se obtuvo URL de imagen para post {post_id} (prompt automático) y no hubo error explícito.")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo obtener la URL de la imagen procesada.")
 
+    # La imagen nueva ya tiene su referencia (media_blobs); si el UPDATE no la aplica, se suelta.
+    # La imagen anterior y sus variantes las encola el trigger de posts dentro del mismo UPDATE.
+    new_media_references = [(storage_path_final, post_id)]
+    old_media_storage_path = post_data.get("media_storage_path")
+    is_media_changing = storage_path_final != old_media_storage_path
+    update_payload = {"media_url": public_image_url, "media_storage_path": storage_path_final}
+    if is_media_changing:
+        update_payload["media_variants"] = None
     try:
         logger.info(f"Actualizando post '{post_id}' con media_url (prompt automático): {public_image_url}")
-        update_response = supabase.table("posts") \
-            .update({"media_url": public_image_url}) \
+        update_response = await supabase.table("posts") \
+            .update(update_payload) \
             .eq("id", str(post_id)) \
             .eq("organization_id", str(current_user.organization_id)) \
             .execute()
-        
-        if not update_response.data or len(update_response.data) == 0:
-            logger.error(f"Post '{post_id}' (prompt automático) no se actualizó. Respuesta DB: {update_response}")
-            current_post_res = supabase.table("posts").select("*").eq("id", str(post_id)).single().execute()
-            if current_post_res.data: return PostResponse.model_validate(current_post_res.data)
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post {post_id} no encontrado tras actualización.")
-        
-        logger.info(f"Post '{post_id}' (prompt automático) actualizado con nueva media_url.")
-        return PostResponse.model_validate(update_response.data[0])
-
     except APIError as db_exc_api:
         logger.error(f"APIError de Supabase actualizando post '{post_id}' (prompt automático): {db_exc_api.message}", exc_info=True)
+        await storage_outbox.enqueue(await media_blobs.release_ops(supabase, new_media_references, "ai_generate_post_image_rollback"))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de BD (API) al actualizar post: {db_exc_api.message}")
     except Exception as db_exc:
         logger.error(f"Error inesperado actualizando post '{post_id}' (prompt automático): {db_exc}", exc_info=True)
+        await storage_outbox.enqueue(await media_blobs.release_ops(supabase, new_media_references, "ai_generate_post_image_rollback"))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado al actualizar post: {str(db_exc)}")
 
+    if not update_response.data or len(update_response.data) == 0:
+        logger.error(f"Post '{post_id}' (prompt automático) no se actualizó. Respuesta DB: {update_response}")
+        await storage_outbox.enqueue(await media_blobs.release_ops(supabase, new_media_references, "ai_generate_post_image_rollback"))
+        current_post_res = await supabase.table("posts").select("*").eq("id", str(post_id)).single().execute()
+        if current_post_res.data: return PostResponse.model_validate(current_post_res.data)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post {post_id} no encontrado tras actualización.")
+
+    post_list_cache.bump_org_version(current_user.organization_id)
+    if is_media_changing:
+        image_variants.schedule_post_media_variants(current_user.organization_id, post_id, storage_path_final)
+    else:
+        # Mismo blob que ya tenía el post: la fila no cambió (el trigger no libera nada), pero se le sumó una referencia.
+        await storage_outbox.enqueue(await media_blobs.release_ops(supabase, new_media_references, "ai_generate_post_image"))
+    logger.info(f"Post '{post_id}' (prompt automático) actualizado con nueva media_url.")
+    return PostResponse.model_validate(update_response.data[0])
+
 
 @router.post(
     "/generate-image", # URL: /api/v1/ai/generate-image
@@ -362,6 +429,17 @@ async def generate_auto_image_for_post_endpoint(
     tags=["AI Image Generation"]
 )
 async def generate_image_only_endpoint(
+    response: Response,
+    request_body: ImageGenerationRequest = Body(...),
+    idempotency_key: Optional[str] = IDEMPOTENCY_KEY_HEADER,
+):
+    # Endpoint sin autenticación: la clave no se aísla por usuario, pero solo se reutiliza con el mismo payload.
+    return await idempotency.run_idempotent(
+        idempotency_key, scope="ai.generate_image", principal=None, payload=request_body, response=response,
+        handler=lambda: _generate_image_only_endpoint(request_body)
+    )
+
+async def _generate_image_only_endpoint(
     request_body: ImageGenerationRequest = Body(...),
     # current_user: TokenData = Depends(get_current_user) # Puedes añadir auth si es necesario
 ):
@@ -1,9 +1,8 @@
 # app/api/v1/routers/auth.py
 from fastapi import APIRouter, Depends, HTTPException, status
-from supabase import Client
 from gotrue.errors import AuthApiError # <<< Importación para el error específico de Auth
 
-from app.db.supabase_client import get_supabase_client
+from app.db.supabase_client import get_supabase_client, SupabaseClient
 from app.models.auth_models import TokenRequestForm, TokenResponse
 
 router = APIRouter()
@@ -14,10 +13,10 @@ router = APIRouter()
 )
 async def login_for_access_token(
     form_data: TokenRequestForm,
-    supabase: Client = Depends(get_supabase_client)
+    supabase: SupabaseClient = Depends(get_supabase_client)
 ):
     try:
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await supabase.auth.sign_in_with_password({
             "email": form_data.email,
             "password": form_data.password
         })
@@ -1,10 +1,11 @@
 # app/api/v1/routers/organization_settings_router.py
-from fastapi import APIRouter, Depends, HTTPException, status
-# from typing import Dict, Any # Ya debería estar de los endpoints anteriores
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from typing import Optional
 from uuid import UUID
 
 from app.db.supabase_client import get_supabase_client, SupabaseClient
 from app.api.v1.dependencies.auth import get_current_user, TokenData
+from app.core.etag import if_none_match_matches, not_modified_response, set_etag_headers, weak_etag
 from app.models.organization_models import (
     OrganizationSettingsAIUpdate, 
     OrganizationSettingsAIResponse,
@@ -15,6 +16,11 @@ from postgrest.exceptions import APIError
 
 router = APIRouter()
 
+async def _settings_version(supabase: SupabaseClient, organization_id: UUID) -> Optional[str]:
+    """Consulta barata (solo updated_at) de la fila de organization_settings; None si no existe."""
+    response = await supabase.table("organization_settings").select("updated_at").eq("organization_id", str(organization_id)).limit(1).execute()
+    return response.data[0].get("updated_at") if response.data else None
+
 # --- Endpoint para OBTENER Identidad de Marca IA (el que ya teníamos) ---
 @router.get(
     "/ai-identity/", # Cambiando ruta para ser más específico
@@ -23,13 +29,21 @@ router = APIRouter()
     # ... (descripción, tags sin cambio)
 )
 async def get_ai_organization_settings(
+    http_response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
     if not current_user.organization_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario no asociado a una organización activa.")
     try:
-        response = supabase.table("organization_settings").select("*").eq("organization_id", str(current_user.organization_id)).maybe_single().execute()
+        if if_none_match:
+            current_etag = weak_etag("ai-identity", str(current_user.organization_id), await _settings_version(supabase, current_user.organization_id))
+            if if_none_match_matches(if_none_match, current_etag):
+                return not_modified_response(current_etag)
+
+        response = await supabase.table("organization_settings").select("*").eq("organization_id", str(current_user.organization_id)).maybe_single().execute()
+        set_etag_headers(http_response, weak_etag("ai-identity", str(current_user.organization_id), response.data.get("updated_at") if response.data else None))
         if response.data:
             settings_data = response.data
             settings_data["ai_brand_personality_tags"] = settings_data.get("ai_brand_personality_tags") or []
@@ -63,7 +77,7 @@ async def update_ai_organization_settings(
     if not update_payload: # ... (verificación como la tenías) ...
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se proporcionaron datos para actualizar.")
     try:
-        response = supabase.table("organization_settings").upsert(
+        response = await supabase.table("organization_settings").upsert(
             {**update_payload, "organization_id": str(current_user.organization_id)},
             on_conflict="organization_id"
         ).execute()
@@ -92,6 +106,8 @@ async def update_ai_organization_settings(
     tags=["Organization Settings"]
 )
 async def get_content_preferences(
+    http_response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
@@ -99,7 +115,12 @@ async def get_content_preferences(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario no asociado a una organización activa.")
     
     try:
-        response = (
+        if if_none_match:
+            current_etag = weak_etag("content-preferences", str(current_user.organization_id), await _settings_version(supabase, current_user.organization_id))
+            if if_none_match_matches(if_none_match, current_etag):
+                return not_modified_response(current_etag)
+
+        response = await (
             supabase.table("organization_settings")
             .select("organization_id, prefs_auto_hashtags_enabled, prefs_auto_hashtags_count, prefs_auto_hashtags_strategy, prefs_auto_emojis_enabled, prefs_auto_emojis_style, updated_at")
             .eq("organization_id", str(current_user.organization_id))
@@ -107,6 +128,7 @@ async def get_content_preferences(
             .execute()
         )
 
+        set_etag_headers(http_response, weak_etag("content-preferences", str(current_user.organization_id), response.data.get("updated_at") if response.data else None))
         if response.data:
             # Los defaults del modelo Pydantic se encargarán si algún campo es None
             return ContentPreferencesResponse.model_validate(response.data)
@@ -152,7 +174,7 @@ async def update_content_preferences(
     # --- INICIO DEL BLOQUE TRY CON LA INDENTACIÓN CORRECTA PARA SUS EXCEPTS ---
     try:
         #print(f"DEBUG_PREFS_PUT: Realizando upsert para org_id='{str(current_user.organization_id)}'") # LOG 3
-        upsert_response = (
+        upsert_response = await (
             supabase.table("organization_settings")
             .upsert(
                 {**update_payload, "organization_id": str(current_user.organization_id)},
@@ -167,7 +189,7 @@ async def update_content_preferences(
             #print(f"DEBUG_PREFS_PUT: Datos devueltos directamente por upsert: {upsert_response.data[0]}") # LOG 5
             
             #print(f"DEBUG_PREFS_PUT: Realizando SELECT explícito para refrescar datos.")
-            refreshed_settings_response = (
+            refreshed_settings_response = await (
                 supabase.table("organization_settings")
                 .select("organization_id, prefs_auto_hashtags_enabled, prefs_auto_hashtags_count, prefs_auto_hashtags_strategy, prefs_auto_emojis_enabled, prefs_auto_emojis_style, updated_at")
                 .eq("organization_id", str(current_user.organization_id))
@@ -2,9 +2,14 @@
 # --------------------------------------------------------------------------- #
 # 1. LIBRERÍAS ESTÁNDAR DE PYTHON
 # --------------------------------------------------------------------------- #
+import asyncio
+import csv
+import hashlib
+import io
+import json
 import logging
 import pytz
-from datetime import date, datetime
+from datetime import date, datetime, time, timedelta
 from enum import Enum
 from typing import Any, Dict, List, Optional, Tuple
 from uuid import UUID
@@ -13,7 +18,9 @@ import uuid as uuid_pkg
 # --------------------------------------------------------------------------- #
 # 2. LIBRERÍAS DE TERCEROS
 # --------------------------------------------------------------------------- #
-from fastapi import APIRouter, Depends, File, HTTPException, Path, Query, status, UploadFile
+from fastapi import APIRouter, Depends, File, Header, HTTPException, Path, Query, Response, status, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from postgrest.exceptions import APIError
 from pydantic import HttpUrl
 
@@ -21,18 +28,33 @@ from pydantic import HttpUrl
 # 3. IMPORTACIONES DE LA APLICACIÓN
 # --------------------------------------------------------------------------- #
 from app.api.v1.dependencies.auth import TokenData, get_current_user
+from app.core import idempotency
+from app.core.config import settings
+from app.core.etag import if_none_match_matches, not_modified_response, set_etag_headers, weak_etag
 from app.db.supabase_client import SupabaseClient, get_supabase_client
 from app.models.post_models import (
     ConfirmWIPImageDetails,
     ContentTypeEnum,
     GeneratePreviewImageRequest,
     GeneratePreviewImageResponse,
+    PostBulkItemResult,
+    PostBulkRequest,
+    PostBulkResponse,
+    PostCloneRequest,
+    PostCloneResponse,
+    CalendarDay,
+    PostCalendarResponse,
     PostCreate,
+    PostFacetsResponse,
+    PostPartialResponse,
     PostResponse,
     PostUpdate,
     PostContentOverride, 
+    POST_DEFAULT_SELECT,
+    POST_SELECTABLE_FIELDS,
 )
-from app.services import ai_image_generator, storage_service
+from app.services import ai_image_generator, image_variants, media_blobs, pagination, post_list_cache, storage_outbox, storage_service
+from app.services.storage_outbox import OP_DELETE, OP_PURGE_FOLDER, StorageOp
 
 # --------------------------------------------------------------------------- #
 # 4. IMPORTACIONES DE HELPERS DE OTROS MODULOS
@@ -49,8 +71,74 @@ class DeletedFilterEnum(str, Enum):
     deleted = "deleted"
     all = "all"
 
+class ExportFormatEnum(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+EXPORT_BATCH_SIZE = 500 # Filas por página interna del export (memoria constante: una página a la vez)
+
 router = APIRouter()
 
+def _parse_fields_param(fields: Optional[str]) -> Optional[List[str]]:
+    """
+    Convierte `fields=id,title,status` en la lista de columnas a proyectar, validada contra
+    POST_SELECTABLE_FIELDS (nunca se pasa texto del cliente tal cual al `select` de PostgREST).
+    Devuelve None si no se pidió proyección (se devuelve el post completo).
+    """
+    if fields is None:
+        return None
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    if not requested:
+        return None
+    invalid = [f for f in requested if f not in POST_SELECTABLE_FIELDS]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Campos no válidos en 'fields': {', '.join(invalid)}. Permitidos: {', '.join(sorted(POST_SELECTABLE_FIELDS))}."
+        )
+    return requested
+
+def _post_list_response(page: post_list_cache.CachedPostList) -> Response:
+    """Respuesta de GET /posts a partir de una página ya serializada (recién calculada o cacheada)."""
+    list_response = Response(content=page.body, media_type="application/json")
+    set_etag_headers(list_response, page.etag)
+    if page.next_cursor:
+        list_response.headers["X-Next-Cursor"] = page.next_cursor
+    return list_response
+
+def _apply_post_list_filters(
+    query: Any,
+    *,
+    author_id_str: str,
+    org_id_str: str,
+    deleted_filter: DeletedFilterEnum,
+    status_filter: Optional[str] = None,
+    social_network: Optional[str] = None,
+    content_type: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Any:
+    """Aplica el scoping (autor + organización) y los filtros comunes de los listados de posts."""
+    query = query.eq("author_user_id", author_id_str).eq("organization_id", org_id_str)
+
+    if deleted_filter == DeletedFilterEnum.not_deleted:
+        query = query.is_("deleted_at", None)
+    elif deleted_filter == DeletedFilterEnum.deleted:
+        query = query.not_.is_("deleted_at", None)
+    # Para 'all', no se aplica filtro de deleted_at.
+
+    if status_filter:
+        query = query.eq("status", status_filter)
+    if social_network:
+        query = query.eq("social_network", social_network)
+    if content_type:
+        query = query.eq("content_type", content_type)
+    if date_from:
+        query = query.gte("created_at", str(date_from))
+    if date_to:
+        query = query.lte("created_at", str(date_to))
+    return query
+
 @router.get(
     "/",
     response_model=List[Dict[str, Any]],
@@ -62,10 +150,12 @@ async def get_posts(
     status_filter: Optional[str] = Query(None, alias="status", description="Filtrar por estado (ej. draft, approved)"),
     social_network: Optional[str] = Query(None, description="Filtrar por red social"),
     content_type: Optional[str] = Query(None, description="Filtrar por tipo de contenido"),
-    date_from: Optional[date] = Query(None, description="Fecha desde (para created_at o scheduled_at)"),
-    date_to: Optional[date] = Query(None, description="Fecha hasta (para created_at o scheduled_at)"),
+    date_from: Optional[date] = Query(None, description="Fecha desde (created_at). Para scheduled_at usar GET /posts/calendar."),
+    date_to: Optional[date] = Query(None, description="Fecha hasta (created_at). Para scheduled_at usar GET /posts/calendar."),
     limit: int = Query(20, ge=1, le=100, description="Número de posts a devolver"),
-    offset: int = Query(0, ge=0, description="Número de posts a saltar para paginación"),
+    offset: int = Query(0, ge=0, description="(Obsoleto, usar 'cursor') Número de posts a saltar para paginación. Se ignora si se envía 'cursor'."),
+    cursor: Optional[str] = Query(None, description="Cursor opaco de la página siguiente (cabecera 'X-Next-Cursor' de la respuesta anterior)."),
+    fields: Optional[str] = Query(None, description="Columnas a devolver separadas por coma (ej. 'id,title,status,scheduled_at'). Por defecto, todas."),
     deleted_filter: DeletedFilterEnum = Query(
         DeletedFilterEnum.not_deleted,
         description="Filtrar posts por estado de borrado: "
@@ -73,9 +163,25 @@ async def get_posts(
                     "'deleted' (solo borrados), "
                     "'all' (todos)."
     ),
+    *,
+    if_none_match: Optional[str] = Header(None),
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
+    requested_fields = _parse_fields_param(fields)
+    # La paginación por keyset necesita (created_at, id) y el ETag (id, updated_at) de cada fila aunque el cliente no los pida.
+    helper_columns = ("id", "created_at", "updated_at")
+    select_columns = POST_DEFAULT_SELECT
+    if requested_fields:
+        select_columns = ",".join(dict.fromkeys(requested_fields + list(helper_columns)))
+
+    cursor_values: Optional[Tuple[str, str]] = None
+    if cursor:
+        try:
+            cursor_values = pagination.decode_cursor(cursor)
+        except ValueError as e_cursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e_cursor))
+
     print(f"DEBUG get_posts: current_user.user_id='{current_user.user_id}', current_user.organization_id='{current_user.organization_id}', current_user.role='{current_user.role}'") # Añade esto
     author_id_str: Optional[str] = None
     org_id_uuid: Optional[UUID] = None
@@ -87,50 +193,87 @@ async def get_posts(
         if org_id_uuid:
             org_id_for_log = str(org_id_uuid)
 
-        query = supabase.table("posts").select("*").eq("author_user_id", author_id_str)
-
-        if org_id_uuid:
-            query = query.eq("organization_id", str(org_id_uuid))
-        else:
+        if not org_id_uuid:
             # Si el usuario no tiene una organización activa, no debería ver ningún post.
             # Opcionalmente, podrías lanzar una HTTPException aquí.
             print(f"WARN: Usuario {author_id_str} sin organization_id activa, devolviendo lista vacía para get_posts.")
             return []
 
-        if deleted_filter == DeletedFilterEnum.not_deleted:
-            query = query.is_("deleted_at", None)
-        elif deleted_filter == DeletedFilterEnum.deleted:
-            query = query.not_.is_("deleted_at", None)
-        # Para 'all', no se aplica filtro de deleted_at.
-
-        if status_filter:
-            query = query.eq("status", status_filter)
-        if social_network:
-            query = query.eq("social_network", social_network)
-        if content_type:
-            query = query.eq("content_type", content_type)
-        if date_from:
-            query = query.gte("created_at", str(date_from))
-        if date_to:
-            query = query.lte("created_at", str(date_to))
-
-        query = query.order("created_at", desc=True).limit(limit).offset(offset)
-        response = query.execute()
-
-        posts_data = response.data # Esto es una lista de diccionarios
-        if not posts_data:
-            return []
+        # Caché de respuestas: la clave incluye la versión de la org, que sube con cada escritura sobre posts
+        # (trigger en la DB). Se lee ANTES de consultar los posts; si no se puede leer, no se usa la caché.
+        list_cache_key = None
+        shared_list_version = await post_list_cache.get_shared_org_version(supabase, org_id_uuid)
+        if shared_list_version is not None:
+            list_cache_key = post_list_cache.build_key(
+                org_id_uuid, current_user.user_id, shared_list_version,
+                status=status_filter, social_network=social_network, content_type=content_type,
+                date_from=date_from, date_to=date_to, deleted=deleted_filter.value,
+                limit=limit, offset=0 if cursor_values else offset, cursor=cursor, fields=requested_fields,
+            )
+        cached_page = post_list_cache.get_page(list_cache_key) if list_cache_key else None
+        if cached_page is not None:
+            if if_none_match_matches(if_none_match, cached_page.etag):
+                return not_modified_response(cached_page.etag)
+            return _post_list_response(cached_page)
+
+        def _page_query(columns: str):
+            query = _apply_post_list_filters(
+                supabase.table("posts").select(columns),
+                author_id_str=author_id_str,
+                org_id_str=str(org_id_uuid),
+                deleted_filter=deleted_filter,
+                status_filter=status_filter,
+                social_network=social_network,
+                content_type=content_type,
+                date_from=date_from,
+                date_to=date_to,
+            )
+            # Keyset: orden estable por (created_at, id) y una fila extra para saber si hay página siguiente.
+            if cursor_values:
+                query = pagination.apply_keyset_filter(query, cursor_values)
+            query = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1)
+            if offset and not cursor_values:
+                query = query.offset(offset)
+            return query
+
+        # ETag de la página: versión (id, updated_at) de sus filas + la proyección pedida.
+        def _page_etag(rows: List[Dict[str, Any]]) -> str:
+            return weak_etag("posts", requested_fields, [(row.get("id"), row.get("updated_at")) for row in rows])
+
+        if if_none_match:
+            # Consulta barata de versiones (sin content_text ni el resto de columnas) antes del select completo.
+            version_response = await _page_query("id,updated_at").execute()
+            current_etag = _page_etag(version_response.data or [])
+            if if_none_match_matches(if_none_match, current_etag):
+                return not_modified_response(current_etag)
+
+        db_response = await _page_query(select_columns).execute()
+
+        posts_data = db_response.data or [] # Esto es una lista de diccionarios
+        page_etag = _page_etag(posts_data)
+        next_cursor = pagination.next_cursor_from_rows(posts_data, limit)
 
         # Enriquecemos los datos manualmente
         for post in posts_data:
+            if requested_fields:
+                for helper_column in helper_columns:
+                    if helper_column not in requested_fields:
+                        post.pop(helper_column, None)
             content_type_key = post.get('content_type')
             if content_type_key:
                 try:
                     post['content_type_display'] = ContentTypeEnum[content_type_key].value
                 except KeyError:
                     post['content_type_display'] = content_type_key # Fallback
-        
-        return posts_data
+
+        page = post_list_cache.CachedPostList(
+            body=JSONResponse(content=jsonable_encoder(posts_data)).body,
+            etag=page_etag,
+            next_cursor=next_cursor,
+        )
+        if list_cache_key:
+            post_list_cache.store_page(list_cache_key, page)
+        return _post_list_response(page)
 
     except Exception as e:
         print(f"Error fetching posts for user {author_id_str} in org {org_id_for_log}: {e}")
@@ -149,21 +292,17 @@ async def get_posts(
 )
 async def create_post(
     post_data: PostCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, description="Clave única por intento lógico: los reintentos con la misma clave devuelven la respuesta original."),
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
-    author_id_str: Optional[str] = None
-    org_id_uuid: Optional[UUID] = None
-    org_id_for_log: str = "None"
-@router.post(
-    "/",
-    response_model=PostResponse,
-    status_code=status.HTTP_201_CREATED,
-    summary="Crear un Nuevo Post",
-    description="Crea un nuevo post asociado al usuario autenticado y su organización.",
-    tags=["Posts"]
-)
-async def create_post(
+    return await idempotency.run_idempotent(
+        idempotency_key, scope="posts.create", principal=current_user.user_id, payload=post_data, response=response,
+        handler=lambda: _create_post(post_data, current_user, supabase)
+    )
+
+async def _create_post(
     post_data: PostCreate,
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
@@ -203,7 +342,7 @@ async def create_post(
         new_post_dict["organization_id"] = str(org_id_uuid)
 
         # Insertar el nuevo post
-        insert_response = supabase.table("posts").insert(new_post_dict).execute()
+        insert_response = await supabase.table("posts").insert(new_post_dict).execute()
         
         if not insert_response.data or not isinstance(insert_response.data, list) or len(insert_response.data) == 0:
             logger.error(f"ERROR_POST_CREATE: La inserción del post no devolvió datos. Payload: {new_post_dict}. Respuesta: {insert_response}")
@@ -213,6 +352,7 @@ async def create_post(
             )
         
         created_post_data_from_insert = insert_response.data[0]
+        post_list_cache.bump_org_version(org_id_uuid)
         
         # Validamos el resultado para la respuesta.
         # Nuestro PostResponse ahora tiene el computed_field que añadirá `content_type_display`
@@ -235,18 +375,448 @@ async def create_post(
             detail=f"Ocurrió un error al crear el post: {str(e)}"
         )
 
+async def _enqueue_stale_wip_cleanup(supabase: SupabaseClient, organization_id: UUID, post_id: UUID, active_wip_path: str, context: str) -> None:
+    """
+    Tras subir una nueva previsualización (upsert sobre preview_active.<ext>), encola el borrado de los
+    demás archivos de la carpeta WIP. Se lista después de subir para no borrar nunca el archivo nuevo, y cada
+    borrado lleva el updated_at listado: si ese nombre se vuelve a subir antes de que corra el worker, se conserva.
+    """
+    wip_folder_path = storage_service.get_wip_folder_path(organization_id, post_id)
+    try:
+        wip_files = await storage_service.list_files_in_folder(supabase, storage_service.POST_PREVIEWS_BUCKET, wip_folder_path)
+    except Exception as e:
+        logger.warning(f"No se pudo listar la carpeta WIP {wip_folder_path} para limpiar previsualizaciones anteriores: {type(e).__name__} - {e}")
+        return
+    await storage_outbox.enqueue([
+        StorageOp(OP_DELETE, storage_service.POST_PREVIEWS_BUCKET, path, post_id, context, if_unmodified_since=updated_at)
+        for path, updated_at in wip_files if path != active_wip_path and updated_at is not None
+    ])
+
+@router.post(
+    "/bulk",
+    response_model=PostBulkResponse,
+    summary="Operaciones en Lote sobre Posts",
+    description="Ejecuta en una sola petición creaciones, cambios de estado y borrados lógicos de posts de la organización del usuario. "
+                "Cada tipo de operación se resuelve con una sola sentencia (INSERT / UPDATE ... WHERE id IN (...)) y devuelve un resultado por operación. "
+                "Orden de aplicación: creaciones, cambios de estado y, por último, borrados.",
+    tags=["Posts"]
+)
+async def bulk_post_operations(
+    bulk_request: PostBulkRequest,
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    if not current_user.organization_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario no asociado a una organización activa.")
+
+    org_id_str = str(current_user.organization_id)
+    author_id_str = str(current_user.user_id)
+    operations = bulk_request.operations
+    results: Dict[int, PostBulkItemResult] = {}
+
+    def _ok(index: int, row: Dict[str, Any]) -> None:
+        results[index] = PostBulkItemResult(index=index, op=operations[index].op, post_id=row.get("id"), success=True, post=PostResponse.model_validate(row))
+
+    def _fail(index: int, error: str) -> None:
+        results[index] = PostBulkItemResult(index=index, op=operations[index].op, post_id=operations[index].post_id, success=False, error=error)
+
+    # --- 1. Creaciones: un único INSERT con todas las filas válidas ---
+    create_indexes: List[int] = []
+    create_rows: List[Dict[str, Any]] = []
+    for index, operation in enumerate(operations):
+        if operation.op != "create":
+            continue
+        if operation.data.content_type not in ContentTypeEnum.__members__:
+            _fail(index, f"Valor inválido para 'content_type'. Las opciones válidas son: {[e.name for e in ContentTypeEnum]}")
+            continue
+        row = operation.data.model_dump(mode="json", exclude_unset=True)
+        row["author_user_id"] = author_id_str
+        row["organization_id"] = org_id_str
+        create_indexes.append(index)
+        create_rows.append(row)
+
+    if create_rows:
+        try:
+            # default_to_null=False: las columnas que una fila no trae toman el DEFAULT de la tabla, no NULL.
+            insert_response = await supabase.table("posts").insert(create_rows, default_to_null=False).execute()
+            inserted_rows = insert_response.data or []
+            # PostgREST devuelve las filas insertadas en el mismo orden del payload.
+            for index, row in zip(create_indexes, inserted_rows):
+                _ok(index, row)
+            for index in create_indexes[len(inserted_rows):]:
+                _fail(index, "La inserción no devolvió datos para este post.")
+        except Exception as e_insert:
+            logger.error(f"BULK_LOG - Error en la inserción en lote para org {org_id_str}: {type(e_insert).__name__} - {e_insert}", exc_info=True)
+            for index in create_indexes:
+                _fail(index, f"Error de base de datos al crear el post: {getattr(e_insert, 'message', None) or str(e_insert)}")
+
+    # --- 2. Cambios de estado: un UPDATE ... WHERE id IN (...) por cada estado destino ---
+    status_groups: Dict[str, List[int]] = {}
+    for index, operation in enumerate(operations):
+        if operation.op == "update_status":
+            status_groups.setdefault(operation.status, []).append(index)
+
+    for new_status, indexes in status_groups.items():
+        post_ids = list(dict.fromkeys(str(operations[index].post_id) for index in indexes))
+        try:
+            update_response = await (
+                supabase.table("posts")
+                .update({"status": new_status})
+                .in_("id", post_ids)
+                .eq("organization_id", org_id_str)
+                .is_("deleted_at", None)
+                .execute()
+            )
+            updated_by_id = {row["id"]: row for row in (update_response.data or [])}
+            for index in indexes:
+                row = updated_by_id.get(str(operations[index].post_id))
+                if row:
+                    _ok(index, row)
+                else:
+                    _fail(index, "Post no encontrado, no pertenece a la organización o ha sido eliminado.")
+        except Exception as e_update:
+            logger.error(f"BULK_LOG - Error en el cambio de estado en lote a '{new_status}' para org {org_id_str}: {type(e_update).__name__} - {e_update}", exc_info=True)
+            for index in indexes:
+                _fail(index, f"Error de base de datos al actualizar el estado: {getattr(e_update, 'message', None) or str(e_update)}")
+
+    # --- 3. Borrados lógicos: un único UPDATE ---
+    delete_indexes = [index for index, operation in enumerate(operations) if operation.op == "soft_delete"]
+    if delete_indexes:
+        post_ids = list(dict.fromkeys(str(operations[index].post_id) for index in delete_indexes))
+        deleted_rows: List[Dict[str, Any]] = []
+        try:
+            delete_response = await (
+                supabase.table("posts")
+                .update({"deleted_at": datetime.now(pytz.utc).isoformat(), "status": "deleted"})
+                .in_("id", post_ids)
+                .eq("organization_id", org_id_str)
+                .is_("deleted_at", None)
+                .execute()
+            )
+            deleted_rows = delete_response.data or []
+            deleted_by_id = {row["id"]: row for row in deleted_rows}
+            for index in delete_indexes:
+                row = deleted_by_id.get(str(operations[index].post_id))
+                if row:
+                    _ok(index, row)
+                else:
+                    _fail(index, "Post no encontrado para eliminar.")
+        except Exception as e_delete:
+            logger.error(f"BULK_LOG - Error en el borrado en lote para org {org_id_str}: {type(e_delete).__name__} - {e_delete}", exc_info=True)
+            for index in delete_indexes:
+                _fail(index, f"Error de DB al eliminar: {getattr(e_delete, 'message', None) or str(e_delete)}")
+        # La limpieza de storage (imagen, variantes y carpeta WIP) la encola el trigger de posts en el mismo UPDATE.
+
+    ordered_results = [results[index] for index in range(len(operations))]
+    succeeded = sum(1 for result in ordered_results if result.success)
+    if succeeded:
+        post_list_cache.bump_org_version(current_user.organization_id)
+    logger.info(f"BULK_LOG - Org {org_id_str}: {succeeded}/{len(ordered_results)} operaciones aplicadas.")
+    return PostBulkResponse(succeeded=succeeded, failed=len(ordered_results) - succeeded, results=ordered_results)
+
+CALENDAR_MAX_RANGE_DAYS = 93 # Suficiente para una vista mensual con semanas de meses vecinos
+
+async def _get_profile_timezone(supabase: SupabaseClient, user_id: UUID) -> str:
+    """Zona horaria de `profiles.timezone` (validada con pytz); 'UTC' si no hay perfil o no es válida."""
+    try:
+        profile_res = await supabase.table("profiles").select("timezone").eq("id", str(user_id)).limit(1).execute()
+        timezone_name = profile_res.data[0].get("timezone") if profile_res.data else None
+        if timezone_name:
+            pytz.timezone(timezone_name)
+            return timezone_name
+    except pytz.UnknownTimeZoneError:
+        logger.warning(f"CALENDAR_LOG - Zona horaria desconocida en el perfil de {user_id}; se usa UTC.")
+    except Exception as e:
+        logger.warning(f"CALENDAR_LOG - No se pudo leer la zona horaria del perfil de {user_id}; se usa UTC: {type(e).__name__} - {e}")
+    return "UTC"
+
+@router.get(
+    "/calendar",
+    response_model=PostCalendarResponse,
+    summary="Calendario de Contenido (posts programados por día)",
+    description="Agrupa los posts activos por día de `scheduled_at` en la zona horaria del perfil del usuario y devuelve un resumen compacto por día "
+                "(total, conteo por estado y los primeros posts). La agregación se hace en la base de datos.",
+    tags=["Posts"],
+)
+async def get_posts_calendar(
+    date_from: date = Query(..., description="Primer día (local) del calendario, inclusive."),
+    date_to: date = Query(..., description="Último día (local) del calendario, inclusive."),
+    max_posts_per_day: int = Query(5, ge=0, le=50, description="Cantidad máxima de posts resumidos por día (los conteos incluyen todos)."),
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    if date_to < date_from:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'date_to' no puede ser anterior a 'date_from'.")
+    if (date_to - date_from).days + 1 > CALENDAR_MAX_RANGE_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"El rango máximo del calendario es de {CALENDAR_MAX_RANGE_DAYS} días.")
+
+    author_id_str = str(current_user.user_id)
+    org_id_uuid = current_user.organization_id
+    timezone_name = await _get_profile_timezone(supabase, current_user.user_id)
+    if not org_id_uuid:
+        print(f"WARN: Usuario {author_id_str} sin organization_id activa, devolviendo calendario vacío.")
+        return PostCalendarResponse(timezone=timezone_name, date_from=date_from, date_to=date_to, days=[])
+
+    # Límites del rango: medianoche local de date_from y del día siguiente a date_to, en UTC.
+    user_tz = pytz.timezone(timezone_name)
+    range_start_utc = user_tz.localize(datetime.combine(date_from, time.min)).astimezone(pytz.utc)
+    range_end_utc = user_tz.localize(datetime.combine(date_to + timedelta(days=1), time.min)).astimezone(pytz.utc)
+
+    try:
+        rpc_response = await supabase.rpc("post_calendar_days", {
+            "p_organization_id": str(org_id_uuid),
+            "p_author_user_id": author_id_str,
+            "p_from": range_start_utc.isoformat(),
+            "p_to": range_end_utc.isoformat(),
+            "p_timezone": timezone_name,
+            "p_max_posts_per_day": max_posts_per_day,
+        }).execute()
+        days = [CalendarDay.model_validate(day_row) for day_row in (rpc_response.data or [])]
+        return PostCalendarResponse(timezone=timezone_name, date_from=date_from, date_to=date_to, days=days)
+    except Exception as e:
+        logger.error(f"CALENDAR_LOG - Error obteniendo calendario para user {author_id_str} en org {org_id_uuid}: {type(e).__name__} - {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ocurrió un error al obtener el calendario de posts. {str(e)}"
+        )
+
+@router.get(
+    "/search",
+    response_model=List[Dict[str, Any]],
+    summary="Buscar Posts por Texto",
+    description="Búsqueda de texto completo (configuración 'spanish') sobre título y contenido, ordenada por relevancia. "
+                "Admite la sintaxis de `websearch_to_tsquery` (\"frase exacta\", OR, -excluir). Mismo scoping y filtros que GET /posts. "
+                "Paginación por cursor: la cabecera 'X-Next-Cursor' trae el cursor de la página siguiente.",
+    tags=["Posts"],
+)
+async def search_posts(
+    q: str = Query(..., min_length=2, max_length=200, description="Texto a buscar"),
+    status_filter: Optional[str] = Query(None, alias="status", description="Filtrar por estado (ej. draft, approved)"),
+    social_network: Optional[str] = Query(None, description="Filtrar por red social"),
+    content_type: Optional[str] = Query(None, description="Filtrar por tipo de contenido"),
+    date_from: Optional[date] = Query(None, description="Fecha desde (created_at)"),
+    date_to: Optional[date] = Query(None, description="Fecha hasta (created_at)"),
+    limit: int = Query(20, ge=1, le=100, description="Número de posts a devolver"),
+    cursor: Optional[str] = Query(None, description="Cursor opaco de la página siguiente (cabecera 'X-Next-Cursor' de la respuesta anterior)."),
+    deleted_filter: DeletedFilterEnum = Query(DeletedFilterEnum.not_deleted, description="'not_deleted', 'deleted' o 'all'."),
+    *,
+    response: Response,
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    cursor_values: Optional[Tuple[float, str]] = None
+    if cursor:
+        try:
+            cursor_values = pagination.decode_rank_cursor(cursor)
+        except ValueError as e_cursor:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e_cursor))
+
+    author_id_str = str(current_user.user_id)
+    org_id_uuid = current_user.organization_id
+    if not org_id_uuid:
+        print(f"WARN: Usuario {author_id_str} sin organization_id activa, devolviendo lista vacía para search_posts.")
+        return []
+
+    try:
+        rpc_response = await supabase.rpc("search_posts", {
+            "p_organization_id": str(org_id_uuid),
+            "p_author_user_id": author_id_str,
+            "p_query": q,
+            "p_limit": limit + 1, # Fila extra para saber si hay página siguiente
+            "p_after_rank": cursor_values[0] if cursor_values else None,
+            "p_after_id": cursor_values[1] if cursor_values else None,
+            "p_deleted_filter": deleted_filter.value,
+            "p_status": status_filter,
+            "p_social_network": social_network,
+            "p_content_type": content_type,
+            "p_date_from": str(date_from) if date_from else None,
+            "p_date_to": str(date_to) if date_to else None,
+        }).execute()
+    except Exception as e:
+        logger.error(f"SEARCH_LOG - Error buscando posts para user {author_id_str} en org {org_id_uuid}: {type(e).__name__} - {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ocurrió un error al buscar posts. {str(e)}"
+        )
+
+    posts_data: List[Dict[str, Any]] = []
+    for match in rpc_response.data or []:
+        post = match["post"]
+        post["search_rank"] = match["rank"]
+        content_type_key = post.get('content_type')
+        if content_type_key:
+            try:
+                post['content_type_display'] = ContentTypeEnum[content_type_key].value
+            except KeyError:
+                post['content_type_display'] = content_type_key # Fallback
+        posts_data.append(post)
+
+    next_cursor = pagination.next_cursor_from_rows(posts_data, limit, sort_column="search_rank")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return posts_data
+
+def _csv_cell(value: Any) -> Any:
+    """Celda CSV: vacío para None y JSON para dicts/listas (ej. media_variants), no su repr de Python."""
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+@router.get(
+    "/export",
+    summary="Exportar Posts (NDJSON o CSV en streaming)",
+    description="Exporta todos los posts del usuario en su organización, sin límite de cantidad, como NDJSON (una línea JSON por post) o CSV. "
+                "Se recorren internamente páginas por keyset de la base de datos y se envían a medida que llegan, así que la memoria no crece con el tamaño de la organización. "
+                "Mismos filtros y opciones de borrado que GET /posts.",
+    tags=["Posts"],
+    response_class=StreamingResponse,
+)
+async def export_posts(
+    export_format: ExportFormatEnum = Query(ExportFormatEnum.ndjson, alias="format", description="'ndjson' o 'csv'"),
+    status_filter: Optional[str] = Query(None, alias="status", description="Filtrar por estado (ej. draft, approved)"),
+    social_network: Optional[str] = Query(None, description="Filtrar por red social"),
+    content_type: Optional[str] = Query(None, description="Filtrar por tipo de contenido"),
+    date_from: Optional[date] = Query(None, description="Fecha desde (created_at)"),
+    date_to: Optional[date] = Query(None, description="Fecha hasta (created_at)"),
+    fields: Optional[str] = Query(None, description="Columnas a exportar separadas por coma. Por defecto, todas las de PostResponse."),
+    deleted_filter: DeletedFilterEnum = Query(DeletedFilterEnum.not_deleted, description="'not_deleted', 'deleted' o 'all'."),
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    if not current_user.organization_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario no asociado a una organización activa.")
+
+    requested_fields = _parse_fields_param(fields)
+    export_columns = requested_fields or list(PostResponse.model_fields)
+    # El keyset necesita (created_at, id) aunque no se exporten.
+    select_columns = ",".join(dict.fromkeys(export_columns + ["id", "created_at"]))
+    author_id_str = str(current_user.user_id)
+    org_id_str = str(current_user.organization_id)
+
+    async def _fetch_batch(cursor_values: Optional[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        query = _apply_post_list_filters(
+            supabase.table("posts").select(select_columns),
+            author_id_str=author_id_str,
+            org_id_str=org_id_str,
+            deleted_filter=deleted_filter,
+            status_filter=status_filter,
+            social_network=social_network,
+            content_type=content_type,
+            date_from=date_from,
+            date_to=date_to,
+        )
+        if cursor_values:
+            query = pagination.apply_keyset_filter(query, cursor_values)
+        batch_response = await query.order("created_at", desc=True).order("id", desc=True).limit(EXPORT_BATCH_SIZE).execute()
+        return batch_response.data or []
+
+    # La primera página se pide antes de empezar a responder, para que un error de DB sea un 500 normal.
+    try:
+        first_batch = await _fetch_batch(None)
+    except Exception as e:
+        logger.error(f"EXPORT_LOG - Error iniciando export para user {author_id_str} en org {org_id_str}: {type(e).__name__} - {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Ocurrió un error al exportar los posts. {str(e)}")
+
+    def _render_batch(rows: List[Dict[str, Any]]) -> str:
+        if export_format == ExportFormatEnum.ndjson:
+            return "".join(
+                json.dumps({column: row.get(column) for column in export_columns}, ensure_ascii=False, default=str) + "\n"
+                for row in rows
+            )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([[_csv_cell(row.get(column)) for column in export_columns] for row in rows])
+        return buffer.getvalue()
+
+    async def _stream_export():
+        if export_format == ExportFormatEnum.csv:
+            header_buffer = io.StringIO()
+            csv.writer(header_buffer).writerow(export_columns)
+            yield header_buffer.getvalue()
+
+        batch = first_batch
+        exported_count = 0
+        while batch:
+            yield _render_batch(batch)
+            exported_count += len(batch)
+            if len(batch) < EXPORT_BATCH_SIZE:
+                break
+            last_row = batch[-1]
+            try:
+                batch = await _fetch_batch((last_row["created_at"], last_row["id"]))
+            except Exception as e_batch:
+                # Ya se enviaron cabeceras y datos: no se puede cambiar el status, solo cortar y loguear.
+                logger.error(f"EXPORT_LOG - Export interrumpido tras {exported_count} posts para org {org_id_str}: {type(e_batch).__name__} - {e_batch}", exc_info=True)
+                return
+        logger.info(f"EXPORT_LOG - Export completo: {exported_count} posts ({export_format.value}) para user {author_id_str} en org {org_id_str}.")
+
+    media_type = "application/x-ndjson" if export_format == ExportFormatEnum.ndjson else "text/csv; charset=utf-8"
+    filename = f"posts_export_{datetime.now(pytz.utc).strftime('%Y%m%d_%H%M%S')}.{export_format.value}"
+    return StreamingResponse(
+        _stream_export(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get(
+    "/facets",
+    response_model=PostFacetsResponse,
+    summary="Conteos de Posts por Faceta",
+    description="Devuelve en una sola consulta los conteos por estado, red social, tipo de contenido y estado de borrado, con el mismo scoping y rango de fechas que GET /posts.",
+    tags=["Posts"],
+)
+async def get_post_facets(
+    date_from: Optional[date] = Query(None, description="Fecha desde (created_at)"),
+    date_to: Optional[date] = Query(None, description="Fecha hasta (created_at)"),
+    deleted_filter: DeletedFilterEnum = Query(
+        DeletedFilterEnum.not_deleted,
+        description="Posts incluidos en los conteos por estado, red social y tipo: 'not_deleted', 'deleted' o 'all'."
+    ),
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    author_id_str = str(current_user.user_id)
+    org_id_uuid = current_user.organization_id
+    if not org_id_uuid:
+        print(f"WARN: Usuario {author_id_str} sin organization_id activa, devolviendo facetas vacías.")
+        return PostFacetsResponse()
+
+    try:
+        rpc_response = await supabase.rpc("post_facet_counts", {
+            "p_organization_id": str(org_id_uuid),
+            "p_author_user_id": author_id_str,
+            "p_date_from": str(date_from) if date_from else None,
+            "p_date_to": str(date_to) if date_to else None,
+            "p_deleted_filter": deleted_filter.value,
+        }).execute()
+        return PostFacetsResponse.model_validate(rpc_response.data or {})
+    except Exception as e:
+        logger.error(f"Error obteniendo facetas de posts para user {author_id_str} en org {org_id_uuid}: {type(e).__name__} - {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ocurrió un error al obtener los conteos de posts. {str(e)}"
+        )
+
 @router.get(
     "/{post_id}",
-    response_model=PostResponse,
+    response_model=PostPartialResponse,
+    response_model_exclude_unset=True,
     summary="Obtener un Post Específico",
-    description="Recupera un post por ID, si pertenece al usuario y su organización.",
+    description="Recupera un post por ID, si pertenece al usuario y su organización. Con `fields=` devuelve solo esas columnas.",
     tags=["Posts"]
 )
 async def get_post_by_id(
     post_id: UUID = Path(..., description="El ID del post a recuperar"),
+    fields: Optional[str] = Query(None, description="Columnas a devolver separadas por coma (ej. 'id,title,status'). Por defecto, todas."),
+    *,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
+    requested_fields = _parse_fields_param(fields)
     author_id_str: Optional[str] = None
     org_id_uuid: Optional[UUID] = None
     org_id_for_log: str = "None"
@@ -264,24 +834,38 @@ async def get_post_by_id(
                 detail=f"Post con ID {post_id} no encontrado o acceso denegado (usuario sin organización activa)."
             )
 
-        query_builder = (
-            supabase.table("posts")
-            .select("*")
-            .eq("id", str(post_id))
-            .eq("author_user_id", author_id_str)
-            .eq("organization_id", str(org_id_uuid)) # Seguro porque org_id_uuid está validado
-            .is_("deleted_at", None)
-            .single()
-        )
-        
-        response = query_builder.execute()
-        post_data = response.data
+        def _post_query(columns: str):
+            return (
+                supabase.table("posts")
+                .select(columns)
+                .eq("id", str(post_id))
+                .eq("author_user_id", author_id_str)
+                .eq("organization_id", str(org_id_uuid)) # Seguro porque org_id_uuid está validado
+                .is_("deleted_at", None)
+            )
+
+        if if_none_match:
+            # Solo updated_at: si el cliente ya tiene esta versión, 304 sin el select completo.
+            version_response = await _post_query("updated_at").limit(1).execute()
+            if version_response.data:
+                current_etag = weak_etag("post", str(post_id), version_response.data[0].get("updated_at"), requested_fields)
+                if if_none_match_matches(if_none_match, current_etag):
+                    return not_modified_response(current_etag)
+
+        select_columns = ",".join(dict.fromkeys(requested_fields + ["updated_at"])) if requested_fields else POST_DEFAULT_SELECT
+        db_response = await _post_query(select_columns).single().execute()
+        post_data = db_response.data
 
         if not post_data:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Post con ID {post_id} no encontrado, no pertenece al usuario/organización, o ha sido eliminado."
             )
+        set_etag_headers(response, weak_etag("post", str(post_id), post_data.get("updated_at"), requested_fields))
+        if requested_fields:
+            if "updated_at" not in requested_fields:
+                post_data.pop("updated_at", None)
+            return PostPartialResponse.model_validate(post_data)
         return PostResponse.model_validate(post_data)
 
     except HTTPException as http_exc:
@@ -293,88 +877,136 @@ async def get_post_by_id(
             detail=f"Ocurrió un error al obtener el post: {str(e)}"
         )
 
-@router.delete(
-    "/{post_id}",
-    response_model=PostResponse,
-    summary="Borrar Lógicamente un Post",
-    description="Marca un post como eliminado (soft delete), estableciendo 'deleted_at' y actualizando el 'status'.",
+# Columnas de contenido que se copian del original a cada clon.
+CLONE_COPIED_FIELDS = ("title", "content_text", "social_network", "content_type", "prompt_id")
+
+async def _rollback_clone_media(supabase: SupabaseClient, post_id: UUID, copied_paths: List[str], blob_path: Optional[str], blob_refs: int) -> None:
+    """Si el clonado falla: encola el borrado de las copias y libera las referencias al blob compartido."""
+    rollback_ops = [StorageOp(OP_DELETE, storage_service.POST_MEDIA_BUCKET, path, post_id, "clone_rollback") for path in copied_paths]
+    if blob_refs:
+        rollback_ops += await media_blobs.release_ops(supabase, [(blob_path, post_id)] * blob_refs, "clone_rollback")
+    await storage_outbox.enqueue(rollback_ops)
+
+@router.post(
+    "/{post_id}/clone",
+    response_model=PostCloneResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Clonar un Post",
+    description="Crea uno o varios borradores a partir de un post existente (uno por red en 'social_networks'). "
+                "Los clones se insertan en una sola sentencia, comparten 'generation_group_id' y apuntan al original con 'original_post_id'. "
+                "La imagen principal se copia dentro de Storage, sin volver a subirla.",
     tags=["Posts"]
 )
-async def soft_delete_post(
-    post_id: UUID = Path(..., description="El ID del post a marcar como eliminado"),
+async def clone_post(
+    post_id: UUID = Path(..., description="El ID del post a clonar"),
+    clone_request: Optional[PostCloneRequest] = None,
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
-    author_id_str: Optional[str] = None
-    org_id_uuid: Optional[UUID] = None
-    org_id_for_log: str = "None"
-    
-    try:
-        author_id_str = str(current_user.user_id)
-        org_id_uuid = current_user.organization_id
-        
-        if org_id_uuid:
-            org_id_for_log = str(org_id_uuid)
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN, 
-                detail=f"No se puede eliminar el post {post_id}: usuario sin organización activa."
-            )
+    if not current_user.organization_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario no asociado a una organización activa.")
+    org_id_str = str(current_user.organization_id)
 
-        now_utc = datetime.now(pytz.utc)
-        update_payload = {
-            "deleted_at": now_utc.isoformat(),
-            "status": "deleted" 
-            # "updated_at" debería ser manejado por el trigger de la DB
-        }
-
-        # --- CORRECCIÓN AQUÍ ---
-        # Paso 1: Actualizar el post para marcarlo como borrado
-        update_response = (
-            supabase.table("posts")
-            .update(update_payload)
-            .eq("id", str(post_id))
-            .eq("author_user_id", author_id_str)
-            .eq("organization_id", str(org_id_uuid))
-            .is_("deleted_at", None) # Solo borrar si no está ya borrado
-            .execute()
-        )
-        
-        # response.data de un update es una lista de los registros actualizados
-        # si PostgREST está configurado para devolver la representación.
-        # Si no se actualizó nada (porque no encontró la fila o ya estaba borrada), .data será [].
-        if update_response.data and isinstance(update_response.data, list) and len(update_response.data) > 0:
-            # El post actualizado (ahora con deleted_at y status='deleted')
-            deleted_post_data_dict = update_response.data[0]
-            return PostResponse.model_validate(deleted_post_data_dict)
-        elif not update_response.data or len(update_response.data) == 0:
-            # La condición .eq() o .is_("deleted_at", None) no encontró ninguna fila que actualizar.
-            print(f"WARN_POST_DELETE: No se marcó como borrado el post {post_id} (usuario: {author_id_str}, org: {org_id_for_log}). Verifique si existe, pertenece al usuario/org, o si ya estaba borrado.")
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Post con ID {post_id} no encontrado, no pertenece al usuario/organización, o ya estaba eliminado."
-            )
+    try:
+        source_res = await supabase.table("posts").select("*").eq("id", str(post_id)).eq("organization_id", org_id_str).is_("deleted_at", None).limit(1).execute()
+    except APIError as e:
+        logger.error(f"CLONE_LOG - DB Error obteniendo post {post_id}: {e.message}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error al obtener el post a clonar.")
+    if not source_res.data:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado o no pertenece a la organización.")
+    source_post = source_res.data[0]
+
+    target_networks = (clone_request.social_networks if clone_request and clone_request.social_networks else None) or [source_post["social_network"]]
+    generation_group_id = source_post.get("generation_group_id") or str(uuid_pkg.uuid4())
+
+    # Los IDs se generan aquí para poder construir las rutas de storage de cada clon antes del INSERT.
+    clone_rows: List[Dict[str, Any]] = []
+    for network in target_networks:
+        row = {field: source_post.get(field) for field in CLONE_COPIED_FIELDS}
+        row.update({
+            "id": str(uuid_pkg.uuid4()),
+            "social_network": network,
+            "organization_id": org_id_str,
+            "author_user_id": str(current_user.user_id),
+            "status": "draft",
+            "generation_group_id": generation_group_id,
+            "original_post_id": source_post["id"],
+        })
+        clone_rows.append(row)
+
+    # Copia de la imagen principal y sus variantes dentro de Storage (server-side), en paralelo para todos los clones.
+    # Si la imagen es un blob deduplicado, los clones solo suman referencias: no se copia nada.
+    copied_paths: List[str] = []
+    acquired_blob_refs = 0
+    source_media_path = source_post.get("media_storage_path")
+    if source_media_path:
+        source_filename = source_media_path.rsplit("/", 1)[-1]
+        extension = source_filename.rsplit(".", 1)[1] if "." in source_filename else "png"
+        if media_blobs.is_blob_path(source_media_path):
+            try:
+                is_blob_ready = await media_blobs.acquire(supabase, source_media_path, count=len(clone_rows))
+            except Exception as e_acquire:
+                logger.error(f"CLONE_LOG - Error adquiriendo el blob {source_media_path} para clonar post {post_id}: {type(e_acquire).__name__} - {e_acquire}", exc_info=True)
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo registrar la imagen compartida de los clones.")
+            if not is_blob_ready:
+                # El post original apunta a un blob que no está subido: los clones no pueden compartirlo.
+                await storage_outbox.enqueue(await media_blobs.release_ops(supabase, [(source_media_path, post_id)] * len(clone_rows), "clone_rollback"))
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="La imagen del post original no está disponible en el almacenamiento.")
+            acquired_blob_refs = len(clone_rows)
+            destination_paths = [source_media_path] * len(clone_rows)
+            copy_pairs = []
         else:
-            # Caso inesperado
-            print(f"ERROR_POST_DELETE: Respuesta inesperada del update (soft delete) para post {post_id}. Respuesta: {update_response}")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error al procesar el borrado del post.")
-        # --- FIN DE LA CORRECCIÓN ---
+            destination_paths = [
+                storage_service.get_post_media_storage_path(current_user.organization_id, UUID(row["id"]), f"{uuid_pkg.uuid4()}.{extension}")
+                for row in clone_rows
+            ]
+            copy_pairs = [(source_media_path, destination_path) for destination_path in destination_paths]
+        clone_variants: List[Dict[str, Dict[str, Any]]] = []
+        for row in clone_rows:
+            relocated_variants, variant_copies = image_variants.relocate_variants(source_post.get("media_variants"), current_user.organization_id, UUID(row["id"]))
+            clone_variants.append(relocated_variants)
+            copy_pairs.extend(variant_copies)
+        copy_results = await asyncio.gather(*(
+            storage_service.copy_file_in_storage(supabase, storage_service.POST_MEDIA_BUCKET, source_path, destination_path)
+            for source_path, destination_path in copy_pairs
+        ))
+        copied_paths = [copied_path for copied_path, _error in copy_results if copied_path]
+        copy_errors = [error for _path, error in copy_results if error]
+        if copy_errors:
+            await _rollback_clone_media(supabase, post_id, copied_paths, source_media_path, acquired_blob_refs)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"No se pudo copiar la imagen del post: {copy_errors[0]}")
+        url_paths = list(dict.fromkeys(destination_paths + [destination_path for _source_path, destination_path in copy_pairs]))
+        public_urls = dict(zip(
+            url_paths,
+            await asyncio.gather(*(
+                storage_service.build_public_url(supabase, storage_service.POST_MEDIA_BUCKET, path)
+                for path in url_paths
+            ))
+        ))
+        for row, destination_path, variants in zip(clone_rows, destination_paths, clone_variants):
+            row["media_storage_path"] = destination_path
+            row["media_url"] = public_urls[destination_path]
+            if variants:
+                row["media_variants"] = {name: {**variant, "url": public_urls[variant["storage_path"]]} for name, variant in variants.items()}
 
-    except HTTPException as http_exc:
-        raise http_exc
-    except APIError as e:
-        print(f"ERROR_POST_DELETE: APIError soft-deleting post {post_id} para user {author_id_str} en org {org_id_for_log}: Code={getattr(e, 'code', 'N/A')}, Msg='{e.message}'")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Error de base de datos al marcar el post como eliminado: {e.message}"
-        )
-    except Exception as e:
-        print(f"ERROR_POST_DELETE: Excepción inesperada soft-deleting post {post_id} para user {author_id_str} en org {org_id_for_log}: {type(e).__name__} - {e}")
+    try:
+        # Un único INSERT para todos los clones; default_to_null=False deja que las columnas omitidas tomen su DEFAULT.
+        insert_response = await supabase.table("posts").insert(clone_rows, default_to_null=False).execute()
+    except Exception as e_insert:
+        logger.error(f"CLONE_LOG - Error insertando clones del post {post_id}: {type(e_insert).__name__} - {e_insert}", exc_info=True)
+        await _rollback_clone_media(supabase, post_id, copied_paths, source_media_path, acquired_blob_refs)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Ocurrió un error al marcar el post como eliminado: {str(e)}"
+            detail=f"Error de base de datos al clonar el post: {getattr(e_insert, 'message', None) or str(e_insert)}"
         )
-    
+
+    post_list_cache.bump_org_version(current_user.organization_id)
+    logger.info(f"CLONE_LOG - Post {post_id} clonado en {len(clone_rows)} borradores (grupo {generation_group_id}).")
+    return PostCloneResponse(
+        generation_group_id=generation_group_id,
+        posts=[PostResponse.model_validate(row) for row in (insert_response.data or [])]
+    )
+
 # ================================================================================
 # SECCIÓN: NUEVOS ENDPOINTS PARA GESTIÓN DE IMÁGENES DE PREVISUALIZACIÓN (WIP)
 # Estos endpoints se añaden a tu router existente.
@@ -388,6 +1020,21 @@ async def soft_delete_post(
     tags=["Posts - Image Management"]
 )
 async def generate_ia_preview_image_for_wip(
+    request_data: GeneratePreviewImageRequest,
+    post_id: UUID = Path(..., description="ID del post para el cual generar la preview."),
+    *,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, description="Clave única por intento lógico: los reintentos con la misma clave devuelven la respuesta original."),
+    current_user: TokenData = Depends(get_current_user),
+    supabase: SupabaseClient = Depends(get_supabase_client)
+):
+    return await idempotency.run_idempotent(
+        idempotency_key, scope="posts.generate_preview_image", principal=current_user.user_id,
+        payload={"post_id": post_id, "request": request_data}, response=response,
+        handler=lambda: _generate_ia_preview_image_for_wip(request_data, post_id, current_user=current_user, supabase=supabase)
+    )
+
+async def _generate_ia_preview_image_for_wip(
     request_data: GeneratePreviewImageRequest, 
     post_id: UUID = Path(..., description="ID del post para el cual generar la preview."),
     *, 
@@ -413,7 +1060,7 @@ async def generate_ia_preview_image_for_wip(
         # Casos 1 y 2: Leer de la base de datos
         logger.info(f"Generando imagen para post {post_id} con contenido de la base de datos.")
         try:
-            post_res = supabase.table("posts").select("title, content_text, organization_id").eq("id", str(post_id)).single().execute()
+            post_res = await supabase.table("posts").select("title, content_text, organization_id").eq("id", str(post_id)).single().execute()
             if str(post_res.data.get('organization_id')) != str(current_user.organization_id):
                  raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso denegado al post.")
             
@@ -444,15 +1091,7 @@ async def generate_ia_preview_image_for_wip(
 
     logger.info(f"Generando imagen IA para WIP (post {post_id}) con prompt: '{dalle_prompt[:100]}...'")
 
-    # 3. Limpiar la carpeta WIP
-    wip_folder_path = storage_service.get_wip_folder_path(current_user.organization_id, post_id)
-    cleanup_success, cleanup_error = await storage_service.delete_all_files_in_folder(
-        supabase_client=supabase, bucket_name=storage_service.POST_PREVIEWS_BUCKET, folder_path=wip_folder_path
-    )
-    if not cleanup_success:
-        logger.warning(f"Fallo al limpiar WIP para post {post_id}: {cleanup_error}. Continuando de todas formas...")
-
-    # 4. Llamar al servicio de IA para generar y subir la imagen a WIP
+    # 3. Llamar al servicio de IA para generar y subir la imagen a WIP
     # Petición: Necesito los org_settings aquí para pasarlos
     org_settings = await get_organization_settings(current_user.organization_id, supabase) # <-- Añadimos esto
     
@@ -469,6 +1108,9 @@ async def generate_ia_preview_image_for_wip(
         # ... (manejo de errores como lo tenías) ...
         raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Error al generar o guardar imagen: {ai_upload_error}")
 
+    # 4. Las previsualizaciones anteriores de la carpeta WIP se borran vía outbox
+    await _enqueue_stale_wip_cleanup(supabase, current_user.organization_id, post_id, storage_path, context="generate_preview_image")
+
     return GeneratePreviewImageResponse(
         preview_image_url=public_url, 
         preview_storage_path=storage_path,
@@ -544,8 +1186,7 @@ async def update_post_partial(
     # 1. Obtener el post actual de la DB
     logger.debug(f"PATCH_LOG - Obteniendo post actual {post_id} de la DB.")
     try:
-        # SIN await (asumiendo comportamiento síncrono de .execute() en tu entorno)
-        current_post_res = supabase.table("posts").select("*").eq("id", str(post_id)).eq("organization_id", str(current_user.organization_id)).is_("deleted_at", None).limit(1).execute()
+        current_post_res = await supabase.table("posts").select("*").eq("id", str(post_id)).eq("organization_id", str(current_user.organization_id)).is_("deleted_at", None).limit(1).execute()
         if not current_post_res.data:
             logger.warning(f"PATCH_LOG - Post {post_id} no encontrado o no pertenece a org {current_user.organization_id}.")
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado o no pertenece a la organización.")
@@ -586,9 +1227,11 @@ async def update_post_partial(
     if 'confirm_wip_image_details' in db_update_payload: # Este campo no va a la DB
         del db_update_payload['confirm_wip_image_details']
     
-    final_storage_paths_to_delete_post_db: List[Tuple[str, str]] = [] # (bucket_name, path_in_bucket)
+    # La imagen y las variantes anteriores las encola el trigger de posts al cambiar media_storage_path/media_variants.
+    reacquired_blob_path: Optional[str] = None # Blob que ya tenía el post y al que la confirmación sumó otra referencia
     wip_folder_path = storage_service.get_wip_folder_path(current_user.organization_id, post_id)
     moved_wip_image_final_path: Optional[str] = None # Para rollback si DB falla
+    acquired_blob_path: Optional[str] = None # Blob fijado directamente al que se sumó una referencia: se suelta si DB falla
 
     # --- Lógica de Imágenes ---
     if has_confirm_wip: 
@@ -600,19 +1243,29 @@ async def update_post_partial(
             logger.error(f"PATCH_LOG - Path de WIP proporcionado '{wip_details.path}' no coincide con esperado '{expected_wip_storage_path}'.")
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El path de la imagen de previsualización a confirmar es incorrecto.")
 
-        unique_final_filename = f"{uuid_pkg.uuid4()}.{wip_details.extension}"
-        destination_final_media_path = storage_service.get_post_media_storage_path(current_user.organization_id, post_id, unique_final_filename)
-        logger.debug(f"PATCH_LOG - Destino final en post_media: {destination_final_media_path}")
-
+        wip_sha256 = current_post_db_data.get("wip_media_sha256")
+        wip_copied_at = datetime.now(pytz.utc) # Una previsualización subida después de copiar no se borra en la limpieza
         move_start_time = datetime.now()
-        moved_path, move_error = await storage_service.move_file_in_storage( # moved_path se define aquí
-            supabase_client=supabase,
-            source_bucket=storage_service.POST_PREVIEWS_BUCKET,
-            source_path_in_bucket=wip_details.path,
-            destination_bucket=storage_service.POST_MEDIA_BUCKET,
-            destination_path_in_bucket=destination_final_media_path,
-            content_type_for_destination=wip_details.content_type
-        )
+        if settings.MEDIA_CONTENT_ADDRESSED_STORAGE and wip_sha256:
+            # Deduplicación: la imagen va al blob de su contenido; si la organización ya lo tenía, no se copia nada.
+            moved_path, move_error = await media_blobs.ensure_blob_from_storage(
+                supabase, current_user.organization_id, wip_sha256, wip_details.extension,
+                storage_service.POST_PREVIEWS_BUCKET, wip_details.path, wip_details.content_type
+            )
+        else:
+            unique_final_filename = f"{uuid_pkg.uuid4()}.{wip_details.extension}"
+            destination_final_media_path = storage_service.get_post_media_storage_path(current_user.organization_id, post_id, unique_final_filename)
+            logger.debug(f"PATCH_LOG - Destino final en post_media: {destination_final_media_path}")
+
+            moved_path, move_error = await storage_service.move_file_in_storage( # moved_path se define aquí
+                supabase_client=supabase,
+                source_bucket=storage_service.POST_PREVIEWS_BUCKET,
+                source_path_in_bucket=wip_details.path,
+                destination_bucket=storage_service.POST_MEDIA_BUCKET,
+                destination_path_in_bucket=destination_final_media_path,
+                content_type_for_destination=wip_details.content_type,
+                delete_source=False # El original en WIP se borra vía outbox, sin esperar al storage
+            )
         move_time_taken = (datetime.now() - move_start_time).total_seconds()
         logger.info(f"PATCH_LOG - storage_service.move_file_in_storage tomó: {move_time_taken:.4f}s. Resultado: moved_path='{moved_path}', move_error='{move_error}'")
 
@@ -623,25 +1276,49 @@ async def update_post_partial(
         # --- MOVER ESTAS LÍNEAS AQUÍ ---
         moved_wip_image_final_path = moved_path # Para posible rollback
         
-        new_media_url = storage_service._build_public_url(supabase, storage_service.POST_MEDIA_BUCKET, moved_path, add_timestamp_bust=False)
+        new_media_url = await storage_service.build_public_url(supabase, storage_service.POST_MEDIA_BUCKET, moved_path, add_timestamp_bust=False)
         db_update_payload["media_url"] = str(new_media_url) 
         db_update_payload["media_storage_path"] = moved_path # Ahora moved_path tiene un valor
+        db_update_payload["wip_media_sha256"] = None
         # --- FIN DE LÍNEAS MOVIDAS ---
         
         logger.info(f"PATCH_LOG - Payload de DB actualizado con nueva media: media_url='{db_update_payload['media_url']}', media_storage_path='{db_update_payload['media_storage_path']}'")
 
-        if old_media_storage_path and old_media_storage_path != moved_path:
-            logger.info(f"PATCH_LOG - Programando borrado de imagen principal antigua: {storage_service.POST_MEDIA_BUCKET}/{old_media_storage_path}")
-            final_storage_paths_to_delete_post_db.append((storage_service.POST_MEDIA_BUCKET, old_media_storage_path))
+        # Mismo blob que ya tenía el post: la fila no cambia (el trigger no libera nada), pero la confirmación le sumó una referencia.
+        if old_media_storage_path == moved_path and media_blobs.is_blob_path(moved_path):
+            reacquired_blob_path = moved_path
         
-        elif is_deleting_media_explicitly: # Borrar imagen principal
-         logger.info(f"PATCH_LOG - Solicitud para borrar imagen principal del post {post_id}.")
-         db_update_payload["media_url"] = None
-         db_update_payload["media_storage_path"] = None
-        if old_media_storage_path:
-            logger.info(f"PATCH_LOG - Programando borrado de imagen principal existente: {storage_service.POST_MEDIA_BUCKET}/{old_media_storage_path}")
-            final_storage_paths_to_delete_post_db.append((storage_service.POST_MEDIA_BUCKET, old_media_storage_path))
+    elif is_deleting_media_explicitly: # Borrar imagen principal
+        logger.info(f"PATCH_LOG - Solicitud para borrar imagen principal del post {post_id}.")
+        db_update_payload["media_url"] = None
+        db_update_payload["media_storage_path"] = None
+
+    elif (
+        is_setting_new_media_directly
+        and media_blobs.is_blob_path(db_update_payload.get("media_storage_path"))
+        and db_update_payload["media_storage_path"] != old_media_storage_path
+    ):
+        # Apuntar el post a un blob existente: suma una referencia para que no se borre mientras este post lo use.
+        blob_organization_id, _sha256 = media_blobs.parse_blob_path(db_update_payload["media_storage_path"])
+        if blob_organization_id != str(current_user.organization_id):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="La imagen indicada no pertenece a la organización.")
+        try:
+            is_blob_ready = await media_blobs.acquire(supabase, db_update_payload["media_storage_path"])
+        except Exception as e_acquire:
+            logger.error(f"PATCH_LOG - Error adquiriendo el blob {db_update_payload['media_storage_path']} para post {post_id}: {type(e_acquire).__name__} - {e_acquire}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo registrar la imagen del post.")
+        if not is_blob_ready:
+            # Solo se puede apuntar a un blob ya subido (no a uno que se está subiendo, borrando o que no existe).
+            await storage_outbox.enqueue(await media_blobs.release_ops(supabase, [(db_update_payload["media_storage_path"], post_id)], "update_post_partial_rollback"))
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="La imagen indicada no está disponible.")
+        acquired_blob_path = db_update_payload["media_storage_path"]
     
+    # --- Variantes de la imagen principal ---
+    # Si cambia la imagen principal, las variantes anteriores se borran (trigger) y las nuevas se generan en segundo plano tras el UPDATE.
+    is_media_changing = "media_storage_path" in db_update_payload and db_update_payload["media_storage_path"] != old_media_storage_path
+    if is_media_changing:
+        db_update_payload["media_variants"] = None
+
     # --- Actualizar Base de Datos ---
     updated_post_from_db = None # Inicializar
     # Solo actualizar si hay algo que cambiar en el payload de la DB.
@@ -665,59 +1342,50 @@ async def update_post_partial(
             updated_post_from_db = current_post_db_data
         else:
             logger.info(f"PATCH_LOG - Actualizando post {post_id} en DB con payload: {db_update_payload}")
+            # Si el UPDATE no se aplica, la imagen nueva (copiada desde WIP o blob adquirido) se suelta:
+            # la anterior sigue en la fila y el trigger no la tocó.
+            new_media_rollback_paths = [path for path in (moved_wip_image_final_path, acquired_blob_path) if path]
             db_update_start_time = datetime.now()
             try:
-                # SIN await para la llamada a DB
-                update_res = supabase.table("posts").update(db_update_payload).eq("id", str(post_id)).execute()
+                update_res = await supabase.table("posts").update(db_update_payload).eq("id", str(post_id)).execute()
                 db_update_time_taken = (datetime.now() - db_update_start_time).total_seconds()
 
                 if not update_res.data or len(update_res.data) == 0:
                     logger.error(f"PATCH_LOG - Fallo al actualizar post {post_id} en DB (no se devolvieron datos). Tiempo: {db_update_time_taken:.4f}s. Respuesta: {update_res}")
+                    await storage_outbox.enqueue(await media_blobs.release_ops(supabase, [(path, post_id) for path in new_media_rollback_paths], "update_post_partial_rollback"))
                     # Podría ser que el post fue eliminado mientras tanto o RLS lo impidió.
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="El post no pudo ser actualizado (no encontrado o sin cambios).")
                 updated_post_from_db = update_res.data[0]
+                post_list_cache.bump_org_version(current_user.organization_id)
                 logger.info(f"PATCH_LOG - Post {post_id} actualizado exitosamente en DB. Tiempo: {db_update_time_taken:.4f}s")
 
             except APIError as e_db_update:
                 db_update_time_taken_error = (datetime.now() - db_update_start_time).total_seconds()
                 logger.error(f"PATCH_LOG - DB Error actualizando post {post_id}: {e_db_update.message}. Tiempo: {db_update_time_taken_error:.4f}s", exc_info=True)
-                if moved_wip_image_final_path:
-                    logger.warning(f"PATCH_LOG - DB update falló para post {post_id}. Intentando rollback de storage: Borrar {moved_wip_image_final_path} de {storage_service.POST_MEDIA_BUCKET}")
-                    rollback_start_time = datetime.now()
-                    await storage_service.delete_files_from_storage(supabase, storage_service.POST_MEDIA_BUCKET, [moved_wip_image_final_path])
-                    rollback_time_taken = (datetime.now() - rollback_start_time).total_seconds()
-                    logger.info(f"PATCH_LOG - Rollback de storage tomó: {rollback_time_taken:.4f}s")
+                if new_media_rollback_paths:
+                    logger.warning(f"PATCH_LOG - DB update falló para post {post_id}. Encolando rollback de storage: soltar {new_media_rollback_paths} de {storage_service.POST_MEDIA_BUCKET}")
+                    await storage_outbox.enqueue(await media_blobs.release_ops(supabase, [(path, post_id) for path in new_media_rollback_paths], "update_post_partial_rollback"))
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al guardar cambios en el post: {e_db_update.message}")
     else: # No hubo payload para la DB (ej. PATCH vacío y sin confirm_wip o media_url:null)
         logger.info(f"PATCH_LOG - No hay payload para actualizar DB para post {post_id}. Se usará el post actual para la respuesta. Solo se limpiará WIP si aplica.")
         updated_post_from_db = current_post_db_data
 
 
-    # --- Ejecutar Limpieza de Storage Post-Actualización Exitosa de DB ---
-    if final_storage_paths_to_delete_post_db:
-        logger.info(f"PATCH_LOG - Ejecutando borrados programados de storage para post {post_id}: {final_storage_paths_to_delete_post_db}")
-        for bucket, path_to_delete in final_storage_paths_to_delete_post_db:
-            delete_start_time = datetime.now()
-            delete_results = await storage_service.delete_files_from_storage(supabase, bucket, [path_to_delete])
-            delete_time_taken = (datetime.now() - delete_start_time).total_seconds()
-            for _path, success, err_msg in delete_results:
-                if not success:
-                    logger.error(f"PATCH_LOG - Fallo en limpieza de storage post-DB: No se pudo borrar {bucket}/{_path}. Error: {err_msg}. Tiempo: {delete_time_taken:.4f}s")
-                else:
-                    logger.info(f"PATCH_LOG - Limpieza de storage exitosa: {bucket}/{_path} borrado. Tiempo: {delete_time_taken:.4f}s")
-    
-    # Limpiar la carpeta WIP si NO se confirmó una imagen desde ella
-    if not has_confirm_wip: # Si no se usaron detalles de confirm_wip
-        logger.info(f"PATCH_LOG - Limpiando carpeta WIP para post {post_id} ya que no se confirmó ninguna imagen de allí (o se borró la principal). Path: {wip_folder_path}")
-        wip_cleanup_start_time = datetime.now()
-        _success_wip, _err_wip = await storage_service.delete_all_files_in_folder(
-            supabase_client=supabase, bucket_name=storage_service.POST_PREVIEWS_BUCKET, folder_path=wip_folder_path
-        )
-        wip_cleanup_time_taken = (datetime.now() - wip_cleanup_start_time).total_seconds()
-        if not _success_wip:
-            logger.error(f"PATCH_LOG - Fallo al limpiar carpeta WIP {wip_folder_path} para post {post_id} después de actualizar post: {_err_wip}. Tiempo: {wip_cleanup_time_taken:.4f}s")
-        else:
-            logger.info(f"PATCH_LOG - Limpieza de carpeta WIP {wip_folder_path} exitosa. Tiempo: {wip_cleanup_time_taken:.4f}s")
+    # --- Limpieza de Storage Post-Actualización Exitosa de DB ---
+    # Se encola en el outbox de storage: el PATCH solo espera a la DB. Si se confirmó una imagen WIP,
+    # se borra su original en WIP; si no, se purga la carpeta WIP. La imagen y las variantes anteriores
+    # ya las encoló el trigger de posts dentro del UPDATE.
+    cleanup_ops = await media_blobs.release_ops(supabase, [(reacquired_blob_path, post_id)] if reacquired_blob_path else [], "update_post_partial")
+    # Las rutas WIP se reutilizan: solo se borra lo que no se volvió a subir después de este PATCH.
+    if has_confirm_wip:
+        if moved_wip_image_final_path:
+            cleanup_ops.append(StorageOp(OP_DELETE, storage_service.POST_PREVIEWS_BUCKET, post_update_data.confirm_wip_image_details.path, post_id, "update_post_partial", if_unmodified_since=wip_copied_at))
+    else:
+        cleanup_ops.append(StorageOp(OP_PURGE_FOLDER, storage_service.POST_PREVIEWS_BUCKET, wip_folder_path, post_id, "update_post_partial", if_unmodified_since=datetime.now(pytz.utc)))
+    logger.info(f"PATCH_LOG - Encolando limpieza de storage para post {post_id}: {cleanup_ops}")
+    await storage_outbox.enqueue(cleanup_ops)
+    if is_media_changing and db_update_payload["media_storage_path"]:
+        image_variants.schedule_post_media_variants(current_user.organization_id, post_id, db_update_payload["media_storage_path"])
 
     total_request_time = (datetime.now() - request_start_time).total_seconds()
     logger.info(f"PATCH_LOG [{datetime.now().isoformat()}] - FIN para post {post_id}. Tiempo total: {total_request_time:.4f}s")
@@ -727,7 +1395,7 @@ async def update_post_partial(
     if not updated_post_from_db: # Fallback muy improbable
         logger.error(f"PATCH_LOG - updated_post_from_db es None al final del PATCH para post {post_id}. Esto no debería ocurrir.")
         # Re-fetch como último recurso, aunque indica un error lógico previo.
-        final_fallback_res = supabase.table("posts").select("*").eq("id", str(post_id)).limit(1).execute()
+        final_fallback_res = await supabase.table("posts").select("*").eq("id", str(post_id)).limit(1).execute()
         if final_fallback_res.data:
             updated_post_from_db = final_fallback_res.data[0]
         else: # El post realmente no existe o no es accesible
@@ -756,44 +1424,27 @@ async def soft_delete_post(
     if not current_user.organization_id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario no asociado a una organización activa.")
     try:
-        # SIN await
-        post_to_delete_res = supabase.table("posts").select("id, organization_id, media_storage_path").eq("id", str(post_id)).eq("organization_id", str(current_user.organization_id)).is_("deleted_at", None).limit(1).execute()
+        # Solo el autor puede borrar su post, y solo dentro de su organización.
+        post_to_delete_res = await supabase.table("posts").select("id").eq("id", str(post_id)).eq("author_user_id", str(current_user.user_id)).eq("organization_id", str(current_user.organization_id)).is_("deleted_at", None).limit(1).execute()
         if not post_to_delete_res.data:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado para eliminar.")
-        post_data_for_delete = post_to_delete_res.data[0]
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado, no pertenece al usuario/organización o ya estaba eliminado.")
     except APIError as e:
         # ...
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo post para eliminar.")
     
-    org_id_of_post = UUID(post_data_for_delete["organization_id"])
-    media_storage_path_to_delete = post_data_for_delete.get("media_storage_path")
-    
     now_utc = datetime.now(pytz.utc)
     update_payload = { "deleted_at": now_utc.isoformat(), "status": "deleted" }
     try:
-        # SIN await
-        delete_update_res = supabase.table("posts").update(update_payload).eq("id", str(post_id)).execute()
-        if not delete_update_res.data:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Fallo al marcar post como eliminado.")
+        delete_update_res = await supabase.table("posts").update(update_payload).eq("id", str(post_id)).eq("author_user_id", str(current_user.user_id)).is_("deleted_at", None).execute()
+        if not delete_update_res.data: # Borrado por otro request entre la lectura y el UPDATE
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Post no encontrado, no pertenece al usuario/organización o ya estaba eliminado.")
         deleted_post_data = delete_update_res.data[0]
+        post_list_cache.bump_org_version(current_user.organization_id)
     except APIError as e_db_delete:
         # ...
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error de DB al eliminar: {e_db_delete.message}")
 
-    # --- Limpieza de Imágenes (las llamadas a storage_service SÍ usan await) ---
-    if media_storage_path_to_delete:
-        # CON await
-        delete_main_results = await storage_service.delete_files_from_storage(
-            supabase, storage_service.POST_MEDIA_BUCKET, [media_storage_path_to_delete]
-        )
-        # ... (loguear errores)
-
-    wip_folder_to_delete = storage_service.get_wip_folder_path(org_id_of_post, post_id)
-    # CON await
-    _success_wip_del, _err_wip_del = await storage_service.delete_all_files_in_folder(
-        supabase, storage_service.POST_PREVIEWS_BUCKET, wip_folder_to_delete
-    )
-    # ... (loguear errores)
+    # La limpieza de imágenes (principal, variantes y carpeta WIP) la encola el trigger de posts en la misma transacción.
 
     return PostResponse.model_validate(deleted_post_data)
 
@@ -807,8 +1458,8 @@ async def soft_delete_post(
     "/{post_id}/upload-wip-preview",
     response_model=GeneratePreviewImageResponse, # Reutilizamos el mismo modelo de respuesta que para la IA
     summary="Subir Imagen de Previsualización de Usuario a WIP",
-    description="El usuario sube un archivo de imagen, el backend limpia la carpeta 'wip' del post "
-                "y sube la nueva imagen allí. Devuelve los detalles de la imagen en WIP.",
+    description="El usuario sube un archivo de imagen, el backend la sube a la carpeta 'wip' del post "
+                "y encola el borrado de las previsualizaciones anteriores. Devuelve los detalles de la imagen en WIP.",
     tags=["Posts - Image Management"]
 )
 async def upload_user_preview_image_to_wip(
@@ -825,28 +1476,22 @@ async def upload_user_preview_image_to_wip(
         logger.warning(f"UPLOAD_WIP_LOG - Usuario {current_user.user_id} sin organization_id intentando subir preview para post {post_id}.")
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Usuario no asociado a una organización activa.")
 
-    # 1. Validaciones Opcionales del Archivo (Tipo, Tamaño)
-    # Estos límites deberían idealmente estar en la configuración (settings)
+    # 1. Validaciones baratas antes de leer nada: tipo declarado y tamaño (si el multipart lo informa)
     ALLOWED_CONTENT_TYPES = ["image/png", "image/jpeg", "image/webp", "image/gif"]
-    MAX_FILE_SIZE_BYTES = 20 * 1024 * 1024 # 20 MB
+    max_file_size_bytes = settings.WIP_UPLOAD_MAX_BYTES
+    too_large_detail = f"El archivo excede el tamaño máximo de {max_file_size_bytes // (1024*1024)}MB."
 
     if image_file.content_type not in ALLOWED_CONTENT_TYPES:
         logger.warning(f"UPLOAD_WIP_LOG - Tipo de archivo no permitido: {image_file.content_type} para post {post_id}. Archivo: {image_file.filename}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Tipo de archivo no permitido: {image_file.content_type}. Permitidos: png, jpg, jpeg, webp, gif.")
-    
-    # Para verificar el tamaño, necesitamos leer el archivo, lo cual puede ser costoso para archivos grandes.
-    # FastAPI/Starlette pueden tener un límite máximo de tamaño de cuerpo de solicitud configurable.
-    # Si el archivo es muy grande, podría fallar antes de llegar aquí.
-    # Una forma de verificar el tamaño si UploadFile lo soporta sin leer todo en memoria:
-    # if image_file.size and image_file.size > MAX_FILE_SIZE_BYTES:
-    # logger.warning(f"UPLOAD_WIP_LOG - Archivo demasiado grande: {image_file.size} bytes para post {post_id}. Archivo: {image_file.filename}")
-    # raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"El archivo excede el tamaño máximo de {MAX_FILE_SIZE_BYTES // (1024*1024)}MB.")
+    if image_file.size is not None and image_file.size > max_file_size_bytes:
+        logger.warning(f"UPLOAD_WIP_LOG - Archivo demasiado grande: {image_file.size} bytes para post {post_id}. Archivo: {image_file.filename}")
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=too_large_detail)
 
     # 2. Verificar que el post pertenece al usuario/organización (seguridad)
     logger.debug(f"UPLOAD_WIP_LOG - Verificando post {post_id} para org {current_user.organization_id}.")
     try:
-        # SIN await (asumiendo comportamiento síncrono de .execute())
-        post_check_res = supabase.table("posts").select("id").eq("id", str(post_id)).eq("organization_id", str(current_user.organization_id)).limit(1).execute()
+        post_check_res = await supabase.table("posts").select("id").eq("id", str(post_id)).eq("organization_id", str(current_user.organization_id)).limit(1).execute()
         if not post_check_res.data:
             logger.warning(f"UPLOAD_WIP_LOG - Post {post_id} no encontrado o no pertenece a org {current_user.organization_id}.")
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Post con ID {post_id} no encontrado o no pertenece a la organización.")
@@ -854,79 +1499,80 @@ async def upload_user_preview_image_to_wip(
         logger.error(f"UPLOAD_WIP_LOG - DB Error verificando post {post_id}: {e.message}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error al verificar datos del post.")
 
-    # 3. Limpiar la carpeta /wip/ del post ANTES de subir la nueva imagen
-    wip_folder_path = storage_service.get_wip_folder_path(current_user.organization_id, post_id)
-    logger.info(f"UPLOAD_WIP_LOG - Limpiando carpeta WIP: {wip_folder_path} para post {post_id}")
-    
-    cleanup_start_time = datetime.now()
-    cleanup_success, cleanup_error = await storage_service.delete_all_files_in_folder(
-        supabase_client=supabase, # Este cliente usa service_key implícitamente
-        bucket_name=storage_service.POST_PREVIEWS_BUCKET,
-        folder_path=wip_folder_path
-    )
-    cleanup_time_taken = (datetime.now() - cleanup_start_time).total_seconds()
-    logger.info(f"UPLOAD_WIP_LOG - Limpieza de WIP para post {post_id} tomó: {cleanup_time_taken:.4f}s. Éxito: {cleanup_success}")
-
-    if not cleanup_success:
-        logger.error(f"UPLOAD_WIP_LOG - Fallo crítico al limpiar carpeta WIP '{wip_folder_path}' para post {post_id}: {cleanup_error}")
-        # Decidimos fallar aquí si la limpieza no es exitosa, para evitar estados inconsistentes en WIP.
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error preparando el espacio para la nueva previsualización: {cleanup_error}")
-
-    # 4. Preparar datos para la subida
+    # 3. Leer solo el primer trozo y detectar el tipo real por magic bytes (no se confía en content_type ni en la extensión)
+    chunk_size = settings.WIP_UPLOAD_CHUNK_SIZE
+    original_filename = image_file.filename if image_file.filename else "untitled"
     try:
-        file_bytes = await image_file.read() # Leer el contenido del archivo
-        # `image_file.filename` puede ser None si no se envía, o podría no tener extensión.
-        original_filename = image_file.filename if image_file.filename else "untitled"
-        file_extension = original_filename.split(".")[-1].lower() if "." in original_filename else "png" # Default a png
-        
-        # Re-validar extensión por si el content_type era genérico
-        valid_extensions = ["png", "jpg", "jpeg", "webp", "gif"]
-        if file_extension not in valid_extensions:
-            # Si el content_type pasó pero la extensión inferida no es válida, usar una default o la del content_type
-            if image_file.content_type == "image/png": file_extension = "png"
-            elif image_file.content_type == "image/jpeg": file_extension = "jpg"
-            elif image_file.content_type == "image/webp": file_extension = "webp"
-            elif image_file.content_type == "image/gif": file_extension = "gif"
-            else: # Último recurso, pero el chequeo de content_type debería haberlo prevenido
-                logger.warning(f"UPLOAD_WIP_LOG - Extensión de archivo '{file_extension}' no es la esperada para post {post_id}, pero content_type '{image_file.content_type}' fue permitido. Se usará extensión inferida o 'png'.")
-                if file_extension not in valid_extensions: file_extension = "png" # Default final
-
-
-        content_type = image_file.content_type or f"image/{file_extension}" # Usar el content_type del archivo
-        if not content_type.startswith("image/"): # Doble chequeo
-            logger.error(f"UPLOAD_WIP_LOG - Content-type final '{content_type}' no es de imagen para post {post_id}.")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El archivo proporcionado no parece ser una imagen válida después del procesamiento.")
-
+        first_chunk = await image_file.read(chunk_size)
     except Exception as e_read:
         logger.error(f"UPLOAD_WIP_LOG - Error leyendo el archivo subido para post {post_id}: {e_read}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No se pudo procesar el archivo subido.")
 
+    sniffed_type = storage_service.sniff_image_type(first_chunk)
+    if not sniffed_type:
+        logger.warning(f"UPLOAD_WIP_LOG - El contenido de '{original_filename}' no es una imagen png/jpg/webp/gif (content_type declarado: {image_file.content_type}) para post {post_id}.")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El archivo proporcionado no parece ser una imagen válida (png, jpg, jpeg, webp, gif).")
+    content_type, file_extension = sniffed_type
+    if content_type != image_file.content_type:
+        logger.info(f"UPLOAD_WIP_LOG - content_type declarado '{image_file.content_type}' difiere del detectado '{content_type}' para post {post_id}; se usa el detectado.")
+
+    # 4. El resto del archivo se reenvía a Storage trozo a trozo; si supera el máximo, se aborta la subida.
+    #    El sha256 se calcula sobre la marcha (deduplicación al confirmar, ver media_blobs).
+    upload_state = {"bytes_sent": 0, "too_large": False}
+    content_hasher = hashlib.sha256()
+
+    async def _upload_chunks():
+        chunk = first_chunk
+        while chunk:
+            upload_state["bytes_sent"] += len(chunk)
+            if upload_state["bytes_sent"] > max_file_size_bytes:
+                upload_state["too_large"] = True
+                raise ValueError(too_large_detail)
+            content_hasher.update(chunk)
+            yield chunk
+            chunk = await image_file.read(chunk_size)
+
+    if settings.MEDIA_CONTENT_ADDRESSED_STORAGE:
+        try:
+            await media_blobs.clear_wip_digest(supabase, post_id)
+        except Exception as e_digest:
+            logger.error(f"UPLOAD_WIP_LOG - Error limpiando el sha256 de la previsualización anterior del post {post_id}: {type(e_digest).__name__} - {e_digest}", exc_info=True)
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error al preparar la subida de la imagen de previsualización.")
+
     active_wip_storage_path = storage_service.get_wip_image_storage_path(
         organization_id=current_user.organization_id,
         post_id=post_id,
-        extension=file_extension # Usar la extensión determinada
+        extension=file_extension # Usar la extensión detectada
     )
     
-    logger.info(f"UPLOAD_WIP_LOG - Subiendo archivo '{original_filename}' (como '{active_wip_storage_path}') a WIP para post {post_id}. Content-type: '{content_type}', Bytes: {len(file_bytes)}")
+    logger.info(f"UPLOAD_WIP_LOG - Subiendo archivo '{original_filename}' (como '{active_wip_storage_path}') a WIP para post {post_id}. Content-type: '{content_type}', Bytes declarados: {image_file.size}")
     
     upload_start_time = datetime.now()
-    # 5. Subir el archivo a WIP usando el storage_service
-    public_url, uploaded_path, upload_error = await storage_service.upload_file_bytes_to_storage(
+    public_url, uploaded_path, upload_error = await storage_service.upload_file_stream_to_storage(
         supabase_client=supabase,
         bucket_name=storage_service.POST_PREVIEWS_BUCKET,
         file_path_in_bucket=active_wip_storage_path,
-        file_bytes=file_bytes,
-        content_type=content_type, # Content type del archivo
+        chunks=_upload_chunks(),
+        content_type=content_type,
         upsert=True, # Sobrescribe preview_active.{ext} si ya existe con esa extensión
         add_timestamp_to_url=True # Cache-busting para la URL de preview
     )
+    if upload_state["too_large"]:
+        logger.warning(f"UPLOAD_WIP_LOG - Subida abortada: el archivo superó {max_file_size_bytes} bytes para post {post_id}. Archivo: {original_filename}")
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=too_large_detail)
     upload_time_taken = (datetime.now() - upload_start_time).total_seconds()
-    logger.info(f"UPLOAD_WIP_LOG - Subida a WIP para post {post_id} tomó: {upload_time_taken:.4f}s. URL: {public_url}, Error: {upload_error}")
+    logger.info(f"UPLOAD_WIP_LOG - Subida a WIP para post {post_id} tomó: {upload_time_taken:.4f}s ({upload_state['bytes_sent']} bytes). URL: {public_url}, Error: {upload_error}")
 
     if upload_error or not public_url or not uploaded_path:
         logger.error(f"UPLOAD_WIP_LOG - Error subiendo archivo de usuario a WIP para post {post_id}: {upload_error}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al guardar la imagen de previsualización: {upload_error}")
 
+    if settings.MEDIA_CONTENT_ADDRESSED_STORAGE:
+        await media_blobs.record_wip_digest(supabase, post_id, content_hasher.hexdigest())
+
+    # 5. Las previsualizaciones anteriores de la carpeta WIP se borran vía outbox (no se espera al storage)
+    await _enqueue_stale_wip_cleanup(supabase, current_user.organization_id, post_id, uploaded_path, context="upload_wip_preview")
+
     response_payload = GeneratePreviewImageResponse(
         preview_image_url=public_url,
         preview_storage_path=uploaded_path,
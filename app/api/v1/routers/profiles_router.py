@@ -1,10 +1,11 @@
 # app/api/v1/routers/profiles_router.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import Optional, Dict, Any # Asegúrate de que Optional, Dict y Any estén aquí
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from typing import Optional, Dict, Any, Tuple # Asegúrate de que Optional, Dict y Any estén aquí
 from uuid import UUID
 
 from app.db.supabase_client import get_supabase_client, SupabaseClient
 from app.api.v1.dependencies.auth import get_current_user, TokenData
+from app.core.etag import if_none_match_matches, not_modified_response, set_etag_headers, weak_etag
 from app.models.profile_models import ProfileUpdate, ProfileResponse # Ajusta la ruta si es necesario
 from postgrest.exceptions import APIError
 import logging
@@ -19,11 +20,35 @@ router = APIRouter()
     tags=["Profiles"]
 )
 async def get_current_user_profile(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
     current_user: TokenData = Depends(get_current_user), # TokenData ya tiene user_id, org_id, role
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
     user_id = current_user.user_id
-    
+
+    # --- Bloque 0: Respuesta condicional (If-None-Match) ---
+    # La versión del perfil es el updated_at de 'profiles' + org/rol del token. Si el cliente ya la tiene,
+    # devolvemos 304 sin el select completo ni la llamada a auth.admin (la más cara del endpoint).
+    # Nota: un cambio de email en auth.users no toca profiles.updated_at; se verá en la siguiente edición del perfil.
+    if if_none_match:
+        try:
+            version_response = await supabase.table("profiles").select("updated_at").eq("id", str(user_id)).limit(1).execute()
+            profile_version = version_response.data[0].get("updated_at") if version_response.data else None
+            current_etag = weak_etag("profile", str(user_id), profile_version, current_user.organization_id, current_user.role)
+            if if_none_match_matches(if_none_match, current_etag):
+                return not_modified_response(current_etag)
+        except Exception as e_version:
+            logger.warning(f"PROFILE_ME - No se pudo comprobar la versión del perfil para {user_id}, se sigue con la carga completa: {type(e_version).__name__} - {e_version}")
+
+    validated_response, profile_etag = await _load_profile(current_user, supabase)
+    set_etag_headers(response, profile_etag)
+    return validated_response
+
+
+async def _load_profile(current_user: TokenData, supabase: SupabaseClient) -> Tuple[ProfileResponse, str]:
+    """Carga el perfil completo (profiles + email de auth.users + org/rol del token). Devuelve (perfil, ETag)."""
+    user_id = current_user.user_id
     profile_data_from_db: Optional[dict] = None
     user_email_from_auth: Optional[str] = None # Renombrado para claridad
 
@@ -31,12 +56,11 @@ async def get_current_user_profile(
 
     # --- Bloque 1: Obtener datos de la tabla 'profiles' ---
     try:
-        # SIN await (asumiendo comportamiento síncrono de .execute() en tu entorno)
-        profile_response = (
+        profile_response = await (
             supabase.table("profiles")
             .select("full_name, avatar_url, timezone, created_at, updated_at") # Seleccionar solo los campos de 'profiles'
             .eq("id", str(user_id))
-            .single() # .single() es síncrono
+            .single()
             .execute()
         )
         
@@ -74,7 +98,7 @@ async def get_current_user_profile(
         # Si `TokenData` ya tuviera el email, sería más directo.
         # Por ahora, mantendré tu lógica con get_user_by_id, asumiendo que `supabase` es un cliente admin.
 
-        auth_user_api_response = supabase.auth.admin.get_user_by_id(str(user_id))
+        auth_user_api_response = await supabase.auth.admin.get_user_by_id(str(user_id))
                 
         if auth_user_api_response and hasattr(auth_user_api_response, 'user') and auth_user_api_response.user and hasattr(auth_user_api_response.user, 'email'):
             user_email_from_auth = auth_user_api_response.user.email
@@ -111,8 +135,13 @@ async def get_current_user_profile(
     
     try:
         validated_response = ProfileResponse.model_validate(response_payload)
+        profile_etag = weak_etag(
+            "profile", str(user_id),
+            profile_data_from_db.get("updated_at") if profile_data_from_db else None,
+            current_user.organization_id, current_user.role
+        )
         logger.info(f"PROFILE_ME - Perfil devuelto exitosamente para user {user_id}.")
-        return validated_response
+        return validated_response, profile_etag
     except Exception as val_err: 
         logger.error(f"PROFILE_ME - Error al validar ProfileResponse para user {user_id}: {val_err}. Payload intentado: {response_payload}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error al procesar datos del perfil del usuario.")
@@ -127,6 +156,7 @@ async def get_current_user_profile(
 )
 async def update_current_user_profile(
     profile_data: ProfileUpdate,
+    response: Response,
     current_user: TokenData = Depends(get_current_user),
     supabase: SupabaseClient = Depends(get_supabase_client)
 ):
@@ -140,7 +170,7 @@ async def update_current_user_profile(
         )
     
     try:
-        update_response = (
+        update_response = await (
             supabase.table("profiles")
             .update(update_payload)
             .eq("id", str(user_id))
@@ -159,13 +189,12 @@ async def update_current_user_profile(
         
         # Si la actualización fue exitosa, obtener el perfil completo para devolverlo
         # (esto incluye el email de auth.users y cualquier campo no actualizado de profiles)
-        # Reutilizamos la lógica de get_current_user_profile.
-        # Asegúrate de que no haya await aquí si get_current_user_profile es una función normal
-        # y solo la llamada dentro de ella a supabase.execute() es síncrona.
-        # Como get_current_user_profile es async, necesitamos await.
+        # Reutilizamos la carga de GET /me (_load_profile) y devolvemos también el ETag nuevo.
         
         # print(f"DEBUG_PROFILE_PUT: Perfil actualizado, obteniendo datos completos para la respuesta.")
-        return await get_current_user_profile(current_user=current_user, supabase=supabase)
+        validated_response, profile_etag = await _load_profile(current_user, supabase)
+        set_etag_headers(response, profile_etag)
+        return validated_response
             
     except APIError as e:
         print(f"ERROR_PROFILE_PUT: APIError al actualizar perfil: Code={getattr(e, 'code', 'N/A')}, Msg='{getattr(e, 'message', str(e))}'")
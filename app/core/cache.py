@@ -0,0 +1,115 @@
+# app/core/cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Centinela para distinguir "no está en caché" de un valor cacheado que es None.
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Caché en memoria del proceso, acotada (LRU) y con expiración por entrada.
+
+    - `max_size`: al superarlo se descarta la entrada usada hace más tiempo.
+    - `ttl_seconds`: vida por defecto de cada entrada; `set()` acepta un TTL propio.
+    - `get_or_load()` colapsa los "misses" concurrentes de una misma clave en una sola carga.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]  # Expirada
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Elimina una clave. Una carga en curso para esa clave ya no escribirá su resultado."""
+        self._data.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._inflight.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Devuelve el valor cacheado o lo obtiene con `loader()`.
+        Si ya hay una carga en curso para `key`, espera su resultado en lugar de lanzar otra.
+        Las excepciones de `loader()` se propagan a todos los que esperan y no se cachean.
+        Si la carga en curso se cancela, los que esperaban no se cancelan: uno de ellos pasa a cargar.
+        """
+        while True:
+            value = self.get(key)
+            if value is not MISSING:
+                return value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise  # Cancelaron a quien espera, no a la carga
+
+        future = asyncio.get_running_loop().create_future()
+        # Evita el warning "exception was never retrieved" si nadie más esperaba esta carga.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            if self._inflight.get(key) is future:  # No fue invalidada mientras cargábamos
+                self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def values(self) -> List[Any]:
+        """Valores almacenados (incluidas entradas expiradas aún no purgadas). Para métricas."""
+        return [value for _, value in self._data.values()]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
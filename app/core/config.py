@@ -2,7 +2,7 @@
 import os
 # from dotenv import load_dotenv, find_dotenv # <--- QUITAR ESTAS LÍNEAS
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import Optional
+from typing import Dict, Optional
 
 # --- YA NO LLAMAMOS A load_dotenv() EXPLÍCITAMENTE AQUÍ ---
 # dotenv_path = find_dotenv(...)
@@ -18,6 +18,98 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str
     SUPABASE_JWT_SECRET: str
 
+    # Supabase - Pool HTTP del cliente asíncrono (opcionales, con defaults razonables)
+    SUPABASE_HTTP_MAX_CONNECTIONS: int = 100
+    SUPABASE_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    SUPABASE_HTTP_TIMEOUT_SECONDS: float = 30.0
+
+    # Auth - Caché de membresías (organization_members) por user_id. Sin invalidación: el TTL es la cota de
+    # cuánto tarda en verse un cambio de membresía o de rol.
+    MEMBERSHIP_CACHE_TTL_SECONDS: int = 60
+    MEMBERSHIP_CACHE_MAX_SIZE: int = 10000
+
+    # Auth - Caché de JWT ya verificados (cada entrada nunca sobrevive al 'exp' del token)
+    JWT_CACHE_MAX_SIZE: int = 10000
+    JWT_CACHE_MAX_TTL_SECONDS: int = 300
+
+    # Auth - Custom claims del access-token hook de Supabase. Si el token trae la organización,
+    # get_current_user no consulta organization_members.
+    JWT_ORGANIZATION_ID_CLAIM: str = "organization_id"
+    JWT_ORGANIZATION_ROLE_CLAIM: str = "user_role"
+
+    # Auth - Verificación asimétrica (RS256/ES256) contra un JWKS.
+    # URL http(s), "file://ruta" o ruta local. Si no se define, se usa el endpoint JWKS del proyecto Supabase.
+    JWT_JWKS_SOURCE: Optional[str] = None
+    JWT_JWKS_MIN_REFRESH_INTERVAL_SECONDS: int = 30
+
+    # Posts - Caché de respuestas de GET /posts por (org, autor, filtros, cursor). Cada escritura sobre
+    # posts sube la versión de la org en la tabla post_list_versions (trigger), compartida por todos los workers.
+    POST_LIST_CACHE_MAX_SIZE: int = 2000
+    POST_LIST_CACHE_TTL_SECONDS: int = 30
+
+    # Scheduler - Despachador de posts programados (app/services/post_scheduler.py).
+    # Puede correr dentro de la API (SCHEDULER_ENABLED) o como proceso aparte: python -m app.services.post_scheduler
+    SCHEDULER_ENABLED: bool = False
+    SCHEDULER_POLL_INTERVAL_SECONDS: float = 30.0
+    SCHEDULER_LOOKAHEAD_SECONDS: int = 600
+    SCHEDULER_BATCH_SIZE: int = 50
+    SCHEDULER_CLAIM_LEASE_SECONDS: int = 300
+    SCHEDULER_PUBLISHER: str = "local" # "local" (stand-in que solo loguea) o "pipeline" (publishing_pipeline)
+
+    # Publishing - Pipeline de publicación por red social (app/services/publishing_pipeline.py).
+    # Adaptador de red: "fake" (stand-in local). Políticas por red, en JSON, sobre los defaults de NetworkPolicy, ej.:
+    # PUBLISHING_NETWORK_POLICIES='{"instagram": {"max_concurrency": 2, "rate_per_second": 0.5, "max_attempts": 8}}'
+    PUBLISHING_ADAPTER: str = "fake"
+    PUBLISHING_NETWORK_POLICIES: Dict[str, Dict[str, float]] = {}
+    PUBLISHING_RETRY_POLL_INTERVAL_SECONDS: float = 15.0
+    PUBLISHING_RETRY_BATCH_SIZE: int = 50
+
+    # Storage - Outbox durable de borrados/purgas (app/services/storage_outbox.py).
+    # Backend: "supabase" (tabla storage_ops_outbox) o "sqlite" (stand-in local para desarrollo).
+    # El worker corre dentro de la API (STORAGE_OUTBOX_WORKER_ENABLED) o aparte: python -m app.services.storage_outbox
+    STORAGE_OUTBOX_BACKEND: str = "supabase"
+    STORAGE_OUTBOX_SQLITE_PATH: str = "storage_outbox.sqlite3"
+    STORAGE_OUTBOX_WORKER_ENABLED: bool = True
+    STORAGE_OUTBOX_POLL_INTERVAL_SECONDS: float = 5.0
+    STORAGE_OUTBOX_BATCH_SIZE: int = 500
+    STORAGE_OUTBOX_CLAIM_LEASE_SECONDS: int = 300
+    STORAGE_OUTBOX_MAX_ATTEMPTS: int = 8
+    STORAGE_OUTBOX_BACKOFF_BASE_SECONDS: float = 10.0
+    STORAGE_OUTBOX_BACKOFF_MAX_SECONDS: float = 3600.0
+    # Confirmación WIP -> media: copia entre buckets del lado del servidor (object/copy con destinationBucket).
+    # False solo para instancias de Storage que no soporten `destinationBucket` (vuelve a descargar y subir).
+    STORAGE_SERVER_SIDE_CROSS_BUCKET_COPY: bool = True
+
+    # Subida de imágenes de usuario a WIP (upload-wip-preview): se envían a Storage en streaming, por trozos.
+    WIP_UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    WIP_UPLOAD_CHUNK_SIZE: int = 256 * 1024
+
+    # Imágenes - Transcodificación y variantes de la imagen principal (app/services/image_variants.py), en un pool de procesos.
+    # Formato: "webp" o "avif" (si Pillow no soporta AVIF se usa WebP). Además de "full" (tamaño original), una variante por ancho máximo.
+    # IMAGE_VARIANTS_WIDTHS='{"thumbnail": 320, "medium": 1080}'
+    IMAGE_VARIANTS_ENABLED: bool = True
+    IMAGE_VARIANTS_FORMAT: str = "webp"
+    IMAGE_VARIANTS_QUALITY: int = 80
+    IMAGE_VARIANTS_WIDTHS: Dict[str, int] = {"thumbnail": 320, "medium": 1080}
+    IMAGE_VARIANTS_MAX_WORKERS: int = 2
+    # Las imágenes generadas por IA se guardan ya en el formato de IMAGE_VARIANTS_FORMAT en vez de PNG.
+    IMAGE_TRANSCODE_AI_OUTPUT: bool = True
+
+    # Medios - Deduplicación por contenido (app/services/media_blobs.py): cada imagen principal se guarda una vez
+    # por organización en {org}/blobs/{sha256}.{ext}, con contador de referencias en la tabla media_blobs.
+    MEDIA_CONTENT_ADDRESSED_STORAGE: bool = True
+    # Cuánto espera un request que adquiere un blob mientras el worker del outbox lo está borrando (luego lo vuelve a subir).
+    MEDIA_BLOB_REAP_WAIT_SECONDS: float = 10.0
+
+    # Idempotencia - Respuestas guardadas por Idempotency-Key (create_post y endpoints de IA).
+    # "supabase": tabla idempotency_keys compartida por todos los workers/réplicas (más una caché en memoria que
+    # colapsa los reintentos concurrentes del mismo worker). "memory": solo en memoria del worker (desarrollo, un worker).
+    IDEMPOTENCY_BACKEND: str = "supabase"
+    IDEMPOTENCY_CACHE_MAX_SIZE: int = 10000
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_LEASE_SECONDS: int = 300 # Si el worker que ejecuta se cae, otro puede tomar la clave tras este tiempo
+    IDEMPOTENCY_POLL_INTERVAL_SECONDS: float = 0.5 # Cada cuánto consulta un reintento que espera a otro worker
+
     # Google Gemini - Obligatoria
     GOOGLE_API_KEY: str
     
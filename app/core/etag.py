@@ -0,0 +1,49 @@
+# app/core/etag.py
+"""
+ETags débiles y respuestas condicionales (If-None-Match -> 304 Not Modified) para los endpoints de lectura.
+
+Los ETags se derivan de la *versión* del recurso (típicamente `updated_at`), no del JSON serializado:
+así el endpoint puede comparar contra una consulta barata (`select id, updated_at`) y, si el cliente ya
+tiene esa versión, responder 304 sin hacer el select completo ni serializar nada.
+"""
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Response, status
+
+# Datos autenticados: el navegador puede guardarlos, pero debe revalidar siempre con If-None-Match.
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*version_parts: Any) -> str:
+    """Construye `W/"<hash>"` a partir de las partes que identifican la versión (ids, updated_at, parámetros...)."""
+    raw = json.dumps(version_parts, default=str, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return f'W/"{hashlib.sha256(raw).hexdigest()[:32]}"'
+
+
+def if_none_match_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil (RFC 9110 §13.1.2): ignora el prefijo `W/` y acepta listas y `*`."""
+    if not if_none_match:
+        return False
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == target:
+            return True
+    return False
+
+
+def set_etag_headers(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+
+
+def not_modified_response(etag: str) -> Response:
+    """304 sin cuerpo; repite el ETag como exige la especificación."""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL},
+    )
@@ -0,0 +1,188 @@
+# app/core/idempotency.py
+"""
+Soporte de la cabecera `Idempotency-Key` para endpoints POST que crean recursos o pagan llamadas a IA.
+
+- La primera petición con una clave ejecuta el endpoint y su respuesta se guarda IDEMPOTENCY_TTL_SECONDS.
+- Un reintento con la misma clave (y el mismo payload) recibe la respuesta guardada, con la cabecera
+  `Idempotent-Replayed: true`, sin volver a ejecutar el endpoint.
+- Si la petición original sigue en curso, el reintento espera su resultado en vez de empezar otra ejecución.
+  Los errores no se guardan: un reintento tras un fallo vuelve a ejecutar. Si la original se cancela
+  (ej. el cliente se desconectó), la clave se libera y uno de los reintentos que esperaban pasa a ejecutar.
+- Reutilizar la clave con un payload distinto devuelve 422.
+
+Las claves se aíslan por endpoint y usuario. Con IDEMPOTENCY_BACKEND="supabase" (por defecto) se guardan en la
+tabla `idempotency_keys`, compartida por todos los workers y réplicas: un reintento que llega a otro worker
+recibe la respuesta original o espera a que termine. La caché en memoria (`TTLCache.get_or_load`) colapsa
+los reintentos concurrentes dentro del mismo worker y evita volver a consultar la tabla. Si la tabla no está
+disponible, se sigue solo con la caché del worker (y se loguea).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import uuid as uuid_pkg
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException, Response, status
+from fastapi.encoders import jsonable_encoder
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.db.supabase_client import get_supabase_client
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+_responses = TTLCache(max_size=settings.IDEMPOTENCY_CACHE_MAX_SIZE, ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+
+
+def _fingerprint(payload: Any) -> str:
+    raw = json.dumps(jsonable_encoder(payload), default=str, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+async def run_idempotent(
+    idempotency_key: Optional[str],
+    *,
+    scope: str,
+    principal: Optional[Hashable],
+    payload: Any,
+    response: Response,
+    handler: Callable[[], Awaitable[T]],
+) -> T:
+    """
+    Ejecuta `handler()` una sola vez por (scope, principal, idempotency_key). Sin clave, simplemente lo ejecuta.
+    `payload` identifica la petición (cuerpo y parámetros de ruta) para detectar claves reutilizadas.
+    """
+    if idempotency_key is None:
+        return await handler()
+    idempotency_key = idempotency_key.strip()
+    if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La cabecera 'Idempotency-Key' debe tener entre 1 y {IDEMPOTENCY_KEY_MAX_LENGTH} caracteres."
+        )
+
+    fingerprint = _fingerprint(payload)
+    cache_key = (scope, str(principal), idempotency_key)
+    executed_here = False
+
+    async def _load():
+        nonlocal executed_here
+        if settings.IDEMPOTENCY_BACKEND != "supabase":
+            executed_here = True
+            return fingerprint, await handler()
+        stored_fingerprint, result, replayed = await _run_shared(cache_key, fingerprint, handler)
+        executed_here = not replayed
+        return stored_fingerprint, result
+
+    while True:
+        try:
+            stored_fingerprint, result = await _responses.get_or_load(cache_key, _load)
+            break
+        except _PayloadMismatch as e_mismatch:
+            # No se cachea: solo se cachean resultados reales. Si esta petición esperaba la carga de otra con un
+            # payload distinto pero el suyo coincide con el guardado, vuelve a intentar (y recibe la respuesta guardada).
+            if e_mismatch.stored_fingerprint == fingerprint:
+                continue
+            stored_fingerprint, result = e_mismatch.stored_fingerprint, None
+            break
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="La 'Idempotency-Key' ya se usó con un payload distinto."
+        )
+    if not executed_here:
+        response.headers[REPLAYED_HEADER] = "true"
+    return result
+
+
+# --- Almacén compartido (tabla idempotency_keys) ---
+
+class _PayloadMismatch(Exception):
+    """La clave compartida ya se usó con otro payload. Se lanza (no se devuelve) para que la caché local no la guarde."""
+
+    def __init__(self, stored_fingerprint: str):
+        super().__init__(stored_fingerprint)
+        self.stored_fingerprint = stored_fingerprint
+
+
+async def _run_shared(cache_key: Tuple[str, str, str], fingerprint: str, handler: Callable[[], Awaitable[T]]) -> Tuple[str, Any, bool]:
+    """
+    Reclama la clave en la tabla compartida y ejecuta `handler()`, o devuelve la respuesta que guardó otro worker
+    (esperándola si sigue en curso). Devuelve (fingerprint guardado, resultado, si es una repetición).
+    """
+    owner_id = str(uuid_pkg.uuid4())
+    while True:
+        try:
+            claim = await _claim_shared(cache_key, fingerprint, owner_id)
+        except Exception as e:
+            logger.error(f"IDEMPOTENCY_LOG - Tabla idempotency_keys no disponible para {cache_key}; se sigue solo con la caché del worker: {type(e).__name__} - {e}")
+            return fingerprint, await handler(), False
+        if claim is None:
+            continue  # La clave se liberó entre el INSERT y la lectura: se vuelve a reclamar
+        if claim["claimed"]:
+            break
+        if claim["key_fingerprint"] != fingerprint:
+            raise _PayloadMismatch(claim["key_fingerprint"])
+        if claim["key_status"] == "completed":
+            return fingerprint, claim["key_response"], True
+        # En curso en otro worker: esperar su respuesta (o a que la libere o venza su lease).
+        await asyncio.sleep(settings.IDEMPOTENCY_POLL_INTERVAL_SECONDS)
+
+    try:
+        result = await handler()
+    except BaseException:
+        # Error o cancelación: no se guarda nada y la clave queda libre para que un reintento ejecute.
+        await asyncio.shield(_release_shared(cache_key, owner_id))
+        raise
+    await _complete_shared(cache_key, owner_id, result)
+    return fingerprint, result, False
+
+
+def _key_filters(query, cache_key: Tuple[str, str, str], owner_id: str):
+    scope, principal, idempotency_key = cache_key
+    return query.eq("scope", scope).eq("principal", principal).eq("idempotency_key", idempotency_key).eq("owner_id", owner_id)
+
+
+async def _claim_shared(cache_key: Tuple[str, str, str], fingerprint: str, owner_id: str) -> Optional[Dict[str, Any]]:
+    scope, principal, idempotency_key = cache_key
+    supabase = await get_supabase_client()
+    claim_res = await supabase.rpc("claim_idempotency_key", {
+        "p_scope": scope,
+        "p_principal": principal,
+        "p_idempotency_key": idempotency_key,
+        "p_fingerprint": fingerprint,
+        "p_owner_id": owner_id,
+        "p_lease_seconds": settings.IDEMPOTENCY_LEASE_SECONDS,
+        "p_ttl_seconds": settings.IDEMPOTENCY_TTL_SECONDS,
+    }).execute()
+    return claim_res.data[0] if claim_res.data else None
+
+
+async def _complete_shared(cache_key: Tuple[str, str, str], owner_id: str, result: Any) -> None:
+    """Guarda la respuesta para los reintentos de otros workers. Si falla, la clave queda en curso hasta que venza su lease."""
+    try:
+        supabase = await get_supabase_client()
+        await _key_filters(
+            supabase.table("idempotency_keys").update({"status": "completed", "response": jsonable_encoder(result), "locked_until": None}),
+            cache_key, owner_id
+        ).execute()
+    except Exception as e:
+        logger.error(f"IDEMPOTENCY_LOG - No se pudo guardar la respuesta de {cache_key} en idempotency_keys: {type(e).__name__} - {e}")
+
+
+async def _release_shared(cache_key: Tuple[str, str, str], owner_id: str) -> None:
+    try:
+        supabase = await get_supabase_client()
+        await _key_filters(supabase.table("idempotency_keys").delete(), cache_key, owner_id).eq("status", "in_progress").execute()
+    except Exception as e:
+        logger.error(f"IDEMPOTENCY_LOG - No se pudo liberar la clave {cache_key}; quedará en curso hasta que venza su lease: {type(e).__name__} - {e}")
+
+
+def stats() -> dict:
+    return _responses.stats()
@@ -0,0 +1,136 @@
+# app/core/jwks.py
+"""
+Caché en memoria de las claves públicas (JWKS) con las que Supabase firma los access tokens asimétricos
+(RS256 / ES256). Las claves se indexan por `kid`.
+
+El path de un request NUNCA hace red: si llega un `kid` desconocido se programa un refresco en segundo
+plano y ese token se rechaza; los siguientes requests ya encontrarán la clave rotada.
+
+La fuente del documento JWKS es intercambiable (`JWKSSource`): HTTP (el endpoint de Supabase o un
+stand-in local) o un archivo JSON, lo que permite probar sin conexión.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+# --- Fuentes del documento JWKS ---
+
+class JWKSSource:
+    """Interfaz: devuelve el documento JWKS completo ({"keys": [...]})."""
+
+    async def fetch(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class HttpJWKSSource(JWKSSource):
+    def __init__(self, url: str, timeout_seconds: float = 5.0):
+        self.url = url
+        self.timeout_seconds = timeout_seconds
+
+    async def fetch(self) -> Dict[str, Any]:
+        async with httpx.AsyncClient(timeout=self.timeout_seconds) as client:
+            response = await client.get(self.url)
+            response.raise_for_status()
+            return response.json()
+
+    def __repr__(self) -> str:
+        return f"HttpJWKSSource({self.url!r})"
+
+
+class FileJWKSSource(JWKSSource):
+    def __init__(self, path: str):
+        self.path = path
+
+    async def fetch(self) -> Dict[str, Any]:
+        def _read_sync() -> Dict[str, Any]:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return await asyncio.to_thread(_read_sync)
+
+    def __repr__(self) -> str:
+        return f"FileJWKSSource({self.path!r})"
+
+
+def build_jwks_source(spec: Optional[str]) -> JWKSSource:
+    """
+    Construye la fuente a partir de `JWT_JWKS_SOURCE`:
+    - `http(s)://...` -> HttpJWKSSource
+    - `file://...` o una ruta -> FileJWKSSource
+    - None -> endpoint JWKS del proyecto de Supabase.
+    """
+    if not spec:
+        return HttpJWKSSource(f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json")
+    if spec.startswith(("http://", "https://")):
+        return HttpJWKSSource(spec)
+    if spec.startswith("file://"):
+        return FileJWKSSource(spec[len("file://"):])
+    return FileJWKSSource(spec)
+
+
+# --- Caché de claves ---
+
+class JWKSKeyCache:
+    def __init__(self, source: JWKSSource, min_refresh_interval_seconds: float = 30.0):
+        self.source = source
+        self.min_refresh_interval_seconds = min_refresh_interval_seconds
+        self._keys_by_kid: Dict[str, Dict[str, Any]] = {}
+        self._last_refresh_attempt: float = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def get_key(self, kid: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Devuelve el JWK para `kid` o None. Nunca hace red: si el `kid` no se conoce,
+        programa un refresco en segundo plano (como mucho uno por intervalo mínimo).
+        """
+        key = self._keys_by_kid.get(kid) if kid else None
+        if key is None:
+            self.schedule_refresh()
+        return key
+
+    def schedule_refresh(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        if time.monotonic() - self._last_refresh_attempt < self.min_refresh_interval_seconds:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError: # Sin event loop (ej. script síncrono): no se puede refrescar en segundo plano
+            return
+        self._refresh_task = loop.create_task(self.refresh())
+
+    async def refresh(self) -> bool:
+        """Descarga el JWKS y reemplaza las claves conocidas. Devuelve False (y conserva las claves) si falla."""
+        self._last_refresh_attempt = time.monotonic()
+        try:
+            document = await self.source.fetch()
+            keys = {
+                jwk["kid"]: jwk
+                for jwk in document.get("keys", [])
+                if jwk.get("kid") and jwk.get("alg", SUPPORTED_ASYMMETRIC_ALGORITHMS[0]) in SUPPORTED_ASYMMETRIC_ALGORITHMS
+            }
+        except Exception as e:
+            logger.warning(f"JWKS - No se pudo refrescar el key set desde {self.source!r}: {type(e).__name__} - {e}")
+            return False
+        self._keys_by_kid = keys
+        logger.info(f"JWKS - Key set refrescado desde {self.source!r}. kids: {list(keys)}")
+        return True
+
+    def known_kids(self) -> list:
+        return list(self._keys_by_kid)
+
+
+jwks_key_cache = JWKSKeyCache(
+    source=build_jwks_source(settings.JWT_JWKS_SOURCE),
+    min_refresh_interval_seconds=settings.JWT_JWKS_MIN_REFRESH_INTERVAL_SECONDS,
+)
@@ -0,0 +1,73 @@
+# app/core/local_token_signer.py
+"""
+Firmador LOCAL de access tokens con la misma forma que los de Supabase, para desarrollo y pruebas.
+Permite incluir los custom claims de organización que normalmente añade el access-token hook.
+
+NO usar en producción: firma tokens sin pasar por Supabase Auth.
+
+Uso desde la raíz del proyecto:
+    python -m app.core.local_token_signer --user-id <uuid> --organization-id <uuid> --role admin
+    python -m app.core.local_token_signer --user-id <uuid> --private-jwk-file dev_private_jwk.json  # RS256/ES256
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from jose import jwt
+
+from app.core.config import settings
+
+
+def mint_access_token(
+    user_id: UUID,
+    organization_id: Optional[UUID] = None,
+    role: Optional[str] = None,
+    expires_in_seconds: int = 3600,
+    extra_claims: Optional[Dict[str, Any]] = None,
+    secret: Optional[str] = None,
+    private_jwk: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Devuelve un JWT con audiencia 'authenticated' y, opcionalmente, los claims de organización.
+    Por defecto firma HS256 con SUPABASE_JWT_SECRET; con `private_jwk` firma con su 'alg' (RS256/ES256)
+    y pone su 'kid' en la cabecera, para probar la verificación contra un JWKS local.
+    """
+    now = int(time.time())
+    claims: Dict[str, Any] = {
+        "sub": str(user_id),
+        "aud": "authenticated",
+        "role": "authenticated", # Rol de Postgres, igual que en los tokens reales de Supabase
+        "iat": now,
+        "exp": now + expires_in_seconds,
+    }
+    if organization_id is not None:
+        claims[settings.JWT_ORGANIZATION_ID_CLAIM] = str(organization_id)
+    if role is not None:
+        claims[settings.JWT_ORGANIZATION_ROLE_CLAIM] = role
+    if extra_claims:
+        claims.update(extra_claims)
+    if private_jwk is not None:
+        return jwt.encode(
+            claims,
+            private_jwk,
+            algorithm=private_jwk.get("alg", "RS256"),
+            headers={"kid": private_jwk["kid"]} if private_jwk.get("kid") else None,
+        )
+    return jwt.encode(claims, secret or settings.SUPABASE_JWT_SECRET, algorithm="HS256")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un access token local con claims de organización.")
+    parser.add_argument("--user-id", type=UUID, required=True)
+    parser.add_argument("--organization-id", type=UUID, default=None)
+    parser.add_argument("--role", default=None)
+    parser.add_argument("--expires-in", type=int, default=3600, help="Segundos de validez (default 3600).")
+    parser.add_argument("--private-jwk-file", default=None, help="JWK privado (JSON con 'kid' y 'alg') para firmar RS256/ES256.")
+    args = parser.parse_args()
+    private_jwk = None
+    if args.private_jwk_file:
+        with open(args.private_jwk_file, "r", encoding="utf-8") as f:
+            private_jwk = json.load(f)
+    print(mint_access_token(args.user_id, args.organization_id, args.role, args.expires_in, private_jwk=private_jwk))
@@ -0,0 +1,33 @@
+# app/core/rate_limit.py
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Limitador token-bucket para asyncio: `rate_per_second` tokens por segundo, hasta `capacity` acumulados
+    (ráfaga máxima). `acquire()` espera lo justo hasta que haya un token, sin busy-waiting.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        if rate_per_second <= 0 or capacity <= 0:
+            raise ValueError("rate_per_second y capacity deben ser positivos.")
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        # El lock hace que los que esperan se atiendan en orden de llegada.
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate_per_second)
+                self._refill()
+            self._tokens -= 1
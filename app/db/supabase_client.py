@@ -1,25 +1,71 @@
 # app/db/supabase_client.py
-from supabase import create_client, Client as LibSupabaseClient
+import asyncio
+from typing import Optional
+
+import httpx
+from supabase import acreate_client, AsyncClient as LibAsyncSupabaseClient
+from supabase.lib.client_options import AsyncClientOptions
+
 from app.core.config import settings
 
-SupabaseClient = LibSupabaseClient 
+# Todo el backend usa el cliente ASÍNCRONO: cada `await ... .execute()` libera el event loop
+# mientras PostgREST/Storage responden, en lugar de bloquear el worker de uvicorn.
+SupabaseClient = LibAsyncSupabaseClient
 
-# Inicializar el cliente de Supabase una vez
-# Si settings.SUPABASE_URL o settings.SUPABASE_KEY están vacíos, create_client fallará.
+# Si settings.SUPABASE_URL o settings.SUPABASE_KEY están vacíos, el cliente no puede crearse.
 # Asegúrate de que tu .env está configurado correctamente.
 if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
     raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env file or environment variables")
 
-supabase_client: SupabaseClient = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+# Cliente y pool HTTP compartidos por todo el proceso (se crean en el primer uso).
+_supabase_client: Optional[SupabaseClient] = None
+_http_client: Optional[httpx.AsyncClient] = None
+_init_lock = asyncio.Lock()
+
+
+def _build_pooled_http_client() -> httpx.AsyncClient:
+    """
+    Crea el httpx.AsyncClient con keep-alive que comparten PostgREST, Storage y Auth.
+    Reutilizar las conexiones evita un handshake TCP/TLS por cada consulta.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.SUPABASE_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        timeout=httpx.Timeout(settings.SUPABASE_HTTP_TIMEOUT_SECONDS),
+    )
+
 
-def get_supabase_client() -> SupabaseClient:
+async def get_supabase_client() -> SupabaseClient:
     """
-    Dependencia para obtener el cliente de Supabase.
-    En el futuro, podría manejar un pool de conexiones o configuraciones más avanzadas.
+    Dependencia para obtener el cliente asíncrono de Supabase.
+    El cliente se inicializa una sola vez (perezosamente) sobre un pool de conexiones HTTP compartido.
     """
-    return supabase_client
+    global _supabase_client, _http_client
+    if _supabase_client is not None:
+        return _supabase_client
+
+    async with _init_lock:
+        if _supabase_client is None:  # Otro request pudo inicializarlo mientras esperábamos el lock
+            _http_client = _build_pooled_http_client()
+            _supabase_client = await acreate_client(
+                settings.SUPABASE_URL,
+                settings.SUPABASE_KEY,
+                options=AsyncClientOptions(httpx_client=_http_client),
+            )
+    return _supabase_client
+
+
+async def close_supabase_client() -> None:
+    """Cierra el pool HTTP compartido. Se llama en el evento 'shutdown' de la aplicación."""
+    global _supabase_client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _supabase_client = None
 
 # Ejemplo de cómo podrías usarlo con el token del usuario si el frontend lo envía
 # y tu backend lo valida y luego lo pasa a Supabase para que RLS funcione:
-# def get_supabase_user_client(user_jwt: str) -> Client:
-#     return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY, options={"headers": {"Authorization": f"Bearer {user_jwt}"}})
\ No newline at end of file
+# async def get_supabase_user_client(user_jwt: str) -> SupabaseClient:
+#     return await acreate_client(settings.SUPABASE_URL, settings.SUPABASE_KEY, options=AsyncClientOptions(headers={"Authorization": f"Bearer {user_jwt}"}))
@@ -1,7 +1,7 @@
 # app/models/post_models.py
-from pydantic import BaseModel, Field, HttpUrl, ConfigDict, computed_field
-from typing import Optional, List, Dict, Any # Asegúrate que Any esté aquí
-from datetime import datetime
+from pydantic import BaseModel, Field, HttpUrl, ConfigDict, computed_field, model_validator
+from typing import Optional, List, Dict, Any, Literal # Asegúrate que Any esté aquí
+from datetime import date, datetime
 from uuid import UUID
 from enum import Enum
 
@@ -124,12 +124,24 @@ class PostUpdate(BaseModel):
         extra='forbid',
     )
 
+class MediaVariant(BaseModel):
+    storage_path: str = Field(..., description="Ruta de almacenamiento (sin bucket) de la variante en media.content.")
+    url: HttpUrl
+    width: int
+    height: int
+    content_type: str = Field(..., examples=["image/webp"])
+
 class PostResponse(PostBase):
     id: UUID
     organization_id: UUID
     author_user_id: UUID
     status: str
     media_storage_path: Optional[str] = Field(None, description="Ruta de almacenamiento (sin bucket) de la imagen principal, si existe.")
+    media_variants: Optional[Dict[str, MediaVariant]] = Field(
+        None,
+        description="Versiones optimizadas de la imagen principal por tamaño ('full', 'medium', 'thumbnail'). "
+                    "Null mientras se generan o si el post no tiene imagen: usar media_url."
+    )
     created_at: datetime
     updated_at: datetime
     published_at: Optional[datetime] = None
@@ -138,4 +150,128 @@ class PostResponse(PostBase):
     generation_group_id: Optional[UUID] = None
     original_post_id: Optional[UUID] = None
     
-    model_config = ConfigDict(from_attributes=True, extra='ignore')
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True, extra='ignore')
+
+
+# Columnas que se pueden pedir con `fields=` en los endpoints de lectura (sparse fieldsets).
+POST_SELECTABLE_FIELDS = frozenset(PostResponse.model_fields)
+# Proyección por defecto de las lecturas de posts: las columnas de PostResponse, en vez de "*",
+# para no arrastrar columnas internas como `search_vector`.
+POST_DEFAULT_SELECT = ",".join(PostResponse.model_fields)
+
+class PostPartialResponse(BaseModel):
+    """
+    Misma forma que PostResponse pero con todos los campos opcionales: con `fields=` el endpoint
+    solo devuelve (y solo pide a la DB) las columnas solicitadas; sin `fields=` devuelve el post completo.
+    """
+    id: Optional[UUID] = None
+    organization_id: Optional[UUID] = None
+    author_user_id: Optional[UUID] = None
+    title: Optional[str] = None
+    content_text: Optional[str] = None
+    social_network: Optional[str] = None
+    content_type: Optional[str] = None
+    media_url: Optional[HttpUrl] = None
+    media_storage_path: Optional[str] = None
+    media_variants: Optional[Dict[str, MediaVariant]] = None
+    status: Optional[str] = None
+    scheduled_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    published_at: Optional[datetime] = None
+    deleted_at: Optional[datetime] = None
+    prompt_id: Optional[UUID] = None
+    generation_group_id: Optional[UUID] = None
+    original_post_id: Optional[UUID] = None
+
+    model_config = ConfigDict(from_attributes=True, extra='ignore')
+
+class PostFacetsResponse(BaseModel):
+    """Conteos de posts agrupados por faceta (para el dashboard), calculados en una sola consulta."""
+    total: int = 0
+    status: Dict[str, int] = Field(default_factory=dict)
+    social_network: Dict[str, int] = Field(default_factory=dict)
+    content_type: Dict[str, int] = Field(default_factory=dict)
+    deleted: Dict[str, int] = Field(default_factory=dict, description="Conteos 'not_deleted' / 'deleted' del rango, independientes de 'deleted_filter'.")
+
+
+# --- OPERACIONES EN LOTE (POST /posts/bulk) ---
+
+class PostBulkOperation(BaseModel):
+    """
+    Una operación del lote. Según `op`:
+    - 'create': requiere `data`.
+    - 'update_status': requiere `post_id` y `status`.
+    - 'soft_delete': requiere `post_id`.
+    """
+    op: Literal["create", "update_status", "soft_delete"]
+    post_id: Optional[UUID] = None
+    status: Optional[str] = None
+    data: Optional[PostCreate] = None
+    model_config = ConfigDict(extra='forbid')
+
+    @model_validator(mode='after')
+    def _check_required_fields(self):
+        if self.op == "create" and self.data is None:
+            raise ValueError("La operación 'create' requiere 'data'.")
+        if self.op in ("update_status", "soft_delete") and self.post_id is None:
+            raise ValueError(f"La operación '{self.op}' requiere 'post_id'.")
+        if self.op == "update_status" and not self.status:
+            raise ValueError("La operación 'update_status' requiere 'status'.")
+        return self
+
+class PostBulkRequest(BaseModel):
+    operations: List[PostBulkOperation] = Field(..., min_length=1, max_length=100)
+    model_config = ConfigDict(extra='forbid')
+
+class PostBulkItemResult(BaseModel):
+    index: int = Field(..., description="Posición de la operación en 'operations'.")
+    op: str
+    post_id: Optional[UUID] = None
+    success: bool
+    error: Optional[str] = None
+    post: Optional[PostResponse] = None
+
+class PostBulkResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[PostBulkItemResult]
+
+
+
+# --- CLONADO DE POSTS (POST /posts/{post_id}/clone) ---
+
+class PostCloneRequest(BaseModel):
+    social_networks: Optional[List[str]] = Field(
+        None,
+        min_length=1,
+        max_length=20,
+        description="Redes destino: se crea un clon por cada una. Si se omite, se crea un único clon en la misma red del original."
+    )
+    model_config = ConfigDict(extra='forbid')
+
+class PostCloneResponse(BaseModel):
+    generation_group_id: UUID = Field(..., description="Grupo compartido por todos los clones (el del original si ya tenía uno).")
+    posts: List[PostResponse]
+
+# --- CALENDARIO DE CONTENIDO (GET /posts/calendar) ---
+
+class CalendarPostSummary(BaseModel):
+    id: UUID
+    title: Optional[str] = None
+    status: Optional[str] = None
+    social_network: Optional[str] = None
+    content_type: Optional[str] = None
+    scheduled_at: datetime
+
+class CalendarDay(BaseModel):
+    day: date = Field(..., description="Día local (en la zona horaria del usuario) de scheduled_at.")
+    total: int
+    by_status: Dict[str, int] = Field(default_factory=dict)
+    posts: List[CalendarPostSummary] = Field(default_factory=list, description="Primeros posts del día por hora programada (hasta 'max_posts_per_day').")
+
+class PostCalendarResponse(BaseModel):
+    timezone: str
+    date_from: date
+    date_to: date
+    days: List[CalendarDay]
@@ -19,6 +19,7 @@ from app.services.ai_prompt_helpers import (
     get_stylistic_context,
     get_formatting_context
 )
+from app.services import post_list_cache
 
 logger = logging.getLogger(__name__)
 
@@ -322,10 +323,10 @@ async def create_draft_post_from_ia(
     data_to_insert['status'] = 'draft'
 
     try:
-        response = await asyncio.to_thread(
+        response = await (
             supabase_client.table("posts")
             .insert(data_to_insert)
-            .execute
+            .execute()
         )
         
         if not response.data:
@@ -336,6 +337,7 @@ async def create_draft_post_from_ia(
                 error_message = f"Error de Supabase al crear post: {response.error.message}"
             raise RuntimeError(error_message)
             
+        post_list_cache.bump_org_version(organization_id)
         logger.info(f"Post creado exitosamente con ID: {response.data[0].get('id')}")
         return response.data[0] # Devuelve el primer (y único) post creado
         
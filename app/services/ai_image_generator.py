@@ -1,5 +1,6 @@
 # app/services/ai_image_generator.py
 import base64
+import hashlib
 import logging
 import uuid as uuid_pkg # Renombrado para evitar conflicto con el tipo UUID
 from typing import Optional, Tuple, Dict, Any # Asegúrate que Dict esté
@@ -12,7 +13,7 @@ from app.core.config import settings # Para OPENAI_API_KEY y otras configuracion
 
 # Importaciones de Supabase y Servicios
 from app.db.supabase_client import SupabaseClient # Tipo para el cliente de Supabase
-from app.services import storage_service # Nuestro servicio de storage
+from app.services import image_variants, media_blobs, storage_service # Nuestro servicio de storage
 from app.services.ai_prompt_helpers import get_brand_identity_context
 
 # --- Configuración del Logger ---
@@ -126,6 +127,12 @@ async def generate_and_upload_ai_image_to_wip(
         logger.error(f"Error inesperado decodificando para WIP (post {post_id}): {e_unexp_decode}", exc_info=True)
         return None, None, None, None, "Error inesperado al decodificar imagen."
 
+    # Paso 2b: Transcodificar (WebP/AVIF, sin metadatos) en el pool de procesos en vez de guardar el PNG completo
+    if settings.IMAGE_TRANSCODE_AI_OUTPUT:
+        try:
+            image_bytes, img_content_type, img_extension = await image_variants.transcode_image(image_bytes)
+        except Exception as e_transcode:
+            logger.warning(f"No se pudo transcodificar la imagen IA para WIP (post {post_id}); se guarda como PNG: {type(e_transcode).__name__} - {e_transcode}")
 
     # Paso 3: Definir la ruta de almacenamiento en la carpeta '/wip/'
     # La limpieza de la carpeta WIP la hará el router ANTES de llamar a esta función.
@@ -135,7 +142,13 @@ async def generate_and_upload_ai_image_to_wip(
         extension=img_extension
     )
     
-    # Paso 4: Subir los bytes de la imagen a la carpeta '/wip/'
+    # Paso 4: Subir los bytes de la imagen a la carpeta '/wip/' (con su sha256 para deduplicar al confirmar)
+    if settings.MEDIA_CONTENT_ADDRESSED_STORAGE:
+        try:
+            await media_blobs.clear_wip_digest(supabase_client, post_id)
+        except Exception as e_digest:
+            logger.error(f"Error limpiando el sha256 de la previsualización anterior (post {post_id}): {type(e_digest).__name__} - {e_digest}", exc_info=True)
+            return None, None, None, None, "Error al preparar la previsualización en WIP."
     public_url, uploaded_path, upload_error = await storage_service.upload_file_bytes_to_storage(
         supabase_client=supabase_client,
         bucket_name=storage_service.POST_PREVIEWS_BUCKET, # Bucket de previews/wip
@@ -149,6 +162,8 @@ async def generate_and_upload_ai_image_to_wip(
     if upload_error or not public_url or not uploaded_path:
         logger.error(f"Error subiendo imagen IA generada a WIP (post {post_id}, path {active_wip_storage_path}): {upload_error}")
         return None, None, None, None, upload_error or "Error desconocido al guardar imagen en WIP."
+    if settings.MEDIA_CONTENT_ADDRESSED_STORAGE:
+        await media_blobs.record_wip_digest(supabase_client, post_id, hashlib.sha256(image_bytes).hexdigest())
 
     logger.info(f"Imagen IA para WIP (post {post_id}) subida a {uploaded_path}. URL: {public_url}")
     return public_url, uploaded_path, img_extension, img_content_type, None
@@ -202,26 +217,40 @@ async def generate_image_from_prompt(
     except (TypeError, ValueError) as e_decode:
         logger.error(f"Error decodificando imagen base64 para FINAL (post {post_id}): {e_decode}", exc_info=True)
         return None, None, "Error procesando datos de imagen generada (decodificación fallida)."
+
+    # Paso 2b: Transcodificar (WebP/AVIF, sin metadatos) en el pool de procesos en vez de guardar el PNG completo
+    if settings.IMAGE_TRANSCODE_AI_OUTPUT:
+        try:
+            image_bytes, img_content_type, img_extension = await image_variants.transcode_image(image_bytes)
+        except Exception as e_transcode:
+            logger.warning(f"No se pudo transcodificar la imagen IA FINAL (post {post_id}); se guarda como PNG: {type(e_transcode).__name__} - {e_transcode}")
     
     # ... (El resto de la función (pasos 3 y 4) permanece igual) ...
-    # Paso 3: Definir la ruta de almacenamiento FINAL en `post_media`
-    unique_image_filename = f"{uuid_pkg.uuid4()}.{img_extension}"
-    final_storage_path = storage_service.get_post_media_storage_path(
-        organization_id=organization_id,
-        post_id=post_id,
-        final_filename_with_extension=unique_image_filename
-    )
-    
-    # Paso 4: Subir los bytes de la imagen a `post_media`
-    public_url, uploaded_path, upload_error = await storage_service.upload_file_bytes_to_storage(
-        supabase_client=supabase_client,
-        bucket_name=storage_service.POST_MEDIA_BUCKET,
-        file_path_in_bucket=final_storage_path,
-        file_bytes=image_bytes,
-        content_type=img_content_type,
-        upsert=False,
-        add_timestamp_to_url=False
-    )
+    if settings.MEDIA_CONTENT_ADDRESSED_STORAGE:
+        # Pasos 3 y 4 con deduplicación: al blob de su contenido; si la organización ya la tenía, no se vuelve a subir
+        final_storage_path = None
+        public_url, uploaded_path, upload_error = await media_blobs.ensure_blob_from_bytes(
+            supabase_client, organization_id, image_bytes, img_content_type, img_extension
+        )
+    else:
+        # Paso 3: Definir la ruta de almacenamiento FINAL en `post_media`
+        unique_image_filename = f"{uuid_pkg.uuid4()}.{img_extension}"
+        final_storage_path = storage_service.get_post_media_storage_path(
+            organization_id=organization_id,
+            post_id=post_id,
+            final_filename_with_extension=unique_image_filename
+        )
+
+        # Paso 4: Subir los bytes de la imagen a `post_media`
+        public_url, uploaded_path, upload_error = await storage_service.upload_file_bytes_to_storage(
+            supabase_client=supabase_client,
+            bucket_name=storage_service.POST_MEDIA_BUCKET,
+            file_path_in_bucket=final_storage_path,
+            file_bytes=image_bytes,
+            content_type=img_content_type,
+            upsert=False,
+            add_timestamp_to_url=False
+        )
 
     if upload_error or not public_url or not uploaded_path:
         logger.error(f"Error subiendo imagen IA generada a FINAL (post {post_id}, path {final_storage_path}): {upload_error}")
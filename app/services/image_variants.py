@@ -0,0 +1,232 @@
+# app/services/image_variants.py
+"""
+Optimización de imágenes: transcodificación a WebP/AVIF y variantes responsive de la imagen principal.
+
+- Todo el trabajo de CPU (decodificar, redimensionar, codificar) corre en un `ProcessPoolExecutor`:
+  el event loop de la API nunca queda bloqueado por Pillow.
+- Las variantes ("full" a tamaño original, más las de IMAGE_VARIANTS_WIDTHS, ej. "thumbnail" y "medium")
+  se guardan junto a la imagen principal en `media.content` y se registran en `posts.media_variants`:
+      {"thumbnail": {"storage_path", "url", "width", "height", "content_type"}, ...}
+  para que el frontend pida el tamaño adecuado en vez de la imagen original.
+- Se descartan los metadatos (EXIF, ICC, XMP); la orientación EXIF se aplica antes de descartarla.
+
+Las variantes se generan en segundo plano (`schedule_post_media_variants`) después de que el post
+ya apunta a su nueva imagen; mientras tanto `media_variants` es null y el frontend usa `media_url`.
+"""
+import asyncio
+import io
+import logging
+import uuid as uuid_pkg
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from PIL import Image, ImageOps, features
+
+from app.core.config import settings
+from app.db.supabase_client import SupabaseClient, get_supabase_client
+from app.services import post_list_cache, storage_outbox, storage_service
+from app.services.storage_outbox import OP_DELETE, StorageOp
+
+logger = logging.getLogger(__name__)
+
+FULL_VARIANT = "full"
+
+_FORMATS = {
+    # formato -> (nombre para Pillow, content_type, extensión)
+    "webp": ("WEBP", "image/webp", "webp"),
+    "avif": ("AVIF", "image/avif", "avif"),
+}
+
+
+def output_format() -> Tuple[str, str, str]:
+    """(formato Pillow, content_type, extensión) según IMAGE_VARIANTS_FORMAT; AVIF cae a WebP si Pillow no lo soporta."""
+    name = settings.IMAGE_VARIANTS_FORMAT.lower()
+    if name == "avif" and not features.check("avif"):
+        logger.warning("IMAGE_LOG - Pillow no tiene soporte AVIF en este entorno; se usará WebP.")
+        name = "webp"
+    return _FORMATS.get(name, _FORMATS["webp"])
+
+
+# --- Trabajo de CPU (se ejecuta en los procesos del pool; funciones de módulo para poder serializarlas) ---
+
+def _open_clean(image_bytes: bytes) -> Image.Image:
+    """Abre la imagen (primer frame si es animada), aplica la orientación EXIF y descarta metadatos."""
+    with Image.open(io.BytesIO(image_bytes)) as source:
+        source.seek(0)
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P", "PA") else "RGB")
+    image.info = {}
+    return image
+
+
+def _encode(image: Image.Image, pillow_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=pillow_format, quality=quality)
+    return buffer.getvalue()
+
+
+def _transcode(image_bytes: bytes, pillow_format: str, quality: int) -> Tuple[bytes, int, int]:
+    image = _open_clean(image_bytes)
+    return _encode(image, pillow_format, quality), image.width, image.height
+
+
+def _render_variants(image_bytes: bytes, pillow_format: str, quality: int, widths: Dict[str, int]) -> Dict[str, Tuple[bytes, int, int]]:
+    """Devuelve {variante: (bytes, ancho, alto)}. Nunca agranda: si la imagen ya es más chica, la variante queda a su tamaño."""
+    image = _open_clean(image_bytes)
+    rendered = {FULL_VARIANT: (_encode(image, pillow_format, quality), image.width, image.height)}
+    for name, max_width in widths.items():
+        if image.width > max_width:
+            resized = image.resize((max_width, max(1, round(image.height * max_width / image.width))), Image.Resampling.LANCZOS)
+        else:
+            resized = image
+        rendered[name] = (_encode(resized, pillow_format, quality), resized.width, resized.height)
+    return rendered
+
+
+# --- Pool de procesos ---
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANTS_MAX_WORKERS)
+    return _process_pool
+
+
+async def _run_in_pool(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_get_process_pool(), func, *args)
+
+
+async def transcode_image(image_bytes: bytes) -> Tuple[bytes, str, str]:
+    """
+    Transcodifica una imagen al formato configurado, a tamaño original y sin metadatos.
+    Devuelve (bytes, content_type, extensión). Lanza la excepción de Pillow si la imagen no se puede leer.
+    """
+    pillow_format, content_type, extension = output_format()
+    transcoded_bytes, _width, _height = await _run_in_pool(_transcode, image_bytes, pillow_format, settings.IMAGE_VARIANTS_QUALITY)
+    logger.debug(f"IMAGE_LOG - Transcodificada a {content_type}: {len(image_bytes)} -> {len(transcoded_bytes)} bytes.")
+    return transcoded_bytes, content_type, extension
+
+
+# --- Rutas de variantes ---
+
+def variant_storage_path(organization_id: UUID, post_id: UUID, stem: str, variant: str, extension: str) -> str:
+    return storage_service.get_post_media_storage_path(organization_id, post_id, f"{stem}_{variant}.{extension}")
+
+
+def variant_storage_paths(media_variants: Optional[Dict[str, Any]]) -> List[str]:
+    """Rutas (en POST_MEDIA_BUCKET) de las variantes registradas en `posts.media_variants`."""
+    return [variant["storage_path"] for variant in (media_variants or {}).values() if variant.get("storage_path")]
+
+
+def relocate_variants(media_variants: Optional[Dict[str, Any]], organization_id: UUID, post_id: UUID) -> Tuple[Dict[str, Dict[str, Any]], List[Tuple[str, str]]]:
+    """
+    Para copiar las variantes de un post a otro (ej. al clonar): devuelve el dict de variantes con las
+    rutas nuevas (sin `url`, que se completa tras copiar) y la lista de copias (origen, destino) a hacer.
+    """
+    stem = str(uuid_pkg.uuid4())
+    relocated: Dict[str, Dict[str, Any]] = {}
+    copies: List[Tuple[str, str]] = []
+    for name, variant in (media_variants or {}).items():
+        extension = variant["storage_path"].rsplit(".", 1)[-1]
+        destination_path = variant_storage_path(organization_id, post_id, stem, name, extension)
+        relocated[name] = {**variant, "storage_path": destination_path}
+        copies.append((variant["storage_path"], destination_path))
+    return relocated, copies
+
+
+# --- Generación de variantes de la imagen principal de un post ---
+
+async def generate_post_media_variants(
+    supabase: SupabaseClient,
+    organization_id: UUID,
+    post_id: UUID,
+    media_storage_path: str
+) -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Descarga la imagen principal, genera sus variantes en el pool de procesos, las sube en paralelo y
+    las registra en `posts.media_variants`. Solo actualiza el post si sigue apuntando a `media_storage_path`;
+    si la imagen cambió mientras tanto, las variantes recién subidas se encolan para borrado.
+    """
+    image_bytes = await supabase.storage.from_(storage_service.POST_MEDIA_BUCKET).download(media_storage_path)
+    pillow_format, content_type, extension = output_format()
+    rendered = await _run_in_pool(_render_variants, image_bytes, pillow_format, settings.IMAGE_VARIANTS_QUALITY, dict(settings.IMAGE_VARIANTS_WIDTHS))
+
+    stem = media_storage_path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    names = list(rendered)
+    upload_results = await asyncio.gather(*(
+        storage_service.upload_file_bytes_to_storage(
+            supabase_client=supabase,
+            bucket_name=storage_service.POST_MEDIA_BUCKET,
+            file_path_in_bucket=variant_storage_path(organization_id, post_id, stem, name, extension),
+            file_bytes=rendered[name][0],
+            content_type=content_type,
+            upsert=True
+        )
+        for name in names
+    ))
+
+    media_variants: Dict[str, Dict[str, Any]] = {}
+    upload_errors = []
+    for name, (public_url, uploaded_path, upload_error) in zip(names, upload_results):
+        if upload_error or not uploaded_path:
+            upload_errors.append(upload_error)
+            continue
+        _bytes, width, height = rendered[name]
+        media_variants[name] = {"storage_path": uploaded_path, "url": public_url, "width": width, "height": height, "content_type": content_type}
+    if upload_errors:
+        await storage_outbox.enqueue([StorageOp(OP_DELETE, storage_service.POST_MEDIA_BUCKET, path, post_id, "media_variants_rollback") for path in variant_storage_paths(media_variants)])
+        raise RuntimeError(f"No se pudieron subir {len(upload_errors)} variantes: {upload_errors[0]}")
+
+    update_res = await (
+        supabase.table("posts")
+        .update({"media_variants": media_variants})
+        .eq("id", str(post_id))
+        .eq("media_storage_path", media_storage_path)
+        .execute()
+    )
+    if not update_res.data:
+        logger.info(f"IMAGE_LOG - La imagen principal del post {post_id} cambió mientras se generaban sus variantes; se descartan.")
+        await storage_outbox.enqueue([StorageOp(OP_DELETE, storage_service.POST_MEDIA_BUCKET, path, post_id, "media_variants_stale") for path in variant_storage_paths(media_variants)])
+        return None
+
+    post_list_cache.bump_org_version(organization_id)
+    original_size = len(image_bytes)
+    logger.info(
+        f"IMAGE_LOG - Variantes de {media_storage_path} generadas para post {post_id}: "
+        + ", ".join(f"{name} {rendered[name][1]}x{rendered[name][2]} ({len(rendered[name][0])} bytes)" for name in names)
+        + f"; original {original_size} bytes."
+    )
+    return media_variants
+
+
+# --- Ejecución en segundo plano ---
+
+_pending_tasks: Set[asyncio.Task] = set()
+
+async def _generate_in_background(organization_id: UUID, post_id: UUID, media_storage_path: str) -> None:
+    try:
+        await generate_post_media_variants(await get_supabase_client(), organization_id, post_id, media_storage_path)
+    except Exception as e:
+        logger.error(f"IMAGE_LOG - Error generando variantes de {media_storage_path} para post {post_id}: {type(e).__name__} - {e}", exc_info=True)
+
+
+def schedule_post_media_variants(organization_id: UUID, post_id: UUID, media_storage_path: str) -> None:
+    """Lanza la generación de variantes sin esperarla (el request responde enseguida). No lanza excepciones."""
+    if not settings.IMAGE_VARIANTS_ENABLED:
+        return
+    task = asyncio.create_task(_generate_in_background(organization_id, post_id, media_storage_path))
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+
+
+async def shutdown() -> None:
+    """Espera las generaciones en curso y cierra el pool de procesos (se llama al apagar la API)."""
+    global _process_pool
+    if _pending_tasks:
+        await asyncio.gather(*list(_pending_tasks), return_exceptions=True)
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True)
+        _process_pool = None
@@ -0,0 +1,217 @@
+# app/services/media_blobs.py
+"""
+Deduplicación de medios por contenido (content-addressed storage).
+
+Con MEDIA_CONTENT_ADDRESSED_STORAGE, la imagen principal de un post se guarda una sola vez por organización
+en `{organization_id}/blobs/{sha256}.{ext}` (bucket media.content) en lugar de una copia por post en
+`{organization_id}/posts/{post_id}/images/{uuid}.{ext}`. La tabla `media_blobs` cuenta las referencias:
+
+- `acquire` suma referencias (RPC `acquire_media_blob`) y dice si el objeto ya está subido (`ready`). Un blob
+  listo se reutiliza; si no, quien lo adquiere lo copia o sube él mismo (mismo contenido: sobrescribir es
+  inocuo) y lo marca listo (RPC `mark_media_blob_ready`). Nunca se devuelve la ruta de un blob que no está listo.
+- `release_ops` resta referencias (RPC `release_media_blobs`) y devuelve las operaciones del outbox a encolar:
+  `delete` para las rutas por post de siempre y `delete_blob` para los blobs. El worker del outbox solo borra un
+  blob si, al ejecutar la operación, sigue sin referencias: `reap_media_blobs` bloquea esas filas y las marca en
+  borrado, y `finish_reap_media_blobs` las elimina tras borrar el objeto. Mientras dura el borrado, un blob
+  no se puede marcar listo: quien lo adquiere espera y lo vuelve a subir.
+- Cuando un post deja de usar su imagen (la cambia o se borra), la referencia la suelta el trigger de posts
+  (migración 20261016001300) en la misma transacción; `release_ops` queda para los rollbacks y las
+  referencias extra que no cambian la fila.
+
+El sha256 de la previsualización WIP se calcula mientras se sube y se guarda en `posts.wip_media_sha256`:
+confirmarla sigue siendo una copia del lado del servidor, directo a su blob.
+"""
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple
+from uuid import UUID
+
+from app.core.config import settings
+from app.db.supabase_client import SupabaseClient
+from app.services import storage_outbox, storage_service
+from app.services.storage_outbox import OP_DELETE, OP_DELETE_BLOB, StorageOp
+
+logger = logging.getLogger(__name__)
+
+_REAP_POLL_SECONDS = 0.5
+
+_BLOB_PATH_RE = re.compile(rf"^([0-9a-f-]{{36}})/{storage_service.MEDIA_BLOBS_FOLDER_NAME}/([0-9a-f]{{64}})\.[a-z0-9]+$")
+
+
+def parse_blob_path(storage_path: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Devuelve (organization_id, sha256) si `storage_path` es un blob deduplicado; si no, None."""
+    match = _BLOB_PATH_RE.match(storage_path or "")
+    return (match.group(1), match.group(2)) if match else None
+
+
+def is_blob_path(storage_path: Optional[str]) -> bool:
+    return parse_blob_path(storage_path) is not None
+
+
+# --- Referencias ---
+
+async def acquire(supabase: SupabaseClient, storage_path: str, count: int = 1) -> bool:
+    """Suma `count` referencias al blob (lo registra si no existía). Devuelve si el objeto ya está subido (`ready`)."""
+    organization_id, sha256_hex = parse_blob_path(storage_path)
+    acquire_res = await supabase.rpc("acquire_media_blob", {
+        "p_storage_path": storage_path,
+        "p_organization_id": organization_id,
+        "p_sha256": sha256_hex,
+        "p_count": count,
+    }).execute()
+    return bool(acquire_res.data[0]["ready"])
+
+
+async def _mark_ready(supabase: SupabaseClient, storage_path: str) -> bool:
+    """Marca el blob como subido. False si el worker del outbox lo está borrando: hay que esperar y volver a subirlo."""
+    mark_res = await supabase.rpc("mark_media_blob_ready", {"p_storage_path": storage_path}).execute()
+    return bool(mark_res.data)
+
+
+async def release_ops(supabase: SupabaseClient, references: List[Tuple[str, Optional[UUID]]], context: str) -> List[StorageOp]:
+    """
+    Libera una referencia por cada (ruta en POST_MEDIA_BUCKET, post_id) y devuelve las operaciones de borrado a
+    encolar. Las rutas que no son blobs se borran como siempre. No lanza excepciones: si la RPC falla, los blobs
+    conservan sus referencias (quedan huérfanos en vez de arriesgar borrar uno en uso).
+    """
+    ops = [StorageOp(OP_DELETE, storage_service.POST_MEDIA_BUCKET, path, post_id, context) for path, post_id in references if not is_blob_path(path)]
+    blob_references = [(path, post_id) for path, post_id in references if is_blob_path(path)]
+    if not blob_references:
+        return ops
+    try:
+        await supabase.rpc("release_media_blobs", {"p_storage_paths": [path for path, _post_id in blob_references]}).execute()
+    except Exception as e:
+        logger.error(f"MEDIA_BLOBS_LOG - No se pudieron liberar {len(blob_references)} referencias ({context}): {type(e).__name__} - {e}. Blobs: {blob_references}")
+        return ops
+    ops.extend(
+        StorageOp(OP_DELETE_BLOB, storage_service.POST_MEDIA_BUCKET, path, post_id, context)
+        for path, post_id in dict(blob_references).items()
+    )
+    return ops
+
+
+async def _release_and_enqueue(supabase: SupabaseClient, storage_path: str, context: str) -> None:
+    await storage_outbox.enqueue(await release_ops(supabase, [(storage_path, None)], context))
+
+
+# --- Creación de blobs ---
+
+async def ensure_blob_from_storage(
+    supabase: SupabaseClient,
+    organization_id: UUID,
+    sha256_hex: str,
+    extension: str,
+    source_bucket: str,
+    source_path: str,
+    content_type: str
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Adquiere una referencia al blob de `sha256_hex` y, si no está listo, lo crea copiando `source_path`
+    (de otro bucket, ej. WIP) del lado del servidor. Devuelve (ruta del blob, error).
+    """
+    blob_path = storage_service.get_media_blob_storage_path(organization_id, sha256_hex, extension)
+
+    async def _copy() -> Optional[str]:
+        _copied_path, copy_error = await storage_service.move_file_in_storage(
+            supabase_client=supabase,
+            source_bucket=source_bucket,
+            source_path_in_bucket=source_path,
+            destination_bucket=storage_service.POST_MEDIA_BUCKET,
+            destination_path_in_bucket=blob_path,
+            content_type_for_destination=content_type,
+            delete_source=False
+        )
+        # Si ya existe, otro request con el mismo contenido lo copió primero: sirve igual.
+        return copy_error if copy_error and not await _blob_exists(supabase, blob_path) else None
+
+    blob_error = await _acquire_ready_blob(supabase, blob_path, _copy)
+    return (None, blob_error) if blob_error else (blob_path, None)
+
+
+async def ensure_blob_from_bytes(
+    supabase: SupabaseClient,
+    organization_id: UUID,
+    file_bytes: bytes,
+    content_type: str,
+    extension: str
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Como upload_file_bytes_to_storage, pero al blob del contenido: solo sube si el blob es nuevo. Devuelve (url, ruta, error)."""
+    blob_path = storage_service.get_media_blob_storage_path(organization_id, hashlib.sha256(file_bytes).hexdigest(), extension)
+
+    async def _upload() -> Optional[str]:
+        _public_url, _uploaded_path, upload_error = await storage_service.upload_file_bytes_to_storage(
+            supabase_client=supabase,
+            bucket_name=storage_service.POST_MEDIA_BUCKET,
+            file_path_in_bucket=blob_path,
+            file_bytes=file_bytes,
+            content_type=content_type,
+            upsert=True # Mismo contenido: sobrescribir es inocuo (ej. otro request lo está subiendo a la vez)
+        )
+        return upload_error
+
+    blob_error = await _acquire_ready_blob(supabase, blob_path, _upload)
+    if blob_error:
+        return None, None, blob_error
+    public_url = await storage_service.build_public_url(supabase, storage_service.POST_MEDIA_BUCKET, blob_path)
+    return public_url, blob_path, None
+
+
+async def _acquire_ready_blob(supabase: SupabaseClient, blob_path: str, store_object: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+    """
+    Adquiere una referencia a `blob_path` y no vuelve hasta que el objeto está subido: si el blob no está listo,
+    `store_object` lo copia o sube (devuelve un error o None) y se marca listo. Si el worker del outbox lo está
+    borrando, se espera y se vuelve a subir. Ante un error se suelta la referencia. Devuelve el error, o None.
+    """
+    try:
+        if await acquire(supabase, blob_path):
+            logger.info(f"MEDIA_BLOBS_LOG - Blob {blob_path} reutilizado; no se sube.")
+            return None
+    except Exception as e:
+        logger.error(f"MEDIA_BLOBS_LOG - Error adquiriendo el blob {blob_path}: {type(e).__name__} - {e}", exc_info=True)
+        return f"Error registrando el medio deduplicado: {str(e)}"
+
+    deadline = time.monotonic() + settings.MEDIA_BLOB_REAP_WAIT_SECONDS
+    while True:
+        blob_error = await store_object()
+        if blob_error is None:
+            try:
+                is_ready = await _mark_ready(supabase, blob_path)
+            except Exception as e:
+                logger.error(f"MEDIA_BLOBS_LOG - Error marcando listo el blob {blob_path}: {type(e).__name__} - {e}", exc_info=True)
+                blob_error = f"Error registrando el medio deduplicado: {str(e)}"
+            else:
+                if is_ready:
+                    return None
+                if time.monotonic() >= deadline:
+                    blob_error = "El medio deduplicado se está borrando; inténtalo de nuevo en unos segundos."
+                else:
+                    logger.info(f"MEDIA_BLOBS_LOG - Blob {blob_path} en borrado por el outbox; se vuelve a subir en {_REAP_POLL_SECONDS}s.")
+                    await asyncio.sleep(_REAP_POLL_SECONDS)
+                    continue
+        await _release_and_enqueue(supabase, blob_path, "media_blob_rollback")
+        return blob_error
+
+
+async def _blob_exists(supabase: SupabaseClient, blob_path: str) -> bool:
+    try:
+        return await supabase.storage.from_(storage_service.POST_MEDIA_BUCKET).exists(blob_path)
+    except Exception:
+        return False
+
+
+# --- Digest de la previsualización WIP ---
+
+async def clear_wip_digest(supabase: SupabaseClient, post_id: UUID) -> None:
+    """Se llama ANTES de reemplazar la previsualización WIP: un digest viejo nunca debe describir bytes nuevos. Lanza si falla."""
+    await supabase.table("posts").update({"wip_media_sha256": None}).eq("id", str(post_id)).execute()
+
+
+async def record_wip_digest(supabase: SupabaseClient, post_id: UUID, sha256_hex: str) -> None:
+    """Guarda el sha256 de la previsualización WIP recién subida. Si falla, confirmarla usará una ruta por post (sin deduplicar)."""
+    try:
+        await supabase.table("posts").update({"wip_media_sha256": sha256_hex}).eq("id", str(post_id)).execute()
+    except Exception as e:
+        logger.warning(f"MEDIA_BLOBS_LOG - No se pudo guardar el sha256 de la previsualización WIP del post {post_id}: {type(e).__name__} - {e}")
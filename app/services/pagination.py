@@ -0,0 +1,62 @@
+# app/services/pagination.py
+"""
+Paginación por keyset (cursor) para listados ordenados por (columna de orden DESC, id DESC).
+
+El cursor es opaco para el cliente: base64url de [valor_de_orden, id] de la última fila devuelta.
+En vez de `OFFSET n` (que obliga a Postgres a recorrer y descartar n filas), la siguiente página
+filtra `(orden, id) < (valor_cursor, id_cursor)`, así que cualquier página cuesta lo mismo que la primera.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+
+def encode_cursor(sort_value: Any, row_id: str) -> str:
+    raw = json.dumps([sort_value, str(row_id)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Devuelve (timestamp ISO 8601 normalizado, id). Lanza ValueError si el cursor no es válido.
+    Re-serializamos ambos valores para que nunca llegue texto arbitrario al filtro de PostgREST.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(sort_value).isoformat(), str(UUID(str(row_id)))
+    except Exception as e:
+        raise ValueError(f"Cursor de paginación inválido: {e}") from e
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, str]:
+    """Como decode_cursor, pero para listados ordenados por relevancia: devuelve (rank, id)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return float(rank_value), str(UUID(str(row_id)))
+    except Exception as e:
+        raise ValueError(f"Cursor de paginación inválido: {e}") from e
+
+
+def apply_keyset_filter(query: Any, cursor_values: Tuple[str, str], sort_column: str = "created_at", id_column: str = "id") -> Any:
+    """Añade `(sort_column, id) < cursor` a un query builder de PostgREST ordenado DESC por ambas columnas."""
+    sort_value, row_id = cursor_values
+    return query.or_(
+        f'{sort_column}.lt."{sort_value}",'
+        f'and({sort_column}.eq."{sort_value}",{id_column}.lt.{row_id})'
+    )
+
+
+def next_cursor_from_rows(rows: List[Dict[str, Any]], limit: int, sort_column: str = "created_at", id_column: str = "id") -> Optional[str]:
+    """
+    Se piden `limit + 1` filas: si llegó la fila extra hay otra página. La recorta de `rows`
+    (in-place) y devuelve el cursor de la última fila que sí se devuelve; si no, None.
+    """
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    last_row = rows[-1]
+    return encode_cursor(last_row[sort_column], last_row[id_column])
@@ -0,0 +1,83 @@
+# app/services/post_list_cache.py
+"""
+Caché de respuestas de `GET /posts` con invalidación por versión de organización.
+
+Cada entrada se guarda ya serializada (bytes JSON + ETag + cursor siguiente) bajo una clave que incluye
+la versión actual de la organización:
+
+- La versión compartida (`post_list_versions.version`) la sube un trigger de `posts` en la misma transacción
+  de cada escritura, venga de cualquier worker o réplica. `GET /posts` la lee (`get_shared_org_version`)
+  ANTES de consultar los posts: una escritura posterior cambia la versión y la entrada guardada queda
+  inalcanzable, así que un listado obsoleto nunca se sirve desde ningún worker.
+- La versión local (`bump_org_version`, tras cada escritura desde este proceso) invalida además las entradas
+  de este proceso sin esperar a la siguiente lectura de la versión compartida.
+
+Si la versión compartida no se puede leer, el listado se sirve desde la DB sin usar la caché.
+El TTL (`POST_LIST_CACHE_TTL_SECONDS`) y el LRU solo acotan la memoria.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional, Tuple
+from uuid import UUID
+
+from app.core.cache import MISSING, TTLCache
+from app.core.config import settings
+from app.db.supabase_client import SupabaseClient
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CachedPostList:
+    body: bytes
+    etag: str
+    next_cursor: Optional[str]
+
+
+_org_versions: Dict[str, int] = {}
+_post_list_cache = TTLCache(
+    max_size=settings.POST_LIST_CACHE_MAX_SIZE,
+    ttl_seconds=settings.POST_LIST_CACHE_TTL_SECONDS,
+)
+
+
+def bump_org_version(organization_id: UUID) -> None:
+    """Invalida todos los listados cacheados de la organización. Llamar tras cada escritura sobre posts."""
+    org_key = str(organization_id)
+    _org_versions[org_key] = _org_versions.get(org_key, 0) + 1
+
+
+async def get_shared_org_version(supabase: SupabaseClient, organization_id: UUID) -> Optional[int]:
+    """Versión compartida de los listados de la organización (0 si nunca se escribió). None si no se pudo leer."""
+    try:
+        version_res = await supabase.table("post_list_versions").select("version").eq("organization_id", str(organization_id)).limit(1).execute()
+    except Exception as e:
+        logger.warning(f"POST_LIST_CACHE - No se pudo leer la versión de listados de la org {organization_id}; se consulta sin caché: {type(e).__name__} - {e}")
+        return None
+    return int(version_res.data[0]["version"]) if version_res.data else 0
+
+
+def build_key(organization_id: UUID, author_user_id: UUID, shared_version: int, **list_params: Any) -> Tuple[Hashable, ...]:
+    """Clave = (org, versión compartida, versión local, autor, parámetros del listado ordenados por nombre)."""
+    org_key = str(organization_id)
+    params = tuple(sorted(
+        (name, tuple(value) if isinstance(value, list) else value)
+        for name, value in list_params.items()
+    ))
+    return (org_key, shared_version, _org_versions.get(org_key, 0), str(author_user_id), params)
+
+
+def get_page(key: Tuple[Hashable, ...]) -> Optional[CachedPostList]:
+    entry = _post_list_cache.get(key)
+    return None if entry is MISSING else entry
+
+
+def store_page(key: Tuple[Hashable, ...], entry: CachedPostList) -> None:
+    _post_list_cache.set(key, entry)
+
+
+def stats() -> Dict[str, Any]:
+    cache_stats = _post_list_cache.stats()
+    cache_stats["memory_bytes"] = sum(len(entry.body) for entry in _post_list_cache.values())
+    cache_stats["organizations_tracked"] = len(_org_versions)
+    return cache_stats
@@ -0,0 +1,245 @@
+# app/services/post_scheduler.py
+"""
+Despachador de posts programados.
+
+Cada ciclo:
+1. Reclama en lote los posts vencidos con la RPC `claim_due_posts` (FOR UPDATE SKIP LOCKED): varios
+   workers/procesos pueden correr a la vez sin publicar dos veces el mismo post.
+2. Entrega cada post reclamado al publicador (`PostPublisher`, intercambiable).
+3. Marca en lote los publicados ('published' + published_at) y los fallidos ('publish_failed' + error).
+
+Entre ciclos mantiene un min-heap en memoria con las próximas `scheduled_at` (ventana de
+SCHEDULER_LOOKAHEAD_SECONDS): duerme exactamente hasta el próximo vencimiento o hasta el siguiente
+sondeo, lo que ocurra primero, en lugar de consultar la DB continuamente.
+
+Ejecutar como proceso aparte (desde la raíz del proyecto):
+    python -m app.services.post_scheduler
+"""
+import asyncio
+import heapq
+import logging
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pytz
+
+from app.core.config import settings
+from app.db.supabase_client import SupabaseClient, close_supabase_client, get_supabase_client
+from app.services import post_list_cache
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_STATUS = "scheduled"
+PUBLISHING_STATUS = "publishing"
+PUBLISHED_STATUS = "published"
+PUBLISH_FAILED_STATUS = "publish_failed"
+
+
+# --- Publicadores ---
+
+class PostPublisher:
+    """Interfaz: publica un post en su red social. Debe lanzar una excepción si la publicación falla."""
+
+    async def publish(self, post: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        """Hook opcional: el despachador lo llama al arrancar (ej. para lanzar workers propios)."""
+
+    async def stop(self) -> None:
+        """Hook opcional: el despachador lo llama al detenerse."""
+
+
+class LocalPostPublisher(PostPublisher):
+    """Stand-in local: no llama a ninguna red social, solo registra la publicación."""
+
+    def __init__(self):
+        self.published_post_ids: List[str] = []
+
+    async def publish(self, post: Dict[str, Any]) -> None:
+        logger.info(f"SCHEDULER - [local] Publicado post {post.get('id')} en '{post.get('social_network')}' (programado para {post.get('scheduled_at')}).")
+        self.published_post_ids.append(post["id"])
+
+
+_PUBLISHERS = {
+    "local": LocalPostPublisher,
+}
+
+def build_publisher(name: str) -> PostPublisher:
+    if name == "pipeline":
+        # Import diferido: publishing_pipeline depende de este módulo.
+        from app.services.publishing_pipeline import get_publishing_pipeline
+        return get_publishing_pipeline()
+    try:
+        return _PUBLISHERS[name]()
+    except KeyError:
+        raise ValueError(f"Publicador desconocido: '{name}'. Disponibles: {sorted(_PUBLISHERS) + ['pipeline']}")
+
+
+# --- Despachador ---
+
+class ScheduledPostDispatcher:
+    def __init__(
+        self,
+        publisher: PostPublisher,
+        batch_size: int = 50,
+        poll_interval_seconds: float = 30.0,
+        lookahead_seconds: int = 600,
+        claim_lease_seconds: int = 300,
+        worker_id: Optional[str] = None,
+    ):
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.lookahead_seconds = lookahead_seconds
+        self.claim_lease_seconds = claim_lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._upcoming: List[Tuple[datetime, str]] = [] # min-heap de (scheduled_at, post_id)
+        self._upcoming_ids: Set[str] = set()
+        self._stop_event = asyncio.Event()
+
+    # --- Heap de próximos vencimientos ---
+
+    async def refresh_upcoming(self, supabase: SupabaseClient) -> None:
+        """Carga en el heap las próximas `scheduled_at` dentro de la ventana de lookahead."""
+        now_utc = datetime.now(pytz.utc)
+        horizon = now_utc + timedelta(seconds=self.lookahead_seconds)
+        upcoming_res = await (
+            supabase.table("posts")
+            .select("id, scheduled_at")
+            .eq("status", SCHEDULED_STATUS)
+            .is_("deleted_at", None)
+            .gt("scheduled_at", now_utc.isoformat())
+            .lte("scheduled_at", horizon.isoformat())
+            .order("scheduled_at")
+            .limit(1000)
+            .execute()
+        )
+        for row in upcoming_res.data or []:
+            if row["id"] in self._upcoming_ids:
+                continue
+            heapq.heappush(self._upcoming, (datetime.fromisoformat(row["scheduled_at"]), row["id"]))
+            self._upcoming_ids.add(row["id"])
+
+    def _pop_due(self, now_utc: datetime) -> int:
+        """Saca del heap las entradas ya vencidas. Devuelve cuántas había."""
+        popped = 0
+        while self._upcoming and self._upcoming[0][0] <= now_utc:
+            _, post_id = heapq.heappop(self._upcoming)
+            self._upcoming_ids.discard(post_id)
+            popped += 1
+        return popped
+
+    def seconds_until_next_wakeup(self, now_utc: datetime) -> float:
+        if not self._upcoming:
+            return self.poll_interval_seconds
+        until_next_due = (self._upcoming[0][0] - now_utc).total_seconds()
+        return max(0.0, min(self.poll_interval_seconds, until_next_due))
+
+    # --- Reclamo y publicación ---
+
+    async def dispatch_due(self, supabase: SupabaseClient) -> int:
+        """Reclama y publica posts vencidos hasta agotar los disponibles. Devuelve cuántos se procesaron."""
+        processed = 0
+        while not self._stop_event.is_set():
+            claim_res = await supabase.rpc("claim_due_posts", {
+                "p_worker_id": self.worker_id,
+                "p_batch_size": self.batch_size,
+                "p_lease_seconds": self.claim_lease_seconds,
+            }).execute()
+            claimed_posts: List[Dict[str, Any]] = claim_res.data or []
+            if not claimed_posts:
+                break
+            await self._publish_batch(supabase, claimed_posts)
+            processed += len(claimed_posts)
+            if len(claimed_posts) < self.batch_size:
+                break
+        return processed
+
+    async def _publish_batch(self, supabase: SupabaseClient, claimed_posts: List[Dict[str, Any]]) -> None:
+        outcomes = await asyncio.gather(
+            *(self.publisher.publish(post) for post in claimed_posts),
+            return_exceptions=True
+        )
+        published_ids = [post["id"] for post, outcome in zip(claimed_posts, outcomes) if not isinstance(outcome, BaseException)]
+        failed = [(post, outcome) for post, outcome in zip(claimed_posts, outcomes) if isinstance(outcome, BaseException)]
+
+        if published_ids:
+            # Un solo UPDATE para todo el lote; `publish_claimed_by` evita pisar un reclamo que ya venció y tomó otro worker.
+            await (
+                supabase.table("posts")
+                .update({
+                    "status": PUBLISHED_STATUS,
+                    "published_at": datetime.now(pytz.utc).isoformat(),
+                    "publish_claimed_at": None,
+                    "publish_error": None,
+                })
+                .in_("id", published_ids)
+                .eq("publish_claimed_by", self.worker_id)
+                .execute()
+            )
+        for post, error in failed:
+            logger.error(f"SCHEDULER - Fallo al publicar post {post['id']} en '{post.get('social_network')}': {type(error).__name__} - {error}")
+            await (
+                supabase.table("posts")
+                .update({"status": PUBLISH_FAILED_STATUS, "publish_claimed_at": None, "publish_error": str(error)[:1000]})
+                .eq("id", post["id"])
+                .eq("publish_claimed_by", self.worker_id)
+                .execute()
+            )
+
+        for organization_id in {post["organization_id"] for post in claimed_posts}:
+            post_list_cache.bump_org_version(organization_id)
+        logger.info(f"SCHEDULER - Worker {self.worker_id}: {len(published_ids)} publicados, {len(failed)} fallidos.")
+
+    # --- Bucle principal ---
+
+    async def run(self) -> None:
+        logger.info(f"SCHEDULER - Iniciando despachador {self.worker_id} (lote {self.batch_size}, sondeo cada {self.poll_interval_seconds}s).")
+        next_refresh = datetime.min.replace(tzinfo=pytz.utc)
+        await self.publisher.start()
+        while not self._stop_event.is_set():
+            try:
+                supabase = await get_supabase_client()
+                now_utc = datetime.now(pytz.utc)
+                self._pop_due(now_utc)
+                await self.dispatch_due(supabase)
+                if now_utc >= next_refresh:
+                    await self.refresh_upcoming(supabase)
+                    next_refresh = now_utc + timedelta(seconds=self.poll_interval_seconds)
+            except Exception as e:
+                logger.error(f"SCHEDULER - Error en el ciclo del despachador: {type(e).__name__} - {e}", exc_info=True)
+            sleep_seconds = self.seconds_until_next_wakeup(datetime.now(pytz.utc))
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=sleep_seconds)
+            except asyncio.TimeoutError:
+                pass
+        await self.publisher.stop()
+        logger.info(f"SCHEDULER - Despachador {self.worker_id} detenido.")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def build_dispatcher_from_settings() -> ScheduledPostDispatcher:
+    return ScheduledPostDispatcher(
+        publisher=build_publisher(settings.SCHEDULER_PUBLISHER),
+        batch_size=settings.SCHEDULER_BATCH_SIZE,
+        poll_interval_seconds=settings.SCHEDULER_POLL_INTERVAL_SECONDS,
+        lookahead_seconds=settings.SCHEDULER_LOOKAHEAD_SECONDS,
+        claim_lease_seconds=settings.SCHEDULER_CLAIM_LEASE_SECONDS,
+    )
+
+
+async def _run_standalone() -> None:
+    try:
+        await build_dispatcher_from_settings().run()
+    finally:
+        await close_supabase_client()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone())
@@ -0,0 +1,298 @@
+# app/services/publishing_pipeline.py
+"""
+Pipeline de publicación saliente por red social.
+
+- Cada `social_network` tiene su propio pool de workers asyncio con un tope de concurrencia y un
+  token bucket (`NetworkPolicy`), así que una red lenta o con rate limit estricto no frena a las demás.
+- Los adaptadores de red son intercambiables (`PostPublisher` de post_scheduler); se incluye
+  `FakeNetworkAdapter` como stand-in local para desarrollo y pruebas.
+- Una publicación fallida se guarda en la cola durable `post_publish_retries` con backoff exponencial
+  según la política de su red. Un bucle de reintentos la reclama con `claim_publish_retries`
+  (SKIP LOCKED) y la vuelve a pasar por el pool correspondiente.
+
+Se usa como publicador del despachador (`SCHEDULER_PUBLISHER=pipeline`) o directamente con
+`await get_publishing_pipeline().submit(post_ids)`.
+"""
+import asyncio
+import logging
+import random
+from dataclasses import dataclass, fields, replace
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+from app.db.supabase_client import SupabaseClient, get_supabase_client
+from app.services import post_list_cache
+from app.services.post_scheduler import PUBLISH_FAILED_STATUS, PUBLISHED_STATUS, PUBLISHING_STATUS, PostPublisher
+
+logger = logging.getLogger(__name__)
+
+# Un reintento solo publica si el post sigue pendiente de publicarse: si el usuario lo pasó a borrador o lo
+# reprogramó ('scheduled') mientras esperaba, se descarta el reintento.
+RETRYABLE_STATUSES = (PUBLISH_FAILED_STATUS, PUBLISHING_STATUS)
+
+
+@dataclass(frozen=True)
+class NetworkPolicy:
+    max_concurrency: int = 4
+    rate_per_second: float = 2.0
+    burst: float = 5.0
+    max_attempts: int = 5
+    backoff_base_seconds: float = 30.0
+    backoff_max_seconds: float = 3600.0
+
+    def backoff_seconds(self, attempts: int) -> float:
+        """Backoff exponencial con jitter completo: entre 0 y base * 2^(intentos-1), con tope."""
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** max(0, attempts - 1))))
+
+
+def policy_for_network(network: str) -> NetworkPolicy:
+    overrides = settings.PUBLISHING_NETWORK_POLICIES.get(network, {})
+    valid_names = {f.name for f in fields(NetworkPolicy)}
+    default_policy = NetworkPolicy()
+    return replace(default_policy, **{
+        name: type(getattr(default_policy, name))(value)
+        for name, value in overrides.items() if name in valid_names
+    })
+
+
+def _attempts_so_far(post: Dict[str, Any]) -> int:
+    """Intentos ya hechos según el post reclamado (`publish_attempts` lo incrementa claim_due_posts); al menos 1."""
+    return max(1, post.get("publish_attempts") or 0)
+
+
+# --- Adaptadores ---
+
+class FakeNetworkAdapter(PostPublisher):
+    """Stand-in local de una red social: simula latencia y, opcionalmente, una tasa de fallos."""
+
+    def __init__(self, latency_seconds: float = 0.05, failure_rate: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.published_post_ids: List[str] = []
+
+    async def publish(self, post: Dict[str, Any]) -> None:
+        await asyncio.sleep(self.latency_seconds)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise RuntimeError(f"[fake] Error simulado publicando en '{post.get('social_network')}'.")
+        self.published_post_ids.append(post["id"])
+        logger.info(f"PUBLISHING - [fake] Publicado post {post['id']} en '{post.get('social_network')}'.")
+
+
+_ADAPTERS = {
+    "fake": FakeNetworkAdapter,
+}
+
+
+# --- Pool por red ---
+
+class _NetworkPool:
+    def __init__(self, network: str, adapter: PostPublisher, policy: NetworkPolicy):
+        self.network = network
+        self.adapter = adapter
+        self.policy = policy
+        self.bucket = TokenBucket(policy.rate_per_second, policy.burst)
+        self.queue: "asyncio.Queue[Tuple[Dict[str, Any], asyncio.Future]]" = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(policy.max_concurrency)]
+
+    async def _worker(self) -> None:
+        while True:
+            post, result_future = await self.queue.get()
+            try:
+                await self.bucket.acquire()
+                await self.adapter.publish(post)
+                if not result_future.done():
+                    result_future.set_result(None)
+            except asyncio.CancelledError:
+                if not result_future.done():
+                    result_future.cancel()
+                raise
+            except Exception as e:
+                if not result_future.done():
+                    result_future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def publish(self, post: Dict[str, Any]) -> None:
+        result_future = asyncio.get_running_loop().create_future()
+        await self.queue.put((post, result_future))
+        await result_future
+
+    async def close(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+
+# --- Pipeline ---
+
+class PublishingPipeline(PostPublisher):
+    def __init__(self, adapters: Dict[str, PostPublisher], default_adapter: PostPublisher):
+        self.adapters = adapters
+        self.default_adapter = default_adapter
+        self._pools: Dict[str, _NetworkPool] = {}
+        self._retry_task: Optional[asyncio.Task] = None
+        self._stop_event = asyncio.Event()
+
+    def _pool(self, network: str) -> _NetworkPool:
+        pool = self._pools.get(network)
+        if pool is None:
+            pool = _NetworkPool(network, self.adapters.get(network, self.default_adapter), policy_for_network(network))
+            self._pools[network] = pool
+        return pool
+
+    async def publish(self, post: Dict[str, Any]) -> None:
+        """
+        Publica un post a través del pool de su red. Si falla, lo deja en la cola de reintentos y relanza
+        la excepción (el despachador lo marca 'publish_failed'; un reintento exitoso lo pasará a 'published').
+        """
+        network = post.get("social_network") or "unknown"
+        try:
+            await self._pool(network).publish(post)
+        except Exception as e:
+            try:
+                supabase = await get_supabase_client()
+            except Exception as e_client:
+                logger.error(f"PUBLISHING - No se pudo encolar el reintento del post {post['id']}: {type(e_client).__name__} - {e_client}")
+            else:
+                await self._schedule_retry(supabase, post, attempts=_attempts_so_far(post), error=e)
+            raise
+
+    async def submit(self, post_ids: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Publica los posts indicados (una sola consulta para cargarlos) repartiéndolos en los pools de sus redes.
+        Devuelve {post_id: None si se publicó | mensaje de error}. Los fallidos quedan en la cola de reintentos.
+        """
+        supabase = await get_supabase_client()
+        posts_res = await supabase.table("posts").select("*").in_("id", [str(post_id) for post_id in post_ids]).is_("deleted_at", None).execute()
+        posts = posts_res.data or []
+        outcomes = await asyncio.gather(*(self._pool(post.get("social_network") or "unknown").publish(post) for post in posts), return_exceptions=True)
+
+        results: Dict[str, Optional[str]] = {str(post_id): "Post no encontrado o eliminado." for post_id in post_ids}
+        published_posts = []
+        for post, outcome in zip(posts, outcomes):
+            if isinstance(outcome, BaseException):
+                results[post["id"]] = str(outcome)
+                await self._schedule_retry(supabase, post, attempts=_attempts_so_far(post), error=outcome)
+            else:
+                results[post["id"]] = None
+                published_posts.append(post)
+        await self._mark_published(supabase, published_posts)
+        return results
+
+    # --- Cola durable de reintentos ---
+
+    async def _schedule_retry(self, supabase: SupabaseClient, post: Dict[str, Any], attempts: int, error: BaseException) -> None:
+        """
+        Deja el post en la cola de reintentos (o lo marca 'publish_failed' si agotó sus intentos). No lanza
+        excepciones: si la cola no está disponible lo loguea, para que quien llama relance el error de publicación.
+        """
+        try:
+            await self._upsert_retry(supabase, post, attempts, error)
+        except Exception as e_retry:
+            logger.error(f"PUBLISHING - No se pudo encolar el reintento del post {post['id']} (intento {attempts}): {type(e_retry).__name__} - {e_retry}. Error de publicación: {error}")
+
+    async def _upsert_retry(self, supabase: SupabaseClient, post: Dict[str, Any], attempts: int, error: BaseException) -> None:
+        network = post.get("social_network") or "unknown"
+        policy = policy_for_network(network)
+        if attempts >= policy.max_attempts:
+            logger.error(f"PUBLISHING - Post {post['id']} ({network}) agotó sus {policy.max_attempts} intentos: {error}")
+            await supabase.table("post_publish_retries").delete().eq("post_id", post["id"]).execute()
+            await supabase.table("posts").update({"status": PUBLISH_FAILED_STATUS, "publish_error": str(error)[:1000]}).eq("id", post["id"]).in_("status", list(RETRYABLE_STATUSES)).execute()
+            return
+        next_attempt_at = datetime.now(pytz.utc) + timedelta(seconds=policy.backoff_seconds(attempts))
+        await supabase.table("post_publish_retries").upsert({
+            "post_id": post["id"],
+            "social_network": network,
+            "attempts": attempts,
+            "next_attempt_at": next_attempt_at.isoformat(),
+            "last_error": str(error)[:1000],
+            "locked_until": None,
+            "updated_at": datetime.now(pytz.utc).isoformat(),
+        }, on_conflict="post_id").execute()
+        logger.warning(f"PUBLISHING - Post {post['id']} ({network}) falló (intento {attempts}/{policy.max_attempts}); reintento a las {next_attempt_at.isoformat()}: {error}")
+
+    async def process_due_retries(self, supabase: SupabaseClient) -> int:
+        """Reclama los reintentos vencidos y los vuelve a publicar. Devuelve cuántos se procesaron."""
+        claim_res = await supabase.rpc("claim_publish_retries", {
+            "p_batch_size": settings.PUBLISHING_RETRY_BATCH_SIZE,
+            "p_lease_seconds": settings.SCHEDULER_CLAIM_LEASE_SECONDS,
+        }).execute()
+        retries = {row["post_id"]: row for row in (claim_res.data or [])}
+        if not retries:
+            return 0
+
+        posts_res = await supabase.table("posts").select("*").in_("id", list(retries)).is_("deleted_at", None).execute()
+        posts = [post for post in (posts_res.data or []) if post.get("status") in RETRYABLE_STATUSES]
+        outcomes = await asyncio.gather(*(self._pool(post.get("social_network") or "unknown").publish(post) for post in posts), return_exceptions=True)
+
+        published_posts = []
+        for post, outcome in zip(posts, outcomes):
+            if isinstance(outcome, BaseException):
+                await self._schedule_retry(supabase, post, attempts=retries[post["id"]]["attempts"] + 1, error=outcome)
+            else:
+                published_posts.append(post)
+        await self._mark_published(supabase, published_posts, only_statuses=RETRYABLE_STATUSES)
+
+        # Filas cuyo post ya no está pendiente (publicado, borrado, vuelto a borrador o reprogramado) o que se acaban de publicar: fuera de la cola.
+        pending_retry_ids = {post["id"] for post, outcome in zip(posts, outcomes) if isinstance(outcome, BaseException)}
+        finished_ids = [post_id for post_id in retries if post_id not in pending_retry_ids]
+        if finished_ids:
+            await supabase.table("post_publish_retries").delete().in_("post_id", finished_ids).execute()
+        return len(retries)
+
+    async def _mark_published(self, supabase: SupabaseClient, posts: List[Dict[str, Any]], only_statuses: Optional[Tuple[str, ...]] = None) -> None:
+        """Marca los posts como publicados. Con `only_statuses`, no pisa un post cuyo estado cambió mientras se publicaba."""
+        if not posts:
+            return
+        update_query = (
+            supabase.table("posts")
+            .update({"status": PUBLISHED_STATUS, "published_at": datetime.now(pytz.utc).isoformat(), "publish_claimed_at": None, "publish_error": None})
+            .in_("id", [post["id"] for post in posts])
+        )
+        if only_statuses:
+            update_query = update_query.in_("status", list(only_statuses))
+        await update_query.execute()
+        for organization_id in {post["organization_id"] for post in posts}:
+            post_list_cache.bump_org_version(organization_id)
+
+    async def _retry_loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                await self.process_due_retries(await get_supabase_client())
+            except Exception as e:
+                logger.error(f"PUBLISHING - Error procesando la cola de reintentos: {type(e).__name__} - {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=settings.PUBLISHING_RETRY_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- Ciclo de vida (hooks de PostPublisher) ---
+
+    async def start(self) -> None:
+        if self._retry_task is None or self._retry_task.done():
+            self._stop_event.clear()
+            self._retry_task = asyncio.create_task(self._retry_loop())
+
+    async def stop(self) -> None:
+        self._stop_event.set()
+        if self._retry_task is not None:
+            await self._retry_task
+        await asyncio.gather(*(pool.close() for pool in self._pools.values()))
+        self._pools.clear()
+
+
+_pipeline: Optional[PublishingPipeline] = None
+
+def get_publishing_pipeline() -> PublishingPipeline:
+    global _pipeline
+    if _pipeline is None:
+        try:
+            adapter_class = _ADAPTERS[settings.PUBLISHING_ADAPTER]
+        except KeyError:
+            raise ValueError(f"Adaptador de publicación desconocido: '{settings.PUBLISHING_ADAPTER}'. Disponibles: {sorted(_ADAPTERS)}")
+        _pipeline = PublishingPipeline(adapters={}, default_adapter=adapter_class())
+    return _pipeline
@@ -0,0 +1,415 @@
+# app/services/storage_outbox.py
+"""
+Outbox durable de operaciones de storage (borrados de archivos y purgas de carpetas).
+
+Los endpoints no esperan al storage: al hacer su escritura en la DB encolan aquí lo que hay que borrar
+(`enqueue`) y responden. Lo que se deriva de la fila del post (imagen y variantes anteriores, carpeta WIP de un
+post borrado) lo encola el trigger `posts_enqueue_storage_ops` en la misma transacción que el UPDATE: si la
+escritura se confirma, su limpieza también. `enqueue` queda para los rollbacks y las previsualizaciones WIP. Un worker (`StorageOutboxWorker`) drena el outbox:
+1. Reclama un lote de operaciones vencidas (en Supabase con la RPC `claim_storage_ops`, SKIP LOCKED).
+2. Lista las carpetas a purgar (en paralelo), descarta los blobs deduplicados que volvieron a tener
+   referencias (RPC `reap_media_blobs`) y agrupa todos los paths por bucket: un borrado en lote por bucket.
+   Las operaciones sobre nombres que se reutilizan (`preview_active.<ext>`, variantes) llevan `if_unmodified_since`:
+   un archivo que se volvió a subir después de encolarlas no se borra.
+3. Borra las operaciones terminadas; las fallidas se reprograman con backoff exponencial y, al agotar
+   STORAGE_OUTBOX_MAX_ATTEMPTS, quedan con status 'dead' para revisarlas.
+
+Backends (STORAGE_OUTBOX_BACKEND):
+- "supabase": tabla `storage_ops_outbox` (migración 20261016000800_storage_ops_outbox.sql).
+- "sqlite": stand-in local para desarrollo, en STORAGE_OUTBOX_SQLITE_PATH.
+  Solo recibe lo encolado desde la API; las operaciones del trigger quedan en `storage_ops_outbox`.
+
+El worker corre dentro de la API (STORAGE_OUTBOX_WORKER_ENABLED) o como proceso aparte:
+    python -m app.services.storage_outbox
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from uuid import UUID
+
+import pytz
+
+from app.core.config import settings
+from app.db.supabase_client import close_supabase_client, get_supabase_client
+from app.services import storage_service
+
+logger = logging.getLogger(__name__)
+
+OP_DELETE = "delete"             # `path` es un archivo
+OP_PURGE_FOLDER = "purge_folder" # `path` es una carpeta: se borran sus archivos directos
+OP_DELETE_BLOB = "delete_blob"   # `path` es un blob de media_blobs: solo se borra si sigue sin referencias
+
+STATUS_PENDING = "pending"
+STATUS_DEAD = "dead"
+
+
+@dataclass(frozen=True)
+class StorageOp:
+    op: str
+    bucket: str
+    path: str
+    post_id: Optional[UUID] = None
+    context: str = ""
+    # Para rutas que se reutilizan (previsualizaciones WIP, variantes): solo se borran los archivos cuyo
+    # updated_at en el storage no sea posterior a este instante, es decir, que no se volvieron a subir.
+    if_unmodified_since: Optional[datetime] = None
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            "op": self.op, "bucket": self.bucket, "path": self.path, "post_id": str(self.post_id) if self.post_id else None, "context": self.context,
+            "if_unmodified_since": self.if_unmodified_since.isoformat() if self.if_unmodified_since else None,
+        }
+
+
+# --- Backends ---
+
+class OutboxStore:
+    """Interfaz del almacenamiento del outbox."""
+
+    async def enqueue(self, rows: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    async def claim(self, batch_size: int, lease_seconds: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def complete(self, op_ids: List[str]) -> None:
+        raise NotImplementedError
+
+    async def fail(self, op_id: str, attempts: int, error: str, next_attempt_at: Optional[datetime]) -> None:
+        """Reprograma la operación para `next_attempt_at`, o la marca 'dead' si es None."""
+        raise NotImplementedError
+
+
+class SupabaseOutboxStore(OutboxStore):
+    async def enqueue(self, rows: List[Dict[str, Any]]) -> None:
+        supabase = await get_supabase_client()
+        await supabase.table("storage_ops_outbox").insert(rows, default_to_null=False).execute()
+
+    async def claim(self, batch_size: int, lease_seconds: int) -> List[Dict[str, Any]]:
+        supabase = await get_supabase_client()
+        claim_res = await supabase.rpc("claim_storage_ops", {"p_batch_size": batch_size, "p_lease_seconds": lease_seconds}).execute()
+        return claim_res.data or []
+
+    async def complete(self, op_ids: List[str]) -> None:
+        supabase = await get_supabase_client()
+        await supabase.table("storage_ops_outbox").delete().in_("id", op_ids).execute()
+
+    async def fail(self, op_id: str, attempts: int, error: str, next_attempt_at: Optional[datetime]) -> None:
+        supabase = await get_supabase_client()
+        payload = {"attempts": attempts, "last_error": error[:1000], "locked_until": None, "updated_at": datetime.now(pytz.utc).isoformat()}
+        if next_attempt_at is None:
+            payload["status"] = STATUS_DEAD
+        else:
+            payload["next_attempt_at"] = next_attempt_at.isoformat()
+        await supabase.table("storage_ops_outbox").update(payload).eq("id", op_id).execute()
+
+
+class SQLiteOutboxStore(OutboxStore):
+    """Stand-in local (desarrollo): misma semántica que la tabla de Supabase, en un archivo SQLite."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("""
+            create table if not exists storage_ops_outbox (
+                id text primary key,
+                op text not null,
+                bucket text not null,
+                path text not null,
+                post_id text,
+                context text not null default '',
+                status text not null default 'pending',
+                attempts integer not null default 0,
+                next_attempt_at text not null,
+                last_error text,
+                locked_until text,
+                if_unmodified_since text,
+                created_at text not null,
+                updated_at text not null
+            )
+        """)
+        if "if_unmodified_since" not in {column["name"] for column in self._conn.execute("pragma table_info(storage_ops_outbox)")}:
+            self._conn.execute("alter table storage_ops_outbox add column if_unmodified_since text")
+        self._conn.execute("create index if not exists storage_ops_outbox_pending_idx on storage_ops_outbox (status, next_attempt_at)")
+
+    def _run(self, fn):
+        with self._lock:
+            return fn(self._conn)
+
+    async def enqueue(self, rows: List[Dict[str, Any]]) -> None:
+        now = datetime.now(pytz.utc).isoformat()
+        values = [(str(uuid.uuid4()), row["op"], row["bucket"], row["path"], row["post_id"], row["context"], row.get("if_unmodified_since"), now, now, now) for row in rows]
+        def _insert(conn):
+            conn.executemany(
+                "insert into storage_ops_outbox (id, op, bucket, path, post_id, context, if_unmodified_since, next_attempt_at, created_at, updated_at) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values
+            )
+        await asyncio.to_thread(self._run, _insert)
+
+    async def claim(self, batch_size: int, lease_seconds: int) -> List[Dict[str, Any]]:
+        now = datetime.now(pytz.utc)
+        def _claim(conn):
+            conn.execute("begin immediate")
+            try:
+                rows = conn.execute(
+                    "select * from storage_ops_outbox where status = ? and next_attempt_at <= ? and (locked_until is null or locked_until < ?) order by next_attempt_at limit ?",
+                    (STATUS_PENDING, now.isoformat(), now.isoformat(), batch_size)
+                ).fetchall()
+                conn.executemany(
+                    "update storage_ops_outbox set locked_until = ?, updated_at = ? where id = ?",
+                    [((now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat(), row["id"]) for row in rows]
+                )
+                conn.execute("commit")
+            except BaseException:
+                conn.execute("rollback")
+                raise
+            return [dict(row) for row in rows]
+        return await asyncio.to_thread(self._run, _claim)
+
+    async def complete(self, op_ids: List[str]) -> None:
+        def _delete(conn):
+            conn.executemany("delete from storage_ops_outbox where id = ?", [(op_id,) for op_id in op_ids])
+        await asyncio.to_thread(self._run, _delete)
+
+    async def fail(self, op_id: str, attempts: int, error: str, next_attempt_at: Optional[datetime]) -> None:
+        now = datetime.now(pytz.utc).isoformat()
+        def _update(conn):
+            if next_attempt_at is None:
+                conn.execute("update storage_ops_outbox set status = ?, attempts = ?, last_error = ?, locked_until = null, updated_at = ? where id = ?",
+                             (STATUS_DEAD, attempts, error[:1000], now, op_id))
+            else:
+                conn.execute("update storage_ops_outbox set attempts = ?, last_error = ?, next_attempt_at = ?, locked_until = null, updated_at = ? where id = ?",
+                             (attempts, error[:1000], next_attempt_at.isoformat(), now, op_id))
+        await asyncio.to_thread(self._run, _update)
+
+
+_store: Optional[OutboxStore] = None
+
+def get_outbox_store() -> OutboxStore:
+    global _store
+    if _store is None:
+        if settings.STORAGE_OUTBOX_BACKEND == "supabase":
+            _store = SupabaseOutboxStore()
+        elif settings.STORAGE_OUTBOX_BACKEND == "sqlite":
+            _store = SQLiteOutboxStore(settings.STORAGE_OUTBOX_SQLITE_PATH)
+        else:
+            raise ValueError(f"Backend de outbox desconocido: '{settings.STORAGE_OUTBOX_BACKEND}'. Disponibles: ['sqlite', 'supabase']")
+    return _store
+
+
+# --- Encolado (lo usan los endpoints) ---
+
+_wakeup_event = asyncio.Event()
+
+async def enqueue(ops: List[StorageOp]) -> bool:
+    """
+    Encola operaciones de storage y despierta al worker de este proceso. No lanza excepciones:
+    si el outbox no está disponible lo loguea (los archivos quedarían huérfanos) y devuelve False.
+    """
+    if not ops:
+        return True
+    try:
+        await get_outbox_store().enqueue([op.to_row() for op in ops])
+    except Exception as e:
+        logger.error(f"OUTBOX_LOG - No se pudieron encolar {len(ops)} operaciones de storage: {type(e).__name__} - {e}. Operaciones: {ops}")
+        return False
+    _wakeup_event.set()
+    return True
+
+
+# --- Worker ---
+
+_MISSING = object()
+
+def _is_unmodified(updated_at: Any, if_unmodified_since: Any) -> bool:
+    """
+    True si el archivo (su updated_at del listado) no se volvió a subir después de `if_unmodified_since`.
+    Un archivo que ya no existe (`_MISSING`) no hay que borrarlo; uno sin updated_at conocido se conserva.
+    """
+    if updated_at is _MISSING or updated_at is None:
+        return False
+    if isinstance(if_unmodified_since, str):
+        if_unmodified_since = datetime.fromisoformat(if_unmodified_since)
+    return updated_at <= if_unmodified_since
+
+class StorageOutboxWorker:
+    def __init__(
+        self,
+        store: OutboxStore,
+        batch_size: int = 500,
+        poll_interval_seconds: float = 5.0,
+        claim_lease_seconds: int = 300,
+        max_attempts: int = 8,
+        backoff_base_seconds: float = 10.0,
+        backoff_max_seconds: float = 3600.0,
+    ):
+        self.store = store
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.claim_lease_seconds = claim_lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._stop_event = asyncio.Event()
+
+    async def drain(self) -> int:
+        """Procesa lotes hasta vaciar lo vencido. Devuelve cuántas operaciones se procesaron."""
+        processed = 0
+        while not self._stop_event.is_set():
+            claimed_ops = await self.store.claim(self.batch_size, self.claim_lease_seconds)
+            if not claimed_ops:
+                break
+            await self._process_batch(claimed_ops)
+            processed += len(claimed_ops)
+            if len(claimed_ops) < self.batch_size:
+                break
+        return processed
+
+    async def _process_batch(self, claimed_ops: List[Dict[str, Any]]) -> None:
+        supabase = await get_supabase_client()
+        errors_by_op: Dict[str, str] = {}
+
+        # 1. Listar en paralelo (una vez por carpeta) las carpetas a purgar y las de los borrados condicionados
+        #    (if_unmodified_since), que necesitan el updated_at actual de sus archivos.
+        purge_ops = [op for op in claimed_ops if op["op"] == OP_PURGE_FOLDER]
+        guarded_delete_ops = [op for op in claimed_ops if op["op"] == OP_DELETE and op.get("if_unmodified_since")]
+        folders = list(dict.fromkeys(
+            [(op["bucket"], op["path"].rstrip("/")) for op in purge_ops]
+            + [(op["bucket"], op["path"].rsplit("/", 1)[0]) for op in guarded_delete_ops]
+        ))
+        folder_listings = await asyncio.gather(
+            *(storage_service.list_files_in_folder(supabase, bucket, folder) for bucket, folder in folders),
+            return_exceptions=True
+        )
+        listing_by_folder = dict(zip(folders, folder_listings))
+
+        # 2. Blobs deduplicados: solo se borran los que siguen sin referencias (la RPC los bloquea y los marca en
+        #    borrado: nadie puede marcarlos listos hasta finish_reap_media_blobs); los demás se dan por completados.
+        blob_ops = [op for op in claimed_ops if op["op"] == OP_DELETE_BLOB]
+        reapable_blob_paths: Set[str] = set()
+        if blob_ops:
+            try:
+                reap_res = await supabase.rpc("reap_media_blobs", {
+                    "p_storage_paths": sorted({op["path"] for op in blob_ops}),
+                    "p_lease_seconds": self.claim_lease_seconds,
+                }).execute()
+                reapable_blob_paths = {row if isinstance(row, str) else next(iter(row.values())) for row in (reap_res.data or [])}
+            except Exception as e:
+                for op in blob_ops:
+                    errors_by_op[op["id"]] = f"Error consultando las referencias del blob: {type(e).__name__} - {e}"
+
+        # 3. Todos los paths agrupados por bucket, recordando a qué operación pertenece cada uno.
+        ops_by_bucket_path: Dict[str, Dict[str, List[str]]] = {}
+        #    Los archivos que se volvieron a subir después de encolar una operación condicionada no se tocan.
+        for op in claimed_ops:
+            if op["op"] == OP_DELETE and op.get("if_unmodified_since"):
+                listing = listing_by_folder[(op["bucket"], op["path"].rsplit("/", 1)[0])]
+                if isinstance(listing, BaseException):
+                    errors_by_op[op["id"]] = f"Error listando la carpeta: {type(listing).__name__} - {listing}"
+                elif _is_unmodified(dict(listing).get(op["path"], _MISSING), op["if_unmodified_since"]):
+                    ops_by_bucket_path.setdefault(op["bucket"], {}).setdefault(op["path"], []).append(op["id"])
+            elif op["op"] == OP_DELETE or (op["op"] == OP_DELETE_BLOB and op["path"] in reapable_blob_paths):
+                ops_by_bucket_path.setdefault(op["bucket"], {}).setdefault(op["path"], []).append(op["id"])
+            elif op["op"] not in (OP_PURGE_FOLDER, OP_DELETE_BLOB):
+                errors_by_op[op["id"]] = f"Operación desconocida: '{op['op']}'"
+        for op in purge_ops:
+            listing = listing_by_folder[(op["bucket"], op["path"].rstrip("/"))]
+            if isinstance(listing, BaseException):
+                errors_by_op[op["id"]] = f"Error listando la carpeta: {type(listing).__name__} - {listing}"
+                continue
+            for path, updated_at in listing:
+                if not op.get("if_unmodified_since") or _is_unmodified(updated_at, op["if_unmodified_since"]):
+                    ops_by_bucket_path.setdefault(op["bucket"], {}).setdefault(path, []).append(op["id"])
+
+        # 4. Un borrado en lote por bucket (delete_files_from_storage trocea las listas grandes), buckets en paralelo.
+        delete_calls = [(bucket, list(path_map)) for bucket, path_map in ops_by_bucket_path.items()]
+        call_results = await asyncio.gather(
+            *(storage_service.delete_files_from_storage(supabase, bucket, paths) for bucket, paths in delete_calls),
+            return_exceptions=True
+        )
+        for (bucket, paths), results in zip(delete_calls, call_results):
+            if isinstance(results, BaseException):
+                results = [(path, False, f"{type(results).__name__} - {results}") for path in paths]
+            for path, success, error_msg in results:
+                if not success:
+                    for op_id in ops_by_bucket_path[bucket][path]:
+                        errors_by_op.setdefault(op_id, f"{path}: {error_msg}")
+
+        # 4b. Cierre del borrado de blobs: se eliminan las filas que siguen sin referencias y las readquiridas quedan
+        #     no listas (el próximo acquire las vuelve a subir). También tras un borrado fallido: su reintento vuelve
+        #     a registrar la fila en borrado antes de borrar. Si el cierre falla, las operaciones se reintentan.
+        reaped_blob_ops = [op for op in blob_ops if op["path"] in reapable_blob_paths]
+        if reaped_blob_ops:
+            try:
+                await supabase.rpc("finish_reap_media_blobs", {"p_storage_paths": sorted({op["path"] for op in reaped_blob_ops})}).execute()
+            except Exception as e:
+                for op in reaped_blob_ops:
+                    errors_by_op.setdefault(op["id"], f"Error cerrando el borrado del blob: {type(e).__name__} - {e}")
+
+        # 5. Resultado por operación.
+        completed_ids = [op["id"] for op in claimed_ops if op["id"] not in errors_by_op]
+        if completed_ids:
+            await self.store.complete(completed_ids)
+        for op in claimed_ops:
+            error = errors_by_op.get(op["id"])
+            if error is None:
+                continue
+            attempts = (op.get("attempts") or 0) + 1
+            if attempts >= self.max_attempts:
+                logger.error(f"OUTBOX_LOG - Operación {op['op']} {op['bucket']}/{op['path']} ({op.get('context')}) descartada tras {attempts} intentos: {error}")
+                await self.store.fail(op["id"], attempts, error, None)
+            else:
+                delay = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** (attempts - 1)))
+                logger.warning(f"OUTBOX_LOG - Operación {op['op']} {op['bucket']}/{op['path']} falló (intento {attempts}/{self.max_attempts}); reintento en {delay:.0f}s: {error}")
+                await self.store.fail(op["id"], attempts, error, datetime.now(pytz.utc) + timedelta(seconds=delay))
+        logger.info(f"OUTBOX_LOG - Lote procesado: {len(completed_ids)} operaciones completadas, {len(errors_by_op)} fallidas.")
+
+    async def run(self) -> None:
+        logger.info(f"OUTBOX_LOG - Iniciando worker del outbox de storage (lote {self.batch_size}, sondeo cada {self.poll_interval_seconds}s).")
+        while not self._stop_event.is_set():
+            _wakeup_event.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"OUTBOX_LOG - Error drenando el outbox: {type(e).__name__} - {e}", exc_info=True)
+            # Despierta antes del sondeo si un endpoint de este proceso encoló algo, o al pedir la parada.
+            wakeup_task = asyncio.ensure_future(_wakeup_event.wait())
+            stop_task = asyncio.ensure_future(self._stop_event.wait())
+            await asyncio.wait({wakeup_task, stop_task}, timeout=self.poll_interval_seconds, return_when=asyncio.FIRST_COMPLETED)
+            wakeup_task.cancel()
+            stop_task.cancel()
+        logger.info("OUTBOX_LOG - Worker del outbox de storage detenido.")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def build_outbox_worker_from_settings() -> StorageOutboxWorker:
+    return StorageOutboxWorker(
+        store=get_outbox_store(),
+        batch_size=settings.STORAGE_OUTBOX_BATCH_SIZE,
+        poll_interval_seconds=settings.STORAGE_OUTBOX_POLL_INTERVAL_SECONDS,
+        claim_lease_seconds=settings.STORAGE_OUTBOX_CLAIM_LEASE_SECONDS,
+        max_attempts=settings.STORAGE_OUTBOX_MAX_ATTEMPTS,
+        backoff_base_seconds=settings.STORAGE_OUTBOX_BACKOFF_BASE_SECONDS,
+        backoff_max_seconds=settings.STORAGE_OUTBOX_BACKOFF_MAX_SECONDS,
+    )
+
+
+async def _run_standalone() -> None:
+    try:
+        await build_outbox_worker_from_settings().run()
+    finally:
+        await close_supabase_client()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone())
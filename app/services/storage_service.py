@@ -1,18 +1,42 @@
 # app/services/storage_service.py
+import asyncio
 import logging
 import time
-import asyncio
 import uuid # Para generar nombres de archivo únicos para post_media
-from typing import List, Tuple, Optional, Dict 
+from datetime import datetime
+from typing import AsyncIterator, List, Tuple, Optional, Dict 
 from uuid import UUID as PyUUID
 
-from supabase import Client as SupabaseClient # Asumo que este es el cliente que estás usando
+from app.core.config import settings
+from app.db.supabase_client import SupabaseClient # Cliente asíncrono compartido
 
 # --- Constantes de Buckets ---
 POST_MEDIA_BUCKET = "media.content" # Asumo que este es el bucket de medios finales
 POST_PREVIEWS_BUCKET = "post.previews"   # Asumo que este es el bucket para WIP y previsualizaciones
 WIP_FOLDER_NAME = "wip"
 WIP_ACTIVE_FILENAME_BASE = "preview_active" # Usado para construir el nombre del archivo activo en WIP
+MEDIA_BLOBS_FOLDER_NAME = "blobs" # Medios deduplicados por contenido (ver media_blobs.py)
+
+# --- Tipos de imagen aceptados (firma de los primeros bytes -> (content_type, extensión)) ---
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+    (b"\xff\xd8\xff", "image/jpeg", "jpg"),
+    (b"GIF87a", "image/gif", "gif"),
+    (b"GIF89a", "image/gif", "gif"),
+]
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    """Detecta el tipo real de imagen por sus magic bytes. Devuelve (content_type, extensión) o None."""
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    for signature, content_type, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type, extension
+    return None
+
+# --- Borrado en lote ---
+STORAGE_REMOVE_CHUNK_SIZE = 1000 # Máximo de paths por llamada de borrado de Supabase Storage
+STORAGE_REMOVE_MAX_CONCURRENCY = 4 # Trozos de borrado en paralelo
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +47,9 @@ logger = logging.getLogger(__name__)
 def get_post_media_storage_path(organization_id: PyUUID, post_id: PyUUID, final_filename_with_extension: str) -> str:
     return f"{str(organization_id)}/posts/{str(post_id)}/images/{final_filename_with_extension}"
 
+def get_media_blob_storage_path(organization_id: PyUUID, sha256_hex: str, extension: str) -> str:
+    return f"{str(organization_id)}/{MEDIA_BLOBS_FOLDER_NAME}/{sha256_hex}.{extension.lstrip('.').lower()}"
+
 def get_wip_folder_path(organization_id: PyUUID, post_id: PyUUID) -> str:
     # Asegúrate que el path de la carpeta termine con '/' para la función list() de Supabase
     # si esa es la convención que necesita para listar solo el contenido de esa carpeta.
@@ -38,8 +65,9 @@ def get_wip_image_storage_path(organization_id: PyUUID, post_id: PyUUID, extensi
 
 # --- Funciones de Interacción con Storage ---
 
-def _build_public_url(supabase_client: SupabaseClient, bucket_name: str, file_path_in_bucket: str, add_timestamp_bust: bool = False) -> str:
-    public_url = supabase_client.storage.from_(bucket_name).get_public_url(file_path_in_bucket)
+async def build_public_url(supabase_client: SupabaseClient, bucket_name: str, file_path_in_bucket: str, add_timestamp_bust: bool = False) -> str:
+    """URL pública de un archivo ya subido (sin llamar al storage). `add_timestamp_bust` añade ?v=<epoch> contra cachés."""
+    public_url = await supabase_client.storage.from_(bucket_name).get_public_url(file_path_in_bucket)
     if add_timestamp_bust:
         timestamp = int(time.time())
         public_url = f"{public_url}?v={timestamp}"
@@ -55,47 +83,81 @@ async def upload_file_bytes_to_storage(
     add_timestamp_to_url: bool = False
 ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
     try:
-        def _upload_sync():
-            response_data = supabase_client.storage.from_(bucket_name).upload(
-                path=file_path_in_bucket,
-                file=file_bytes,
-                file_options={"content-type": content_type, "upsert": str(upsert).lower()},
-            )
-            return response_data
-        await asyncio.to_thread(_upload_sync)
-        public_url = _build_public_url(supabase_client, bucket_name, file_path_in_bucket, add_timestamp_bust=add_timestamp_to_url)
+        await supabase_client.storage.from_(bucket_name).upload(
+            path=file_path_in_bucket,
+            file=file_bytes,
+            file_options={"content-type": content_type, "upsert": str(upsert).lower()},
+        )
+        public_url = await build_public_url(supabase_client, bucket_name, file_path_in_bucket, add_timestamp_bust=add_timestamp_to_url)
         logger.info(f"Archivo subido a {bucket_name}/{file_path_in_bucket}. URL: {public_url}")
         return public_url, file_path_in_bucket, None
     except Exception as e:
         logger.error(f"Error al subir a Supabase Storage (bucket: {bucket_name}, path: {file_path_in_bucket}): {type(e).__name__} - {e}", exc_info=True)
         return None, None, str(e)
 
+async def upload_file_stream_to_storage(
+    supabase_client: SupabaseClient,
+    bucket_name: str,
+    file_path_in_bucket: str,
+    chunks: AsyncIterator[bytes],
+    content_type: str,
+    upsert: bool = True,
+    add_timestamp_to_url: bool = False
+) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Como upload_file_bytes_to_storage, pero envía el archivo como cuerpo binario en streaming
+    (chunked) a partir de `chunks`: nunca se arma un único `bytes` con el archivo completo.
+    storage3 solo sube bytes/archivos en multipart, así que se usa el `_request` de su file API.
+    Si el iterador lanza una excepción, la subida se aborta y el objeto no se crea ni se sobrescribe.
+    """
+    try:
+        await supabase_client.storage.from_(bucket_name)._request(
+            "POST",
+            ["object", bucket_name, *[part for part in file_path_in_bucket.split("/") if part]],
+            headers={"content-type": content_type, "cache-control": "max-age=3600", "x-upsert": str(upsert).lower()},
+            content=chunks,
+        )
+        public_url = await build_public_url(supabase_client, bucket_name, file_path_in_bucket, add_timestamp_bust=add_timestamp_to_url)
+        logger.info(f"Archivo subido (streaming) a {bucket_name}/{file_path_in_bucket}. URL: {public_url}")
+        return public_url, file_path_in_bucket, None
+    except Exception as e:
+        logger.error(f"Error al subir en streaming a Supabase Storage (bucket: {bucket_name}, path: {file_path_in_bucket}): {type(e).__name__} - {e}", exc_info=True)
+        return None, None, str(e)
+
 async def move_file_in_storage(
     supabase_client: SupabaseClient,
     source_bucket: str,
     source_path_in_bucket: str,
     destination_bucket: str, # Este será POST_MEDIA_BUCKET
     destination_path_in_bucket: str,
-    content_type_for_destination: str
+    content_type_for_destination: str,
+    delete_source: bool = True # False: entre buckets solo copia; el llamador se encarga de borrar el origen
 ) -> Tuple[Optional[str], Optional[str]]:
     
     logger.info(f"MOVE_LOG - Iniciando move de {source_bucket}/{source_path_in_bucket} a {destination_bucket}/{destination_path_in_bucket}")
     try:
         if source_bucket == destination_bucket:
-            # Envolver llamada síncrona
-            def _move_sync():
-                return supabase_client.storage.from_(source_bucket).move(
-                    from_path=source_path_in_bucket,
-                    to_path=destination_path_in_bucket
-                )
-            await asyncio.to_thread(_move_sync)
+            await supabase_client.storage.from_(source_bucket).move(
+                from_path=source_path_in_bucket,
+                to_path=destination_path_in_bucket
+            )
             logger.info(f"Archivo movido de {source_bucket}/{source_path_in_bucket} a {destination_bucket}/{destination_path_in_bucket} (mismo bucket).")
             return destination_path_in_bucket, None
+        elif settings.STORAGE_SERVER_SIDE_CROSS_BUCKET_COPY:
+            # Copia entre buckets del lado del servidor: los bytes no pasan por la API y la latencia no depende del tamaño.
+            copied_path, copy_error = await copy_file_in_storage(
+                supabase_client, source_bucket, source_path_in_bucket, destination_path_in_bucket,
+                destination_bucket=destination_bucket
+            )
+            if copy_error:
+                logger.error(f"MOVE_LOG - Fallo al copiar a destino {destination_bucket}: {copy_error}")
+                return None, copy_error
+            if delete_source:
+                await delete_files_from_storage(supabase_client, source_bucket, [source_path_in_bucket])
+            return copied_path, None
         else:
-            # Descargar (síncrono envuelto)
-            def _download_sync():
-                return supabase_client.storage.from_(source_bucket).download(path=source_path_in_bucket)
-            file_bytes_to_move: bytes = await asyncio.to_thread(_download_sync)
+            # Instancias de Storage sin `destinationBucket`: descargar y volver a subir.
+            file_bytes_to_move: bytes = await supabase_client.storage.from_(source_bucket).download(path=source_path_in_bucket)
             logger.debug(f"MOVE_LOG - Intentando subir a: {destination_bucket}/{destination_path_in_bucket} con content_type: {content_type_for_destination}")
             _public_url, _path, upload_error = await upload_file_bytes_to_storage( # Esta función ya la tienes
             supabase_client=supabase_client,
@@ -110,89 +172,78 @@ async def move_file_in_storage(
                 logger.error(f"MOVE_LOG - Fallo al subir a destino {destination_bucket}: {upload_error}")
                 return None, upload_error
             logger.info(f"MOVE_LOG - Subida a {destination_path_in_bucket} en bucket {destination_bucket} completada.")
-            await delete_files_from_storage(supabase_client, source_bucket, [source_path_in_bucket])
+            if delete_source:
+                await delete_files_from_storage(supabase_client, source_bucket, [source_path_in_bucket])
             return destination_path_in_bucket, None
     except Exception as e:
         logger.error(f"Error moviendo archivo de {source_bucket}/{source_path_in_bucket} a {destination_bucket}/{destination_path_in_bucket}: {type(e).__name__} - {e}", exc_info=True)
         return None, f"Error de almacenamiento al mover archivo: {str(e)}"
 
-async def delete_files_from_storage(
+async def copy_file_in_storage(
     supabase_client: SupabaseClient,
     bucket_name: str,
-    list_of_file_paths: List[str]
-) -> List[Tuple[str, bool, Optional[str]]]:
-    if not list_of_file_paths:
-        return []
-    results = []
-    # La función remove puede tomar una lista de paths, así que podemos hacer una sola llamada.
-    # Sin embargo, para obtener resultados individuales por archivo, iterar puede ser más claro
-    # si la librería no devuelve un desglose claro para operaciones batch.
-    # supabase-py v2 .remove() sí devuelve una lista de resultados para cada path.
+    source_path_in_bucket: str,
+    destination_path_in_bucket: str,
+    destination_bucket: Optional[str] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Copia un objeto con la API `object/copy` de Storage: la copia se hace del lado del servidor, sin
+    que los bytes pasen por la API. Con `destination_bucket` distinto de `bucket_name` copia entre buckets.
+    Devuelve (ruta destino, error).
+    """
+    destination_bucket = destination_bucket or bucket_name
     try:
-        if not list_of_file_paths: # Doble check por si acaso
-            return []
-
-        logger.info(f"Intentando borrar los siguientes archivos del bucket '{bucket_name}': {list_of_file_paths}")
-        
-        # Envolver llamada síncrona
-        def _remove_sync():
-            return supabase_client.storage.from_(bucket_name).remove(paths=list_of_file_paths)
-        
-        response_data_list = await asyncio.to_thread(_remove_sync)
-        
-        # response_data_list debería ser una lista de dicts, uno por cada archivo intentado.
-        # Necesitamos mapear estos resultados a nuestros paths originales.
-        # Esto es un poco más complejo porque la respuesta no necesariamente mantiene el orden
-        # o incluye el path original de forma obvia.
-        # Asumamos por ahora que la librería se comporta bien y devuelve en orden o podemos inferirlo.
-        # Si la API devuelve un error general para el batch, response_data_list podría ser un dict de error.
-
-        if isinstance(response_data_list, list):
-            # Asumiendo que la respuesta tiene el mismo número de elementos que los paths enviados
-            # y que están en el mismo orden, o que cada item en response_data_list tiene una
-            # forma de identificar a qué archivo corresponde (ej. `item.get('name')`).
-            # El SDK de Supabase para Python, para .remove(paths), devuelve una lista de objetos
-            # que representan los archivos eliminados (o errores si alguno falló).
-            # Cada objeto en la lista devuelta por .remove() suele tener `name`, `id`, `bucket_id`, etc.
-            # si fue exitoso, o `error`, `message`, `statusCode` si falló para ese item específico.
-
-            path_to_result_map = {item.get("name"): item for item in response_data_list if item.get("name")}
+        file_api = supabase_client.storage.from_(bucket_name)
+        if destination_bucket == bucket_name:
+            await file_api.copy(
+                from_path=source_path_in_bucket,
+                to_path=destination_path_in_bucket
+            )
+        else:
+            # La API de Storage acepta `destinationBucket` en object/copy, pero storage3 todavía no lo expone.
+            await file_api._request(
+                "POST",
+                ["object", "copy"],
+                json={
+                    "bucketId": bucket_name,
+                    "sourceKey": source_path_in_bucket,
+                    "destinationBucket": destination_bucket,
+                    "destinationKey": destination_path_in_bucket,
+                },
+            )
+        logger.info(f"COPY_LOG - Archivo copiado de {bucket_name}/{source_path_in_bucket} a {destination_bucket}/{destination_path_in_bucket}.")
+        return destination_path_in_bucket, None
+    except Exception as e:
+        logger.error(f"Error copiando archivo de {bucket_name}/{source_path_in_bucket} a {destination_bucket}/{destination_path_in_bucket}: {type(e).__name__} - {e}", exc_info=True)
+        return None, f"Error de almacenamiento al copiar archivo: {str(e)}"
 
-            for path_attempted in list_of_file_paths:
-                # Extraer el nombre del archivo del path para buscarlo en la respuesta
-                # Esto asume que path_attempted es como "folder/subfolder/filename.ext"
-                # y que item.get("name") en la respuesta es "filename.ext" si el path en `list()` fue solo la carpeta.
-                # O si item.get("name") es la ruta completa, entonces podemos comparar directamente.
-                # La documentación de Supabase Storage indica que `name` en la respuesta de `remove`
-                # es la ruta completa del objeto eliminado.
-                
-                item_result = path_to_result_map.get(path_attempted)
+async def list_files_in_folder(
+    supabase_client: SupabaseClient,
+    bucket_name: str,
+    folder_path: str
+) -> List[Tuple[str, Optional[datetime]]]:
+    """
+    Devuelve (ruta completa desde la raíz del bucket, updated_at) de los archivos directos de `folder_path`.
+    Las subcarpetas se ignoran. Lanza la excepción del SDK si el listado falla.
+    """
+    folder_path_for_list = folder_path if folder_path.endswith('/') else folder_path + '/'
+    # .list() devuelve una lista de diccionarios directamente o lanza error
+    list_response: List[Dict[str, any]] = await supabase_client.storage.from_(bucket_name).list(path=folder_path_for_list)
+    if not list_response: # Carpeta vacía o no existe
+        return []
+    # `item['name']` es el nombre relativo a la carpeta; las carpetas tienen id=None en la respuesta de list.
+    return [
+        (f"{folder_path_for_list}{item['name']}", datetime.fromisoformat(item['updated_at']) if item.get('updated_at') else None)
+        for item in list_response if item.get('id') is not None
+    ]
 
-                if item_result:
-                    if item_result.get("error"): # Si el objeto de respuesta tiene un campo de error
-                        error_msg = f"Error: {item_result.get('error')}, Mensaje: {item_result.get('message', 'Error desconocido')}"
-                        logger.warning(f"Fallo al borrar {bucket_name}/{path_attempted}: {error_msg}")
-                        results.append((path_attempted, False, error_msg))
-                    else: # Asumimos éxito si no hay error explícito en el item
-                        logger.info(f"Archivo {bucket_name}/{path_attempted} borrado exitosamente (según respuesta individual).")
-                        results.append((path_attempted, True, None))
-                else:
-                    # Esto podría pasar si el archivo no existía y `remove` no lo incluye en la respuesta,
-                    # o si el mapeo por nombre falló.
-                    logger.warning(f"No se encontró resultado específico en la respuesta de borrado para {bucket_name}/{path_attempted}. Asumiendo que no existía o fue borrado.")
-                    results.append((path_attempted, True, "No se encontró resultado específico en la respuesta (podría no haber existido)."))
-        else:
-            # Si la respuesta no es una lista, podría ser un error general del batch.
-            error_msg_general = f"Respuesta inesperada o error general del batch al borrar archivos: {response_data_list}"
-            logger.error(error_msg_general)
-            for path_attempted in list_of_file_paths:
-                results.append((path_attempted, False, "Error general del batch de borrado."))
-                
-    except Exception as e_batch:
-        logger.error(f"Excepción general al intentar borrar archivos del bucket '{bucket_name}': {type(e_batch).__name__} - {e_batch}", exc_info=True)
-        for path_attempted in list_of_file_paths:
-            results.append((path_attempted, False, str(e_batch)))
-    return results
+async def list_file_paths_in_folder(
+    supabase_client: SupabaseClient,
+    bucket_name: str,
+    folder_path: str
+) -> List[str]:
+    """Como `list_files_in_folder`, solo las rutas."""
+    return [path for path, _updated_at in await list_files_in_folder(supabase_client, bucket_name, folder_path)]
 
 # ========================================================================
 # NUEVA FUNCIÓN: delete_all_files_in_wip_folder
@@ -216,27 +267,7 @@ async def delete_all_files_in_folder( # Esta es la versión genérica
     logger.info(f"Intentando limpiar la carpeta: '{bucket_name}/{folder_path_for_list}'")
 
     try:
-        # --- CORRECCIÓN: Envolver la llamada síncrona .list() en asyncio.to_thread ---
-        def _list_sync():
-            # Esta función se ejecutará en un hilo separado
-            # .list() devuelve una lista de diccionarios directamente o lanza error
-            return supabase_client.storage.from_(bucket_name).list(path=folder_path_for_list)
-
-        list_response: List[Dict[str, any]] = await asyncio.to_thread(_list_sync)
-        
-        if not list_response: # Carpeta vacía o no existe, o error al listar que devuelve None/[]
-            logger.info(f"No se encontraron archivos para borrar en {bucket_name}/{folder_path_for_list} o la carpeta no existe/está vacía.")
-            return True, None
-
-        # `item['name']` es el nombre del archivo/subcarpeta dentro de `folder_path_for_list`.
-        # Necesitamos construir la ruta completa desde la raíz del bucket para .remove().
-        files_to_delete_paths: List[str] = []
-        for item in list_response:
-            if item.get('id') is not None: # Es un archivo (las carpetas tienen id=None en la respuesta de list)
-                # Construir el path completo del archivo dentro del bucket
-                # folder_path_for_list ya tiene el trailing '/'
-                full_file_path = f"{folder_path_for_list}{item['name']}"
-                files_to_delete_paths.append(full_file_path)
+        files_to_delete_paths = await list_file_paths_in_folder(supabase_client, bucket_name, folder_path_for_list)
 
         if not files_to_delete_paths:
             logger.info(f"La carpeta '{bucket_name}/{folder_path_for_list}' no contiene archivos para eliminar (solo subcarpetas quizás).")
@@ -262,34 +293,46 @@ async def delete_all_files_in_folder( # Esta es la versión genérica
         logger.error(f"Excepción al limpiar la carpeta '{bucket_name}/{folder_path_for_list}': {type(e).__name__} - {e}", exc_info=True)
         return False, f"Error general al limpiar carpeta: {str(e)}"
 
-# Y asegúrate de que delete_files_from_storage también maneje correctamente el async con tu SDK:
 async def delete_files_from_storage(
     supabase_client: SupabaseClient,
     bucket_name: str,
     list_of_file_paths: List[str]
 ) -> List[Tuple[str, bool, Optional[str]]]:
+    """
+    Borra los archivos con llamadas `remove(paths=[...])` en lote: una sola llamada hasta
+    STORAGE_REMOVE_CHUNK_SIZE paths; las listas más grandes se trocean y los trozos corren en paralelo
+    (como mucho STORAGE_REMOVE_MAX_CONCURRENCY a la vez).
+
+    Devuelve un resultado por path, en el orden recibido: (path, éxito, error).
+    La respuesta de Storage lista los objetos borrados; un path que no aparece ya no existía y cuenta
+    como borrado (borrar es idempotente). Si falla la llamada de un trozo, fallan todos sus paths.
+    """
     if not list_of_file_paths:
         return []
-    results = []
-    for file_path in list_of_file_paths:
-        try:
-            def _remove_sync():
-                return supabase_client.storage.from_(bucket_name).remove(paths=[file_path])
-            
-            response_data_list = await asyncio.to_thread(_remove_sync) # ASUMIENDO que remove es síncrono
-            if response_data_list and isinstance(response_data_list, list) and len(response_data_list) > 0:
-                item_result = response_data_list[0]
-                if item_result.get("error"): # Supabase puede devolver un error por archivo
-                    error_msg = f"{item_result.get('error')}: {item_result.get('message', 'Error desconocido')}"
-                    logger.warning(f"Fallo al borrar {bucket_name}/{file_path}: {error_msg}")
-                    results.append((file_path, False, error_msg))
-                else: # Éxito
-                    logger.info(f"Archivo {bucket_name}/{file_path} borrado exitosamente.")
-                    results.append((file_path, True, None))
-            else: # Respuesta inesperada
-                logger.warning(f"Respuesta inesperada al borrar {bucket_name}/{file_path}: {response_data_list}")
-                results.append((file_path, False, "Respuesta inesperada del servicio de storage al borrar."))
-        except Exception as e_single:
-            logger.error(f"Excepción borrando archivo {bucket_name}/{file_path}: {type(e_single).__name__} - {e_single}", exc_info=True)
-            results.append((file_path, False, str(e_single)))
-    return results
\ No newline at end of file
+    unique_paths = list(dict.fromkeys(list_of_file_paths))
+    chunks = [unique_paths[start:start + STORAGE_REMOVE_CHUNK_SIZE] for start in range(0, len(unique_paths), STORAGE_REMOVE_CHUNK_SIZE)]
+    semaphore = asyncio.Semaphore(STORAGE_REMOVE_MAX_CONCURRENCY)
+
+    async def _remove_chunk(chunk: List[str]) -> Dict[str, Tuple[bool, Optional[str]]]:
+        async with semaphore:
+            try:
+                response_data_list = await supabase_client.storage.from_(bucket_name).remove(paths=chunk)
+            except Exception as e_chunk:
+                logger.error(f"Excepción borrando {len(chunk)} archivos del bucket '{bucket_name}': {type(e_chunk).__name__} - {e_chunk}", exc_info=True)
+                return {path: (False, str(e_chunk)) for path in chunk}
+        if not isinstance(response_data_list, list):
+            logger.error(f"Respuesta inesperada al borrar {len(chunk)} archivos del bucket '{bucket_name}': {response_data_list}")
+            return {path: (False, "Respuesta inesperada del servicio de storage al borrar.") for path in chunk}
+        chunk_results: Dict[str, Tuple[bool, Optional[str]]] = {path: (True, None) for path in chunk}
+        for item_result in response_data_list:
+            path = item_result.get("name") if isinstance(item_result, dict) else None
+            if path in chunk_results and item_result.get("error"): # Supabase puede devolver un error por archivo
+                chunk_results[path] = (False, f"{item_result.get('error')}: {item_result.get('message', 'Error desconocido')}")
+        return chunk_results
+
+    results_by_path: Dict[str, Tuple[bool, Optional[str]]] = {}
+    for chunk_results in await asyncio.gather(*(_remove_chunk(chunk) for chunk in chunks)):
+        results_by_path.update(chunk_results)
+    failed = sum(1 for success, _ in results_by_path.values() if not success)
+    logger.info(f"Borrado en '{bucket_name}': {len(unique_paths) - failed}/{len(unique_paths)} archivos en {len(chunks)} llamada(s).")
+    return [(path, *results_by_path[path]) for path in list_of_file_paths]
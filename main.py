@@ -1,9 +1,18 @@
 # main.py
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # Importaciones de Configuración y Servicios
 from app.core.config import settings
+from app.db.supabase_client import close_supabase_client
+from app.api.v1.dependencies.auth import get_auth_cache_stats
+from app.core import idempotency
+from app.core.jwks import jwks_key_cache
+from app.services import image_variants, post_list_cache
+from app.services.post_scheduler import build_dispatcher_from_settings
+from app.services.storage_outbox import build_outbox_worker_from_settings
 #from app.services.ai_content_generator import init_gemini_model # Para texto
 #from app.services.ai_image_generator import init_image_generation_model # Para imagen
 
@@ -34,6 +43,36 @@ async def startup_event():
     else:
         print("WARN startup: GOOGLE_API_KEY no está configurada en la aplicación. La funcionalidad de Gemini dependerá de que la librería la encuentre de otra forma o fallará.")
 
+    # Precargar las claves públicas (JWKS) para verificar tokens RS256/ES256 sin red en el path del request
+    if not await jwks_key_cache.refresh():
+        print("WARN startup: No se pudo cargar el JWKS. Los tokens asimétricos fallarán hasta que un refresco tenga éxito.")
+
+    # Despachador de posts programados dentro de este proceso (alternativa: python -m app.services.post_scheduler)
+    if settings.SCHEDULER_ENABLED:
+        app.state.post_dispatcher = build_dispatcher_from_settings()
+        app.state.post_dispatcher_task = asyncio.create_task(app.state.post_dispatcher.run())
+        print(f"INFO startup: Despachador de posts programados iniciado (worker {app.state.post_dispatcher.worker_id}).")
+
+    # Worker del outbox de storage (borrados/purgas encolados por los endpoints; alternativa: python -m app.services.storage_outbox)
+    if settings.STORAGE_OUTBOX_WORKER_ENABLED:
+        app.state.storage_outbox_worker = build_outbox_worker_from_settings()
+        app.state.storage_outbox_worker_task = asyncio.create_task(app.state.storage_outbox_worker.run())
+        print(f"INFO startup: Worker del outbox de storage iniciado (backend {settings.STORAGE_OUTBOX_BACKEND}).")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    print("INFO: Cerrando aplicación FastAPI...")
+    if getattr(app.state, "post_dispatcher", None):
+        app.state.post_dispatcher.stop()
+        await app.state.post_dispatcher_task
+    # Variantes de imagen en curso (pueden encolar borrados en el outbox) y pool de procesos de Pillow
+    await image_variants.shutdown()
+    if getattr(app.state, "storage_outbox_worker", None):
+        app.state.storage_outbox_worker.stop()
+        await app.state.storage_outbox_worker_task
+    # Liberar el pool de conexiones HTTP del cliente asíncrono de Supabase
+    await close_supabase_client()
+
 
 # 3. Configurar Middlewares (como CORS)
 origins = [
@@ -49,6 +88,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"], # Cursor de GET /posts, ETag de las lecturas condicionales y marca de respuesta idempotente repetida
 )
 
 # 4. Registrar Routers
@@ -83,5 +123,10 @@ app.include_router(
 async def root():
     return {"message": f"Welcome to {settings.PROJECT_NAME}!"}
 
+@app.get("/health/caches", tags=["Root"])
+async def cache_stats():
+    """Contadores (hits/misses, tamaño, memoria) de las cachés en memoria de este worker."""
+    return {**get_auth_cache_stats(), "post_lists": post_list_cache.stats(), "idempotency": idempotency.stats()}
+
 # Para ejecutar con Uvicorn desde la terminal (en la raíz del proyecto):
 # uvicorn main:app --reload --host 0.0.0.0 --port 8000
\ No newline at end of file
@@ -0,0 +1,130 @@
+# scripts/bench_wip_upload_memory.py
+"""
+Benchmark del pico de memoria por subida de previsualización WIP (POST /posts/{post_id}/upload-wip-preview).
+
+Compara, con tracemalloc:
+- "read()+bytes": el camino anterior, `await image_file.read()` + `upload_file_bytes_to_storage`.
+- "endpoint (stream)": `upload_user_preview_image_to_wip` tal cual, que sube con `upload_file_stream_to_storage`.
+
+Se usan storage3 y postgrest reales; solo el HTTP va a un transporte httpx en memoria que CONSUME el cuerpo
+en streaming (httpx.MockTransport lo bufferiza entero y falsearía la medición). El archivo subido es un
+SpooledTemporaryFile que pasa a disco a partir de 1 MiB, como el UploadFile de Starlette.
+
+Uso (desde la raíz del repo, con el .env habitual):
+    python scripts/bench_wip_upload_memory.py [tamaños en MB, por defecto 5 20 50]
+"""
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+import uuid
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from starlette.datastructures import Headers, UploadFile
+from storage3 import AsyncStorageClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.api.v1.dependencies.auth import TokenData  # noqa: E402
+from app.api.v1.routers.posts import upload_user_preview_image_to_wip  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services import storage_service  # noqa: E402
+
+BASE_URL = "http://supabase.bench"
+SPOOL_MAX_SIZE = 1024 * 1024
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class _StreamingTransport(httpx.AsyncBaseTransport):
+    """Responde como Supabase y lee los cuerpos de las subidas chunk a chunk, sin acumularlos."""
+
+    def __init__(self, post_id: str):
+        self.post_id = post_id
+        self.uploaded_bytes = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.startswith("/storage/v1/object/list/"):
+            return httpx.Response(200, json=[])
+        if path.startswith("/storage/v1/object/"):
+            self.uploaded_bytes = 0
+            async for chunk in request.stream:
+                self.uploaded_bytes += len(chunk)
+            return httpx.Response(200, json={"Key": path.removeprefix("/storage/v1/object/")})
+        if path.startswith("/rest/v1/posts"):
+            return httpx.Response(200, json=[{"id": self.post_id}])
+        return httpx.Response(404, json={"message": f"No simulado: {request.method} {path}"})
+
+
+class _BenchSupabase:
+    """Cliente con la misma interfaz que usa el endpoint (storage, table, rpc) sobre el transporte en memoria."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        headers = {"apikey": "bench", "Authorization": "Bearer bench"}
+        self.storage = AsyncStorageClient(f"{BASE_URL}/storage/v1/", headers, http_client=httpx.AsyncClient(transport=transport, headers=headers))
+        self.postgrest = AsyncPostgrestClient(f"{BASE_URL}/rest/v1", headers=headers, http_client=httpx.AsyncClient(transport=transport, headers=headers))
+
+    def table(self, name: str):
+        return self.postgrest.from_(name)
+
+    def rpc(self, fn: str, params=None):
+        return self.postgrest.rpc(fn, params or {})
+
+
+def _make_upload(size_bytes: int) -> UploadFile:
+    spooled_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    spooled_file.write(PNG_SIGNATURE)
+    remaining = size_bytes - len(PNG_SIGNATURE)
+    block = b"\0" * SPOOL_MAX_SIZE
+    while remaining > 0:
+        spooled_file.write(block[:remaining])
+        remaining -= len(block)
+    spooled_file.seek(0)
+    # Sin `size`: el navegador no siempre lo informa y así se ejercita el tope durante el streaming.
+    return UploadFile(spooled_file, size=None, filename="bench.png", headers=Headers({"content-type": "image/png"}))
+
+
+async def _upload_read_all(supabase: _BenchSupabase, image_file: UploadFile, organization_id: uuid.UUID, post_id: uuid.UUID) -> None:
+    file_bytes = await image_file.read()
+    _url, _path, upload_error = await storage_service.upload_file_bytes_to_storage(
+        supabase, storage_service.POST_PREVIEWS_BUCKET, f"{storage_service.get_wip_folder_path(organization_id, post_id)}/preview_active.png", file_bytes, "image/png"
+    )
+    if upload_error:
+        raise RuntimeError(upload_error)
+
+
+async def _upload_endpoint(supabase: _BenchSupabase, image_file: UploadFile, organization_id: uuid.UUID, post_id: uuid.UUID) -> None:
+    current_user = TokenData(user_id=uuid.uuid4(), organization_id=organization_id)
+    await upload_user_preview_image_to_wip(post_id=post_id, image_file=image_file, current_user=current_user, supabase=supabase)
+
+
+async def _measure(upload_fn, size_mb: int) -> tuple:
+    organization_id, post_id = uuid.uuid4(), uuid.uuid4()
+    transport = _StreamingTransport(str(post_id))
+    supabase = _BenchSupabase(transport)
+    image_file = _make_upload(size_mb * 1024 * 1024)
+    tracemalloc.start()
+    try:
+        await upload_fn(supabase, image_file, organization_id, post_id)
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        await image_file.close()
+    return peak, transport.uploaded_bytes
+
+
+async def main(sizes_mb) -> None:
+    settings.WIP_UPLOAD_MAX_BYTES = max(sizes_mb) * 1024 * 1024 + 1
+    print(f"{'tamaño':>8}  {'camino':<20}{'pico':>12}  subido")
+    for size_mb in sizes_mb:
+        for name, upload_fn in (("read()+bytes", _upload_read_all), ("endpoint (stream)", _upload_endpoint)):
+            peak, uploaded_bytes = await _measure(upload_fn, size_mb)
+            print(f"{size_mb:>5} MB  {name:<20}{peak / (1024 * 1024):>8.2f} MiB  {uploaded_bytes} bytes")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main([int(arg) for arg in sys.argv[1:]] or [5, 20, 50]))
@@ -0,0 +1,5 @@
+-- Índice para la paginación por keyset de GET /api/v1/posts.
+-- El listado filtra por organización + autor y ordena por (created_at DESC, id DESC);
+-- con este índice cada página es un "index range scan" desde el cursor, sin ordenar ni saltar filas.
+create index if not exists posts_org_author_created_at_id_idx
+    on public.posts (organization_id, author_user_id, created_at desc, id desc);
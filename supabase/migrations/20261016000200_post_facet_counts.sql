@@ -0,0 +1,61 @@
+-- Conteos agregados para el dashboard de posts (GET /api/v1/posts/facets) en una sola consulta.
+-- Mismo scoping que GET /posts: organización + autor, rango opcional sobre created_at y filtro de borrado.
+-- Los conteos por estado / red social / tipo respetan p_deleted_filter; el conteo por estado de
+-- borrado ('not_deleted' / 'deleted') se calcula siempre sobre todos los posts del rango.
+create or replace function public.post_facet_counts(
+    p_organization_id uuid,
+    p_author_user_id uuid,
+    p_date_from timestamptz default null,
+    p_date_to timestamptz default null,
+    p_deleted_filter text default 'not_deleted'
+)
+returns jsonb
+language sql
+stable
+security invoker
+as $$
+    with scoped as (
+        select
+            p.status,
+            p.social_network,
+            p.content_type,
+            p.deleted_at is not null as is_deleted
+        from public.posts p
+        where p.organization_id = p_organization_id
+          and p.author_user_id = p_author_user_id
+          and (p_date_from is null or p.created_at >= p_date_from)
+          and (p_date_to is null or p.created_at <= p_date_to)
+    ),
+    filtered as (
+        select *
+        from scoped
+        where p_deleted_filter = 'all'
+           or (p_deleted_filter = 'deleted' and is_deleted)
+           or (p_deleted_filter = 'not_deleted' and not is_deleted)
+    ),
+    grouped as (
+        select
+            case
+                when grouping(status) = 0 then 'status'
+                when grouping(social_network) = 0 then 'social_network'
+                else 'content_type'
+            end as facet,
+            coalesce(status, social_network, content_type, 'unknown') as facet_value,
+            count(*) as n
+        from filtered
+        group by grouping sets ((status), (social_network), (content_type))
+    )
+    select jsonb_build_object(
+        'total', (select count(*) from filtered),
+        'status', coalesce((select jsonb_object_agg(facet_value, n) from grouped where facet = 'status'), '{}'::jsonb),
+        'social_network', coalesce((select jsonb_object_agg(facet_value, n) from grouped where facet = 'social_network'), '{}'::jsonb),
+        'content_type', coalesce((select jsonb_object_agg(facet_value, n) from grouped where facet = 'content_type'), '{}'::jsonb),
+        'deleted', (
+            select jsonb_build_object(
+                'not_deleted', count(*) filter (where not is_deleted),
+                'deleted', count(*) filter (where is_deleted)
+            )
+            from scoped
+        )
+    );
+$$;
@@ -0,0 +1,73 @@
+-- Calendario de contenido (GET /api/v1/posts/calendar): posts programados agrupados por día de
+-- `scheduled_at` en la zona horaria del usuario, con un resumen compacto por día.
+
+-- Range scan sobre scheduled_at dentro de (organización, autor); solo posts activos y programados.
+create index if not exists posts_org_author_scheduled_at_idx
+    on public.posts (organization_id, author_user_id, scheduled_at)
+    where deleted_at is null and scheduled_at is not null;
+
+create or replace function public.post_calendar_days(
+    p_organization_id uuid,
+    p_author_user_id uuid,
+    p_from timestamptz,
+    p_to timestamptz,
+    p_timezone text default 'UTC',
+    p_max_posts_per_day integer default 5
+)
+returns table (day date, total bigint, by_status jsonb, posts jsonb)
+language sql
+stable
+security invoker
+as $$
+    with scheduled as (
+        select
+            p.id,
+            p.title,
+            p.status,
+            p.social_network,
+            p.content_type,
+            p.scheduled_at,
+            (p.scheduled_at at time zone p_timezone)::date as day
+        from public.posts p
+        where p.organization_id = p_organization_id
+          and p.author_user_id = p_author_user_id
+          and p.deleted_at is null
+          and p.scheduled_at >= p_from
+          and p.scheduled_at < p_to
+    ),
+    ranked as (
+        select s.*, row_number() over (partition by s.day order by s.scheduled_at, s.id) as rn
+        from scheduled s
+    ),
+    status_counts as (
+        select c.day, jsonb_object_agg(c.status, c.n) as by_status
+        from (
+            select s.day, coalesce(s.status, 'unknown') as status, count(*) as n
+            from scheduled s
+            group by s.day, coalesce(s.status, 'unknown')
+        ) c
+        group by c.day
+    )
+    select
+        r.day,
+        count(*) as total,
+        sc.by_status,
+        coalesce(
+            jsonb_agg(
+                jsonb_build_object(
+                    'id', r.id,
+                    'title', r.title,
+                    'status', r.status,
+                    'social_network', r.social_network,
+                    'content_type', r.content_type,
+                    'scheduled_at', r.scheduled_at
+                )
+                order by r.scheduled_at, r.id
+            ) filter (where r.rn <= p_max_posts_per_day),
+            '[]'::jsonb
+        ) as posts
+    from ranked r
+    join status_counts sc on sc.day = r.day
+    group by r.day, sc.by_status
+    order by r.day;
+$$;
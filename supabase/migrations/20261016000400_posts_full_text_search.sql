@@ -0,0 +1,60 @@
+-- Búsqueda de texto completo sobre título y contenido de los posts (GET /api/v1/posts/search).
+-- Columna tsvector generada con la configuración 'spanish' (título con peso A, contenido con peso B)
+-- e índice GIN; los resultados se ordenan por relevancia con paginación keyset sobre (rank, id).
+
+alter table public.posts
+    add column if not exists search_vector tsvector
+    generated always as (
+        setweight(to_tsvector('spanish', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(content_text, '')), 'B')
+    ) stored;
+
+create index if not exists posts_search_vector_idx
+    on public.posts using gin (search_vector);
+
+create or replace function public.search_posts(
+    p_organization_id uuid,
+    p_author_user_id uuid,
+    p_query text,
+    p_limit integer default 20,
+    p_after_rank real default null,
+    p_after_id uuid default null,
+    p_deleted_filter text default 'not_deleted',
+    p_status text default null,
+    p_social_network text default null,
+    p_content_type text default null,
+    p_date_from timestamptz default null,
+    p_date_to timestamptz default null
+)
+returns table (post jsonb, rank real)
+language sql
+stable
+security invoker
+as $$
+    with query as (
+        select websearch_to_tsquery('spanish', p_query) as tsq
+    ),
+    matches as (
+        select p.*, ts_rank_cd(p.search_vector, query.tsq) as search_rank
+        from public.posts p, query
+        where p.search_vector @@ query.tsq
+          and p.organization_id = p_organization_id
+          and p.author_user_id = p_author_user_id
+          and (
+              p_deleted_filter = 'all'
+              or (p_deleted_filter = 'deleted' and p.deleted_at is not null)
+              or (p_deleted_filter = 'not_deleted' and p.deleted_at is null)
+          )
+          and (p_status is null or p.status = p_status)
+          and (p_social_network is null or p.social_network = p_social_network)
+          and (p_content_type is null or p.content_type = p_content_type)
+          and (p_date_from is null or p.created_at >= p_date_from)
+          and (p_date_to is null or p.created_at <= p_date_to)
+    )
+    select to_jsonb(m) - 'search_vector' - 'search_rank', m.search_rank
+    from matches m
+    where p_after_rank is null
+       or (m.search_rank, m.id) < (p_after_rank, p_after_id)
+    order by m.search_rank desc, m.id desc
+    limit p_limit;
+$$;
@@ -0,0 +1,47 @@
+-- Despachador de posts programados (app/services/post_scheduler.py).
+-- Un post con status = 'scheduled' y scheduled_at vencido se "reclama" en lote con FOR UPDATE SKIP LOCKED,
+-- pasa a 'publishing' y, tras publicarse, a 'published' con published_at. Varios workers pueden reclamar
+-- a la vez sin procesar dos veces el mismo post; un reclamo abandonado (worker caído) vence tras p_lease_seconds.
+
+alter table public.posts
+    add column if not exists publish_claimed_at timestamptz,
+    add column if not exists publish_claimed_by text,
+    add column if not exists publish_attempts integer not null default 0,
+    add column if not exists publish_error text;
+
+create index if not exists posts_due_for_publish_idx
+    on public.posts (scheduled_at)
+    where status in ('scheduled', 'publishing') and deleted_at is null;
+
+create or replace function public.claim_due_posts(
+    p_worker_id text,
+    p_batch_size integer default 50,
+    p_lease_seconds integer default 300
+)
+returns setof public.posts
+language sql
+volatile
+security invoker
+as $$
+    with due as (
+        select p.id
+        from public.posts p
+        where p.deleted_at is null
+          and p.scheduled_at <= now()
+          and (
+              p.status = 'scheduled'
+              or (p.status = 'publishing' and p.publish_claimed_at < now() - make_interval(secs => p_lease_seconds))
+          )
+        order by p.scheduled_at, p.id
+        limit p_batch_size
+        for update skip locked
+    )
+    update public.posts p
+    set status = 'publishing',
+        publish_claimed_at = now(),
+        publish_claimed_by = p_worker_id,
+        publish_attempts = p.publish_attempts + 1
+    from due
+    where p.id = due.id
+    returning p.*;
+$$;
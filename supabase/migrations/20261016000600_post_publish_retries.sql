@@ -0,0 +1,43 @@
+-- Cola durable de reintentos del pipeline de publicación (app/services/publishing_pipeline.py).
+-- Una fila por post con publicación fallida; el pipeline la reclama cuando vence next_attempt_at
+-- (FOR UPDATE SKIP LOCKED + lease, igual que claim_due_posts) y la borra al publicar o al agotar intentos.
+
+create table if not exists public.post_publish_retries (
+    post_id uuid primary key references public.posts (id) on delete cascade,
+    social_network text not null,
+    attempts integer not null default 0,
+    next_attempt_at timestamptz not null default now(),
+    last_error text,
+    locked_until timestamptz,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists post_publish_retries_next_attempt_idx
+    on public.post_publish_retries (next_attempt_at);
+
+create or replace function public.claim_publish_retries(
+    p_batch_size integer default 50,
+    p_lease_seconds integer default 300
+)
+returns setof public.post_publish_retries
+language sql
+volatile
+security invoker
+as $$
+    with due as (
+        select r.post_id
+        from public.post_publish_retries r
+        where r.next_attempt_at <= now()
+          and (r.locked_until is null or r.locked_until < now())
+        order by r.next_attempt_at
+        limit p_batch_size
+        for update skip locked
+    )
+    update public.post_publish_retries r
+    set locked_until = now() + make_interval(secs => p_lease_seconds),
+        updated_at = now()
+    from due
+    where r.post_id = due.post_id
+    returning r.*;
+$$;
@@ -0,0 +1,17 @@
+-- Registro de limpiezas de storage que fallaron después de agotar sus reintentos
+-- (app/services/storage_cleanup.py). Las limpiezas corren en segundo plano tras responder,
+-- así que un fallo ya no se puede devolver al cliente: queda aquí para revisarlo o reprocesarlo.
+
+create table if not exists public.storage_cleanup_failures (
+    id uuid primary key default gen_random_uuid(),
+    bucket text not null,
+    path text not null,
+    post_id uuid,
+    context text not null,
+    error text,
+    attempts integer not null default 0,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists storage_cleanup_failures_created_at_idx
+    on public.storage_cleanup_failures (created_at desc);
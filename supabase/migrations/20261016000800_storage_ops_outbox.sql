@@ -0,0 +1,60 @@
+-- Outbox durable de operaciones de storage (app/services/storage_outbox.py).
+-- Los endpoints encolan aquí los borrados/purgas de archivos al hacer su escritura en la DB;
+-- un worker las reclama en lote (FOR UPDATE SKIP LOCKED + lease), las ejecuta agrupadas por bucket
+-- y borra la fila al terminar. Las que fallan se reprograman con backoff; al agotar intentos quedan en 'dead'.
+
+create table if not exists public.storage_ops_outbox (
+    id uuid primary key default gen_random_uuid(),
+    op text not null check (op in ('delete', 'purge_folder')),
+    bucket text not null,
+    path text not null,
+    post_id uuid,
+    context text not null default '',
+    status text not null default 'pending' check (status in ('pending', 'dead')),
+    attempts integer not null default 0,
+    next_attempt_at timestamptz not null default now(),
+    last_error text,
+    locked_until timestamptz,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists storage_ops_outbox_pending_idx
+    on public.storage_ops_outbox (next_attempt_at)
+    where status = 'pending';
+
+create or replace function public.claim_storage_ops(
+    p_batch_size integer default 500,
+    p_lease_seconds integer default 300
+)
+returns setof public.storage_ops_outbox
+language sql
+volatile
+security invoker
+as $$
+    with due as (
+        select o.id
+        from public.storage_ops_outbox o
+        where o.status = 'pending'
+          and o.next_attempt_at <= now()
+          and (o.locked_until is null or o.locked_until < now())
+        order by o.next_attempt_at
+        limit p_batch_size
+        for update skip locked
+    )
+    update public.storage_ops_outbox o
+    set locked_until = now() + make_interval(secs => p_lease_seconds),
+        updated_at = now()
+    from due
+    where o.id = due.id
+    returning o.*;
+$$;
+
+-- El outbox reemplaza al registro de limpiezas fallidas en segundo plano: lo pendiente se reencola.
+insert into public.storage_ops_outbox (op, bucket, path, post_id, context, last_error)
+select
+    case when f.error like 'Listado de carpeta WIP:%' then 'purge_folder' else 'delete' end,
+    f.bucket, f.path, f.post_id, f.context, f.error
+from public.storage_cleanup_failures f;
+
+drop table if exists public.storage_cleanup_failures;
@@ -0,0 +1,6 @@
+-- Variantes optimizadas (WebP/AVIF) de la imagen principal de cada post (app/services/image_variants.py).
+-- {"full": {...}, "medium": {...}, "thumbnail": {...}} con storage_path, url, width, height y content_type.
+-- Null mientras se generan o si el post no tiene imagen: el frontend usa media_url.
+
+alter table public.posts
+    add column if not exists media_variants jsonb;
@@ -0,0 +1,87 @@
+-- Deduplicación de medios por contenido (app/services/media_blobs.py).
+-- La imagen principal se guarda una sola vez por organización en media.content/{organization_id}/blobs/{sha256}.{ext};
+-- `media_blobs` cuenta cuántos posts apuntan a cada blob. Un blob solo se borra del storage cuando su
+-- contador llegó a 0 y sigue en 0 al ejecutar el borrado (operación 'delete_blob' del outbox + reap_media_blobs).
+
+create table if not exists public.media_blobs (
+    storage_path text primary key,
+    organization_id uuid not null,
+    sha256 text not null,
+    ref_count integer not null default 0 check (ref_count >= 0),
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists media_blobs_unreferenced_idx
+    on public.media_blobs (updated_at)
+    where ref_count = 0;
+
+-- sha256 de la previsualización WIP activa, calculado al subirla: permite confirmarla directo a su blob
+-- con una copia del lado del servidor, sin volver a leer los bytes.
+alter table public.posts
+    add column if not exists wip_media_sha256 text;
+
+alter table public.storage_ops_outbox
+    drop constraint if exists storage_ops_outbox_op_check;
+alter table public.storage_ops_outbox
+    add constraint storage_ops_outbox_op_check check (op in ('delete', 'purge_folder', 'delete_blob'));
+
+-- Suma `p_count` referencias (crea el blob si no existe). Devuelve el contador resultante:
+-- si es igual a `p_count`, el llamador es quien debe asegurar que el objeto exista en storage.
+create or replace function public.acquire_media_blob(
+    p_storage_path text,
+    p_organization_id uuid,
+    p_sha256 text,
+    p_count integer default 1
+)
+returns integer
+language sql
+volatile
+security invoker
+as $$
+    insert into public.media_blobs as b (storage_path, organization_id, sha256, ref_count)
+    values (p_storage_path, p_organization_id, p_sha256, p_count)
+    on conflict (storage_path) do update
+        set ref_count = b.ref_count + excluded.ref_count,
+            updated_at = now()
+    returning ref_count;
+$$;
+
+-- Resta una referencia por cada aparición de la ruta en `p_storage_paths` (nunca baja de 0).
+create or replace function public.release_media_blobs(p_storage_paths text[])
+returns void
+language sql
+volatile
+security invoker
+as $$
+    update public.media_blobs b
+    set ref_count = greatest(0, b.ref_count - d.releases),
+        updated_at = now()
+    from (
+        select path, count(*)::integer as releases
+        from unnest(p_storage_paths) as path
+        group by path
+    ) d
+    where b.storage_path = d.path;
+$$;
+
+-- Lo llama el worker del outbox antes de borrar blobs: elimina las filas que siguen sin referencias y
+-- devuelve las rutas que se pueden borrar del storage (las eliminadas ahora y las que ya no tenían fila).
+-- Las que se volvieron a adquirir mientras tanto no se devuelven.
+create or replace function public.reap_media_blobs(p_storage_paths text[])
+returns setof text
+language sql
+volatile
+security invoker
+as $$
+    with reaped as (
+        delete from public.media_blobs b
+        where b.storage_path = any(p_storage_paths)
+          and b.ref_count = 0
+        returning b.storage_path
+    )
+    select distinct path
+    from unnest(p_storage_paths) as path
+    where path in (select storage_path from reaped)
+       or not exists (select 1 from public.media_blobs b where b.storage_path = path);
+$$;
@@ -0,0 +1,73 @@
+-- Claves de idempotencia compartidas entre workers y réplicas (app/core/idempotency.py).
+-- La primera petición con una clave la "reclama" (status = 'in_progress', con lease) y al terminar guarda su
+-- respuesta (status = 'completed') hasta expires_at. Un reintento que llega a otro worker recibe esa respuesta
+-- o, si sigue en curso, espera. Si el dueño falla o se cancela, borra la fila y otro puede ejecutar;
+-- si el dueño se cae, su lease vence y el siguiente reclamo la toma.
+
+create table if not exists public.idempotency_keys (
+    scope text not null,
+    principal text not null,
+    idempotency_key text not null,
+    fingerprint text not null,
+    status text not null default 'in_progress' check (status in ('in_progress', 'completed')),
+    response jsonb,
+    owner_id text,
+    locked_until timestamptz,
+    expires_at timestamptz not null,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz not null default now(),
+    primary key (scope, principal, idempotency_key)
+);
+
+-- Para purgar las vencidas (ej. con pg_cron: delete from public.idempotency_keys where expires_at < now()).
+-- Reclamar una clave vencida ya la reutiliza, así que la purga solo acota el tamaño de la tabla.
+create index if not exists idempotency_keys_expires_at_idx
+    on public.idempotency_keys (expires_at);
+
+-- Reclama la clave para `p_owner_id` si no existe, venció o quedó en curso con el lease vencido.
+-- Devuelve claimed = true si el llamador debe ejecutar; si no, el estado actual de la clave
+-- (su fingerprint y, si terminó, su respuesta). Sin filas si la clave se liberó entre medio: se reintenta.
+create or replace function public.claim_idempotency_key(
+    p_scope text,
+    p_principal text,
+    p_idempotency_key text,
+    p_fingerprint text,
+    p_owner_id text,
+    p_lease_seconds integer,
+    p_ttl_seconds integer
+)
+returns table (claimed boolean, key_status text, key_fingerprint text, key_response jsonb)
+language plpgsql
+volatile
+security invoker
+as $$
+begin
+    insert into public.idempotency_keys as k (scope, principal, idempotency_key, fingerprint, status, owner_id, locked_until, expires_at)
+    values (
+        p_scope, p_principal, p_idempotency_key, p_fingerprint, 'in_progress', p_owner_id,
+        now() + make_interval(secs => p_lease_seconds), now() + make_interval(secs => p_ttl_seconds)
+    )
+    on conflict (scope, principal, idempotency_key) do update
+        set fingerprint = excluded.fingerprint,
+            status = 'in_progress',
+            response = null,
+            owner_id = excluded.owner_id,
+            locked_until = excluded.locked_until,
+            expires_at = excluded.expires_at,
+            updated_at = now()
+        where k.expires_at <= now()
+           or (k.status = 'in_progress' and k.locked_until <= now());
+    if found then
+        return query select true, 'in_progress'::text, p_fingerprint, null::jsonb;
+        return;
+    end if;
+
+    -- Otra sentencia (y otro snapshot): ve la fila aunque la haya insertado otra transacción recién.
+    return query
+        select false, k.status, k.fingerprint, k.response
+        from public.idempotency_keys k
+        where k.scope = p_scope
+          and k.principal = p_principal
+          and k.idempotency_key = p_idempotency_key;
+end;
+$$;
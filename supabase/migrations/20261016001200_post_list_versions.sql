@@ -0,0 +1,54 @@
+-- Versión compartida de los listados de posts por organización (app/services/post_list_cache.py).
+-- Cada INSERT/UPDATE/DELETE sobre posts sube la versión de las organizaciones afectadas en la misma transacción.
+-- GET /posts la lee antes de consultar y la incluye en la clave de su caché: una escritura hecha desde cualquier
+-- worker o réplica deja inalcanzables las páginas cacheadas por todos los demás.
+
+create table if not exists public.post_list_versions (
+    organization_id uuid primary key,
+    version bigint not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+-- Triggers por sentencia: un UPDATE masivo (bulk, despachador) sube la versión una vez por organización, no por fila.
+create or replace function public.bump_post_list_versions()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('INSERT', 'UPDATE') then
+        insert into public.post_list_versions as v (organization_id, version)
+        select distinct organization_id, 1 from new_posts where organization_id is not null
+        on conflict (organization_id) do update
+            set version = v.version + 1,
+                updated_at = now();
+    end if;
+    if tg_op in ('UPDATE', 'DELETE') then
+        insert into public.post_list_versions as v (organization_id, version)
+        select distinct organization_id, 1 from old_posts where organization_id is not null
+        on conflict (organization_id) do update
+            set version = v.version + 1,
+                updated_at = now();
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists posts_bump_list_version_insert on public.posts;
+create trigger posts_bump_list_version_insert
+    after insert on public.posts
+    referencing new table as new_posts
+    for each statement execute function public.bump_post_list_versions();
+
+drop trigger if exists posts_bump_list_version_update on public.posts;
+create trigger posts_bump_list_version_update
+    after update on public.posts
+    referencing old table as old_posts new table as new_posts
+    for each statement execute function public.bump_post_list_versions();
+
+drop trigger if exists posts_bump_list_version_delete on public.posts;
+create trigger posts_bump_list_version_delete
+    after delete on public.posts
+    referencing old table as old_posts
+    for each statement execute function public.bump_post_list_versions();
@@ -0,0 +1,70 @@
+-- Limpieza de storage de los posts encolada en la MISMA transacción que la escritura (app/services/storage_outbox.py).
+-- Antes, cada endpoint encolaba con un INSERT aparte después del UPDATE: si ese INSERT fallaba, los archivos
+-- quedaban huérfanos. Ahora un trigger sobre posts deriva las operaciones de la propia fila:
+-- - imagen principal anterior (al cambiarla o al borrar el post): 'delete' si es un archivo propio del post, o para
+--   un blob deduplicado (media_blobs) resta su referencia y encola 'delete_blob' (el worker solo lo borra si sigue
+--   sin referencias);
+-- - variantes anteriores que dejaron de estar registradas en media_variants;
+-- - carpeta WIP del post al borrarlo ('purge_folder').
+-- Los buckets coinciden con storage_service.POST_MEDIA_BUCKET y POST_PREVIEWS_BUCKET. La API ya no encola estas
+-- operaciones: solo las que no se derivan de la fila (rollbacks de subidas fallidas, previsualizaciones WIP).
+
+create or replace function public.enqueue_post_storage_ops()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_is_deleting boolean := old.deleted_at is null and new.deleted_at is not null;
+    v_context text := case when old.deleted_at is null and new.deleted_at is not null then 'post_soft_delete' else 'post_media_change' end;
+    v_post_prefix text := old.organization_id::text || '/posts/' || old.id::text || '/';
+begin
+    -- 1. Imagen principal anterior
+    if old.media_storage_path is not null
+       and (v_is_deleting or old.media_storage_path is distinct from new.media_storage_path) then
+        if old.media_storage_path ~ '^[0-9a-f-]{36}/blobs/[0-9a-f]{64}\.[a-z0-9]+$' then
+            update public.media_blobs
+            set ref_count = greatest(0, ref_count - 1),
+                updated_at = now()
+            where storage_path = old.media_storage_path;
+            insert into public.storage_ops_outbox (op, bucket, path, post_id, context)
+            values ('delete_blob', 'media.content', old.media_storage_path, old.id, v_context);
+        elsif old.media_storage_path like v_post_prefix || '%' then
+            -- Solo archivos propios del post: una ruta ajena fijada a mano en el PATCH no se borra.
+            insert into public.storage_ops_outbox (op, bucket, path, post_id, context)
+            values ('delete', 'media.content', old.media_storage_path, old.id, v_context);
+        end if;
+    end if;
+
+    -- 2. Variantes anteriores que ya no están en media_variants (regenerarlas con las mismas rutas no las borra)
+    if old.media_variants is not null
+       and (v_is_deleting or new.media_variants is distinct from old.media_variants) then
+        insert into public.storage_ops_outbox (op, bucket, path, post_id, context)
+        select distinct 'delete', 'media.content', v.value->>'storage_path', old.id, v_context
+        from jsonb_each(old.media_variants) v
+        where v.value->>'storage_path' like v_post_prefix || '%'
+          and (
+              v_is_deleting
+              or new.media_variants is null
+              or not exists (
+                  select 1 from jsonb_each(new.media_variants) n
+                  where n.value->>'storage_path' = v.value->>'storage_path'
+              )
+          );
+    end if;
+
+    -- 3. Carpeta WIP del post borrado
+    if v_is_deleting then
+        insert into public.storage_ops_outbox (op, bucket, path, post_id, context)
+        values ('purge_folder', 'post.previews', v_post_prefix || 'wip', old.id, v_context);
+    end if;
+
+    return null;
+end;
+$$;
+
+drop trigger if exists posts_enqueue_storage_ops on public.posts;
+create trigger posts_enqueue_storage_ops
+    after update of media_storage_path, media_variants, deleted_at on public.posts
+    for each row execute function public.enqueue_post_storage_ops();
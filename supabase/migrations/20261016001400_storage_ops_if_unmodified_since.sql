@@ -0,0 +1,65 @@
+-- Borrados condicionados en el outbox de storage (app/services/storage_outbox.py).
+-- Las previsualizaciones WIP (`preview_active.<ext>`) y las variantes (`{stem}_{variante}.<ext>`) reutilizan sus
+-- nombres: una operación encolada que corre tarde podía borrar un archivo subido después con el mismo nombre.
+-- Con if_unmodified_since, el worker solo borra los archivos cuyo updated_at en el storage no es posterior a ese
+-- instante (el de la fila que encoló la operación, o el updated_at listado al encolarla). Null: borrado incondicional.
+
+alter table public.storage_ops_outbox
+    add column if not exists if_unmodified_since timestamptz;
+
+-- El trigger de posts (20261016001300) condiciona la purga de la carpeta WIP y el borrado de variantes anteriores.
+-- now() es el inicio de la transacción del UPDATE, con el mismo reloj que storage.objects.updated_at.
+create or replace function public.enqueue_post_storage_ops()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_is_deleting boolean := old.deleted_at is null and new.deleted_at is not null;
+    v_context text := case when old.deleted_at is null and new.deleted_at is not null then 'post_soft_delete' else 'post_media_change' end;
+    v_post_prefix text := old.organization_id::text || '/posts/' || old.id::text || '/';
+begin
+    -- 1. Imagen principal anterior
+    if old.media_storage_path is not null
+       and (v_is_deleting or old.media_storage_path is distinct from new.media_storage_path) then
+        if old.media_storage_path ~ '^[0-9a-f-]{36}/blobs/[0-9a-f]{64}\.[a-z0-9]+$' then
+            update public.media_blobs
+            set ref_count = greatest(0, ref_count - 1),
+                updated_at = now()
+            where storage_path = old.media_storage_path;
+            insert into public.storage_ops_outbox (op, bucket, path, post_id, context)
+            values ('delete_blob', 'media.content', old.media_storage_path, old.id, v_context);
+        elsif old.media_storage_path like v_post_prefix || '%' then
+            -- Solo archivos propios del post: una ruta ajena fijada a mano en el PATCH no se borra.
+            insert into public.storage_ops_outbox (op, bucket, path, post_id, context)
+            values ('delete', 'media.content', old.media_storage_path, old.id, v_context);
+        end if;
+    end if;
+
+    -- 2. Variantes anteriores que ya no están en media_variants (regenerarlas con las mismas rutas no las borra)
+    if old.media_variants is not null
+       and (v_is_deleting or new.media_variants is distinct from old.media_variants) then
+        insert into public.storage_ops_outbox (op, bucket, path, post_id, context, if_unmodified_since)
+        select distinct 'delete', 'media.content', v.value->>'storage_path', old.id, v_context, now()
+        from jsonb_each(old.media_variants) v
+        where v.value->>'storage_path' like v_post_prefix || '%'
+          and (
+              v_is_deleting
+              or new.media_variants is null
+              or not exists (
+                  select 1 from jsonb_each(new.media_variants) n
+                  where n.value->>'storage_path' = v.value->>'storage_path'
+              )
+          );
+    end if;
+
+    -- 3. Carpeta WIP del post borrado
+    if v_is_deleting then
+        insert into public.storage_ops_outbox (op, bucket, path, post_id, context, if_unmodified_since)
+        values ('purge_folder', 'post.previews', v_post_prefix || 'wip', old.id, v_context, now());
+    end if;
+
+    return null;
+end;
+$$;
@@ -0,0 +1,110 @@
+-- Estado de subida y borrado seguro de los blobs deduplicados (app/services/media_blobs.py).
+-- Antes, quien adquiría un blob con ref_count > 1 devolvía su ruta aunque la primera subida no hubiera
+-- terminado (o fallara), y el worker del outbox podía borrar del storage un blob que otro request
+-- acababa de volver a adquirir y subir.
+-- - ready: el objeto está en storage. Solo se reutilizan blobs listos; si no, el que adquiere lo sube/copia
+--   él mismo (mismo contenido, sobrescribir es inocuo) y lo marca con mark_media_blob_ready.
+-- - reaping_until: el worker está borrando el objeto. Mientras dure, no se puede marcar listo (se volvería a
+--   borrar); el que adquiere espera y vuelve a subir.
+
+-- Las filas existentes se crearon al subir/copiar su objeto: quedan listas.
+alter table public.media_blobs
+    add column if not exists ready boolean not null default true;
+alter table public.media_blobs
+    alter column ready set default false;
+alter table public.media_blobs
+    add column if not exists reaping_until timestamptz;
+
+-- Suma `p_count` referencias (crea el blob si no existe) y devuelve el contador y si el objeto está listo.
+drop function if exists public.acquire_media_blob(text, uuid, text, integer);
+create or replace function public.acquire_media_blob(
+    p_storage_path text,
+    p_organization_id uuid,
+    p_sha256 text,
+    p_count integer default 1
+)
+returns table (ref_count integer, ready boolean)
+language sql
+volatile
+security invoker
+as $$
+    insert into public.media_blobs as b (storage_path, organization_id, sha256, ref_count)
+    values (p_storage_path, p_organization_id, p_sha256, p_count)
+    on conflict (storage_path) do update
+        set ref_count = b.ref_count + excluded.ref_count,
+            updated_at = now()
+    returning b.ref_count, b.ready;
+$$;
+
+-- Marca el blob como subido. Devuelve false si el worker lo está borrando (reaping_until vigente):
+-- el llamador debe esperar y volver a subirlo.
+create or replace function public.mark_media_blob_ready(p_storage_path text)
+returns boolean
+language sql
+volatile
+security invoker
+as $$
+    with marked as (
+        update public.media_blobs b
+        set ready = true,
+            updated_at = now()
+        where b.storage_path = p_storage_path
+          and (b.reaping_until is null or b.reaping_until <= now())
+        returning 1
+    )
+    select exists (select 1 from marked);
+$$;
+
+-- Primera fase del borrado (worker del outbox). Bloquea (UPDATE) las filas que siguen sin referencias, las marca
+-- no listas y en borrado durante `p_lease_seconds`, y devuelve sus rutas: solo esas se borran del storage.
+-- Las rutas sin fila (objetos huérfanos) se registran antes con 0 referencias para que un acquire concurrente
+-- vea el borrado en curso en lugar de crear una fila lista que el worker borraría después.
+drop function if exists public.reap_media_blobs(text[]);
+create or replace function public.reap_media_blobs(p_storage_paths text[], p_lease_seconds integer default 300)
+returns setof text
+language plpgsql
+volatile
+security invoker
+as $$
+begin
+    insert into public.media_blobs (storage_path, organization_id, sha256, ref_count, ready)
+    select distinct path, split_part(path, '/', 1)::uuid, split_part(split_part(path, '/', 3), '.', 1), 0, false
+    from unnest(p_storage_paths) as path
+    where path ~ '^[0-9a-f-]{36}/blobs/[0-9a-f]{64}\.[a-z0-9]+$'
+    on conflict (storage_path) do nothing;
+
+    return query
+        with reaping as (
+            update public.media_blobs b
+            set ready = false,
+                reaping_until = now() + make_interval(secs => p_lease_seconds),
+                updated_at = now()
+            where b.storage_path = any(p_storage_paths)
+              and b.ref_count = 0
+            returning b.storage_path
+        )
+        select reaping.storage_path from reaping;
+end;
+$$;
+
+-- Segunda fase, con las rutas que se borraron del storage: elimina las filas que siguen sin referencias y
+-- libera el borrado de las que se volvieron a adquirir (quedan no listas: el próximo acquire las sube).
+create or replace function public.finish_reap_media_blobs(p_storage_paths text[])
+returns void
+language plpgsql
+volatile
+security invoker
+as $$
+begin
+    delete from public.media_blobs b
+    where b.storage_path = any(p_storage_paths)
+      and b.ref_count = 0
+      and b.reaping_until is not null;
+
+    update public.media_blobs b
+    set reaping_until = null,
+        updated_at = now()
+    where b.storage_path = any(p_storage_paths)
+      and b.reaping_until is not null;
+end;
+$$;